@@ -0,0 +1,39 @@
+"""
+Deferred imports for heavy dependencies.
+
+The web process mostly hands work to the analysis workers, so modules it
+imports at startup reference pandas, NumPy and the AI SDK through
+lazy_module() and only load them when a code path actually uses them.
+Modules doing so add `from __future__ import annotations`, so annotations
+such as pd.DataFrame do not trigger the import when functions are defined.
+"""
+import importlib
+import logging
+import types
+
+
+class _LazyModule(types.ModuleType):
+    """Stands in for a module until one of its attributes is first read."""
+    def __getattr__(self, attr):
+        # Only reached for attributes not copied over yet. The import system
+        # serializes concurrent first imports, so this is thread-safe.
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_module(name: str) -> types.ModuleType:
+    """
+    A module object for `name` that imports it on first attribute access.
+    After that, lookups read the real module's attributes directly.
+    """
+    return _LazyModule(name)
+
+
+def preload(names):
+    """Imports the named modules now, e.g. from a warm-up thread. Never raises."""
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logging.warning(f"Preloading {name} failed: {e}")
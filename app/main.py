@@ -2,12 +2,17 @@ from fastapi import FastAPI, Request, Depends
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import upload, analysis, ai, settings, files
-from app.database import engine, Base
+from app.routers import upload, analysis, ai, settings, files, jobs, metrics
+from app.database import engine, Base, run_migrations
+from app.services.worker_pool import worker_pool
+from app.services.ai_client import close_clients
+from app.services.charts import ChartFiles, CHART_DIR
+from app.services.metrics import server_timing
+from app.services.profile_store import reset_pending_profiles
+from app.services.file_service import backfill_content_hashes
+from app.services.warm_up import WARM_UP_ON_STARTUP, schedule_warm_up
 import os
-
-# Create Tables
-Base.metadata.create_all(bind=engine)
+import threading
 
 app = FastAPI(title="AI Data Explorer", description="Self-hosted AI-powered Data Exploration Tool")
 
@@ -18,14 +23,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Per-stage timings as Server-Timing headers, plus the data behind /metrics
+app.middleware("http")(server_timing)
+
 # Static and Templates
 os.makedirs("static/css", exist_ok=True)
 os.makedirs("static/js", exist_ok=True)
 os.makedirs("templates", exist_ok=True)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/charts", ChartFiles(directory=CHART_DIR), name="charts")
 templates = Jinja2Templates(directory="templates")
 
 # Include Routers
@@ -34,6 +44,31 @@ app.include_router(analysis.router, prefix="/api", tags=["Analysis"])
 app.include_router(ai.router, prefix="/api", tags=["AI"])
 app.include_router(settings.router, prefix="/api", tags=["Settings"])
 app.include_router(files.router, prefix="/api", tags=["Files"])
+app.include_router(jobs.router, prefix="/api", tags=["Jobs"])
+app.include_router(metrics.router, tags=["Metrics"])
+
+# Create Tables on startup rather than on import, which stays cheap for tooling
+@app.on_event("startup")
+def create_tables():
+    Base.metadata.create_all(bind=engine)
+    run_migrations()
+    # Profile jobs run in memory; none of those marked pending survived a restart
+    reset_pending_profiles()
+    # Sessions from before content hashes were stored; hashing large files would hold up startup
+    threading.Thread(target=backfill_content_hashes, name="hash-backfill", daemon=True).start()
+
+@app.on_event("startup")
+async def start_warm_up():
+    if WARM_UP_ON_STARTUP:
+        schedule_warm_up()
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    worker_pool.shutdown()
+
+@app.on_event("shutdown")
+async def shutdown_ai_clients():
+    await close_clients()
 
 @app.get("/")
 async def index(request: Request):
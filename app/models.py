@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, BigInteger, Boolean, String, DateTime, Text, Index
 from datetime import datetime
 from app.database import Base
 
@@ -7,11 +7,54 @@ class FileRecord(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String, unique=True, index=True)
-    session_name = Column(String)
+    session_name = Column(String, index=True)
     filename = Column(String)
     filepath = Column(String)
-    upload_time = Column(DateTime, default=datetime.utcnow)
+    upload_time = Column(DateTime, default=datetime.utcnow, index=True)
     file_type = Column(String)
+    content_hash = Column(String, index=True) # sha256 of the stored bytes
+    size_bytes = Column(BigInteger)
+    row_count = Column(Integer) # Filled in once the file has been parsed
+    column_count = Column(Integer)
+    details_checked = Column(Boolean) # Size and shape filled in, or being filled in; tried once
+    # Workbooks: the selected sheet, and the workbook's own hash once content_hash is that sheet's
+    sheet_name = Column(String)
+    sheet_index = Column(Integer)
+    source_hash = Column(String)
+
+    # Keyset pagination walks (upload_time, id) newest first
+    __table_args__ = (Index("ix_files_upload_time_id", "upload_time", "id"),)
+
+    @property
+    def data_path(self) -> str:
+        """The file analysis reads: filepath, or the selected sheet's columnar copy (see excel.sheet_path)."""
+        if not self.sheet_index:
+            return self.filepath
+        from app.services.excel import sheet_path
+        return sheet_path(self.filepath, self.sheet_index)
+
+class ProfileRecord(Base):
+    __tablename__ = "profiles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String, unique=True, index=True)
+    status = Column(String, default="pending") # pending, ready, failed
+    version = Column(Integer) # PROFILE_VERSION the result was computed with
+    result = Column(Text) # JSON payload of /stats
+    error = Column(String)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class AIInsightRecord(Base):
+    __tablename__ = "ai_insights"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String, unique=True, index=True) # sha256 of (model, prompt)
+    model = Column(String)
+    response = Column(Text)
+    size_bytes = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+    hits = Column(Integer, default=0)
 
 class AppSetting(Base):
     __tablename__ = "settings"
@@ -1,26 +1,146 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.services.key_manager import KeyManager
-from app.schemas.models import AIRequest, AIResponse
+from app.schemas.models import AIRequest, AIResponse, AIBatchRequest, AIBatchResponse
 from app.services.ai_service import AIService
+from app.services.ai_cache import AICache
+from app.services.ai_client import AIServiceError
+from app.services.profile_store import ProfileStore
+from app.services import charts
+from app.routers.analysis import analysis_tasks, get_file_record_or_404, run_analysis
+import asyncio
+import json
 
 router = APIRouter()
 
-@router.post("/ai/summarize", response_model=AIResponse)
-async def generate_summary(request: AIRequest, db: Session = Depends(get_db)):
-    api_key = request.api_key
-    
+# Titles the dashboard uses for each chart type in visualization prompts
+CHART_TYPE_NAMES = {"hist": "Histogram", "bar": "Bar Chart", "heatmap": "Heatmap"}
+
+def resolve_api_key(api_key: str, provider: str, db: Session) -> str:
     # Fallback to stored key if not provided
     if not api_key:
         manager = KeyManager(db)
-        api_key = manager.get_decrypted_key(request.provider)
-        
+        api_key = manager.get_decrypted_key(provider)
+
     if not api_key:
         raise HTTPException(status_code=400, detail="API Key is required within request or stored settings.")
-    
-    service = AIService(api_key=api_key)
-    # Using the new method name generate_insight
-    summary = service.generate_insight(request.context_data, request.prompt_type)
-    
+    return api_key
+
+@router.post("/ai/summarize", response_model=AIResponse)
+async def generate_summary(request: AIRequest, db: Session = Depends(get_db)):
+    api_key = resolve_api_key(request.api_key, request.provider, db)
+
+    service = AIService(api_key=api_key, cache=AICache())
+    try:
+        summary = await service.generate_insight(request.context_data, request.prompt_type, request.sample)
+    except AIServiceError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
     return {"summary": summary}
+
+def sse_event(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@router.post("/ai/summarize/stream")
+async def stream_summary(request: AIRequest, db: Session = Depends(get_db)):
+    """
+    /ai/summarize as server-sent events: "data" events carry {"text": chunk}
+    as the model writes, then a "done" event, or an "error" event with
+    {"status", "detail"} if the call fails part way.
+    """
+    api_key = resolve_api_key(request.api_key, request.provider, db)
+    service = AIService(api_key=api_key, cache=AICache())
+
+    async def events():
+        try:
+            async for chunk in service.stream_insight(request.context_data, request.prompt_type, request.sample):
+                yield sse_event({"text": chunk})
+        except AIServiceError as e:
+            yield sse_event({"status": e.status_code, "detail": e.detail}, event="error")
+            return
+        yield sse_event({}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Proxies must pass chunks through as they come
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def load_session_profile(session_id: str, db: Session) -> dict:
+    """The session's exact profile, computed inline if it is not stored yet."""
+    content_hash = (await get_file_record_or_404(session_id, db)).content_hash
+    store = ProfileStore(db)
+    if store.get_status(content_hash)["status"] == "ready":
+        return store.load_result(content_hash)
+    result = await run_analysis(session_id, db, analysis_tasks.run_stats_json)
+    store.save_result(content_hash, result)
+    return json.loads(result)
+
+def build_insight_contexts(profile: dict, specs: list, prompt_types: list) -> dict:
+    """
+    Context for each requested prompt, shaped like the ones the dashboard
+    sends: name -> (prompt_type, context_data). Visualization prompts are
+    made per planned chart and named "visualization:<chart name>".
+    """
+    description = profile.get("description", {})
+    missing = profile.get("missing_values", {})
+    contexts = {}
+    for prompt_type in prompt_types:
+        if prompt_type == "overview":
+            contexts["overview"] = ("overview", {
+                "columns": list(description),
+                "missing_values": missing,
+                "description": description,
+            })
+        elif prompt_type == "stats":
+            contexts["stats"] = ("stats", description)
+        elif prompt_type == "missing":
+            contexts["missing"] = ("missing", missing)
+        elif prompt_type == "visualization":
+            for spec in specs:
+                if spec["type"] == "heatmap":
+                    column, stats = "all numeric columns", profile.get("correlations", {})
+                else:
+                    column = spec["columns"][0]
+                    stats = description.get(column, {})
+                contexts[f"visualization:{spec['name']}"] = ("visualization", {
+                    "column": column,
+                    "type": CHART_TYPE_NAMES.get(spec["type"], "Chart"),
+                    "stats": stats,
+                })
+        else:
+            raise HTTPException(status_code=400, detail=f"Unknown prompt type: {prompt_type}")
+    return contexts
+
+@router.post("/ai/{session_id}/insights", response_model=AIBatchResponse)
+async def generate_insights(session_id: str, request: AIBatchRequest, db: Session = Depends(get_db)):
+    """Runs every requested insight for a session concurrently from its stored profile."""
+    api_key = resolve_api_key(request.api_key, request.provider, db)
+    profile = await load_session_profile(session_id, db)
+
+    specs = []
+    if "visualization" in request.prompt_types:
+        key = (await get_file_record_or_404(session_id, db)).content_hash
+        specs = charts.load_plan(key) or await run_analysis(session_id, db, analysis_tasks.run_chart_plan)
+    contexts = build_insight_contexts(profile, specs, request.prompt_types)
+
+    service = AIService(api_key=api_key, cache=AICache())
+    results = await asyncio.gather(
+        *(service.generate_insight(context, prompt_type) for prompt_type, context in contexts.values()),
+        return_exceptions=True
+    )
+
+    # One failed insight does not fail the others
+    insights, errors = {}, {}
+    for name, result in zip(contexts, results):
+        if isinstance(result, AIServiceError):
+            errors[name] = result.detail
+        elif isinstance(result, Exception):
+            raise result
+        else:
+            insights[name] = result
+    return {"insights": insights, "errors": errors}
@@ -1,58 +1,371 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.services.file_service import FileService
-from app.services.dataset import Dataset
-from app.services.profiler import Profiler
+from app.services.profile_store import ProfileStore, compute_profile
+from app.services.worker_pool import worker_pool
+from app.services.columnar import has_columnar_copy, convert_to_columnar
+from app.services import charts, correlation, excel, metrics, query, result_cache, row_index, sampling
+from app.utils_json import FastJSONResponse, RawJSON, join_json_object
+from app.schemas.models import ColumnBatchRequest, QueryRequest
+from app.lazy import lazy_module
+import asyncio
 import os
+import time
+
+# Worker-side code (pandas and the profilers), imported here with the first analysis request
+analysis_tasks = lazy_module("app.services.analysis_tasks")
 
 router = APIRouter()
 
-def get_analysis_context(session_id: str, db: Session):
+# Largest page /rows will return
+MAX_PAGE_ROWS = 1000
+# Most columns one /columns batch may ask for
+MAX_BATCH_COLUMNS = 100
+
+async def get_file_record_or_404(session_id: str, db: Session):
     file_service = FileService(db)
-    record = file_service.get_file_record(session_id)
-    if not record:
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    try:
+    with metrics.span("lookup"):
+        record = file_service.get_file_record(session_id)
+        if not record:
+            raise HTTPException(status_code=404, detail="Session not found")
+
         # Check if file exists on disk
         if not os.path.exists(record.filepath):
             raise HTTPException(status_code=404, detail=f"File missing from storage: {record.filepath}")
 
-        # Load file
-        with open(record.filepath, "rb") as f:
-            content = f.read()
-        
-        dataset = Dataset(content, record.filename)
-        profiler = Profiler(dataset.get_dataframe())
-        
-        return dataset, profiler
-    except HTTPException:
-        raise
+    # Derived data (parsed datasets, profiles, charts) is keyed by content hash. Records
+    # from before it was stored are hashed at startup; until then, off the event loop
+    if not record.content_hash:
+        await run_in_threadpool(file_service.ensure_content_hash, record)
+    return record
+
+def schedule_columnar_copy(background_tasks: BackgroundTasks, record):
+    """Writes the session's columnar copy in the background unless a fresh one exists."""
+    if has_columnar_copy(record.data_path):
+        return
+    if record.sheet_index:
+        background_tasks.add_task(
+            worker_pool.run_sync, f"{record.source_hash}:sheet:{record.sheet_index}", excel.convert_sheet,
+            record.filepath, record.filename, record.sheet_index, record.sheet_name
+        )
+    else:
+        background_tasks.add_task(
+            worker_pool.run_sync, record.content_hash, convert_to_columnar, record.filepath, record.filename
+        )
+
+def get_sample_options(
+    sample_method: str = "reservoir",
+    sample_size: int = None,
+    target_error: float = None,
+    stratify_by: str = None,
+    seed: int = 0
+) -> dict:
+    """Query parameters of the sampled (?sample=true) preview mode."""
+    try:
+        return sampling.normalize_options(sample_method, sample_size, target_error, stratify_by, seed)
+    except sampling.SamplingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def run_analysis(session_id: str, db: Session, task, *args, route: str = None):
+    """
+    Runs an analysis task for the session's file on the worker pool. Tasks are
+    routed by content hash unless route names another queue.
+    """
+    record = await get_file_record_or_404(session_id, db)
+    key = record.content_hash
+
+    try:
+        return await worker_pool.run(route or key, task, key, record.data_path, record.filename, *args)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Analysis timed out")
+    except sampling.SamplingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc() # Print to server console
         raise HTTPException(status_code=500, detail=f"Analysis Error: {str(e)}")
 
+# Declared before the /analysis/{session_id}/... routes so "cache" is not taken as a session id
+@router.get("/analysis/cache/stats")
+async def get_cache_stats():
+    return worker_pool.cache_stats()
+
 @router.get("/analysis/{session_id}/overview")
 async def get_overview(session_id: str, db: Session = Depends(get_db)):
-    dataset, _ = get_analysis_context(session_id, db)
-    return {
-        "info": dataset.get_info(),
-        "head": dataset.get_head(),
-        "shape": dataset.get_shape()
-    }
+    return FastJSONResponse(await run_analysis(session_id, db, analysis_tasks.run_overview))
 
 @router.get("/analysis/{session_id}/stats")
-async def get_stats(session_id: str, db: Session = Depends(get_db)):
-    _, profiler = get_analysis_context(session_id, db)
-    return {
-        "description": profiler.get_description(),
-        "missing_values": profiler.get_missing_values(),
-        "correlations": profiler.get_correlations()
-    }
+async def get_stats(
+    session_id: str,
+    background_tasks: BackgroundTasks,
+    mode: str = "exact",
+    sample: bool = False,
+    sample_options: dict = Depends(get_sample_options),
+    db: Session = Depends(get_db)
+):
+    if sample:
+        return await get_sampled_stats(session_id, background_tasks, sample_options, db)
+    if mode == "streaming":
+        # Out-of-core profile for files that do not fit in memory
+        return FastJSONResponse(await run_analysis(session_id, db, analysis_tasks.run_streaming_stats))
+    if mode != "exact":
+        raise HTTPException(status_code=400, detail=f"Unknown stats mode: {mode}")
+
+    # Serve the precomputed profile when there is one
+    content_hash = (await get_file_record_or_404(session_id, db)).content_hash
+    store = ProfileStore(db)
+    status = store.get_status(content_hash)["status"]
+    metrics.count_cache("profile", status == "ready")
+    if status == "ready":
+        # Stored as JSON text already, send it without decoding
+        return FastJSONResponse(store.load_result_json(content_hash))
+    if status == "pending":
+        return JSONResponse(status_code=202, content={"status": "pending"})
+
+    # Missing (older sessions) or failed: compute inline and store it
+    result = await run_analysis(session_id, db, analysis_tasks.run_stats_json)
+    store.save_result(content_hash, result)
+    return FastJSONResponse(result)
+
+async def get_sampled_stats(session_id: str, background_tasks: BackgroundTasks, options: dict, db: Session):
+    """
+    Fast approximate stats from a sample. Once the exact profile is ready it is
+    served instead; until then its computation is started in the background.
+    """
+    content_hash = (await get_file_record_or_404(session_id, db)).content_hash
+    store = ProfileStore(db)
+    status = store.get_status(content_hash)["status"]
+    if status == "ready":
+        return FastJSONResponse(store.load_result_json(content_hash))
+    if status != "pending":
+        background_tasks.add_task(compute_profile, session_id)
+
+    # Own queue, so the preview does not wait behind the exact profile of the same file
+    result = await run_analysis(
+        session_id, db, analysis_tasks.run_sampled_stats, options, route=f"{content_hash}:sample"
+    )
+    return FastJSONResponse(result)
+
+@router.get("/analysis/{session_id}/profile")
+async def get_profile_status(session_id: str, db: Session = Depends(get_db)):
+    content_hash = (await get_file_record_or_404(session_id, db)).content_hash
+    return ProfileStore(db).get_status(content_hash)
+
+@router.post("/analysis/{session_id}/profile")
+async def recompute_profile(session_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    await get_file_record_or_404(session_id, db)
+    background_tasks.add_task(compute_profile, session_id, True)
+    return {"status": "pending"}
 
 @router.get("/analysis/{session_id}/visualizations")
-async def get_visualizations(session_id: str, db: Session = Depends(get_db)):
-    _, profiler = get_analysis_context(session_id, db)
-    return profiler.generate_visualizations()
+async def get_visualizations(
+    session_id: str,
+    sample: bool = False,
+    sample_options: dict = Depends(get_sample_options),
+    db: Session = Depends(get_db)
+):
+    record = await get_file_record_or_404(session_id, db)
+    if sample:
+        # Charts from a sample are cheap enough to draw in one task
+        return await run_analysis(
+            session_id, db, analysis_tasks.run_sampled_visualizations, sample_options,
+            route=f"{record.content_hash}:sample"
+        )
+
+    key = record.content_hash
+    specs = metrics.cache_lookup("chart_plan", charts.load_plan(key))
+    if specs is None:
+        specs = await run_analysis(session_id, db, analysis_tasks.run_chart_plan)
+
+    # Render charts missing from the cache in parallel, one task per chart
+    missing = [spec for spec in specs if not os.path.exists(charts.chart_path(key, spec))]
+    for spec in specs:
+        metrics.count_cache("chart", spec not in missing)
+    try:
+        await asyncio.gather(*(
+            worker_pool.run(
+                f"{key}:{spec['name']}", analysis_tasks.run_render_chart,
+                key, record.data_path, record.filename, spec
+            )
+            for spec in missing
+        ))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Analysis timed out")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis Error: {str(e)}")
+
+    return {spec["name"]: charts.chart_url(key, spec) for spec in specs}
+
+@router.get("/analysis/{session_id}/chart-data")
+async def get_chart_data(session_id: str, db: Session = Depends(get_db)):
+    """
+    The numbers behind each planned chart (bins, KDE, box, top categories,
+    correlation cells) for the browser to draw, instead of rendered PNGs.
+    """
+    key = (await get_file_record_or_404(session_id, db)).content_hash
+    cached = result_cache.load_result(key, "chart_data", analysis_tasks.CHART_DATA_PARAMS)
+    if cached is None:
+        cached = await run_analysis(session_id, db, analysis_tasks.run_chart_data)
+    return FastJSONResponse(cached)
+
+@router.get("/analysis/{session_id}/rows")
+async def get_rows(
+    session_id: str,
+    background_tasks: BackgroundTasks,
+    offset: int = 0,
+    limit: int = 100,
+    columns: str = None,
+    db: Session = Depends(get_db)
+):
+    if offset < 0 or not 0 < limit <= MAX_PAGE_ROWS:
+        raise HTTPException(status_code=400, detail=f"offset must be >= 0 and limit between 1 and {MAX_PAGE_ROWS}")
+    record = await get_file_record_or_404(session_id, db)
+    key = record.content_hash
+    column_list = [c for c in columns.split(",") if c] if columns else None
+    args = (key, record.data_path, record.filename, offset, limit, column_list)
+
+    try:
+        if row_index.has_row_index(record.filepath):
+            # Seek + small parse, cheap enough to skip the worker queue
+            page = await run_in_threadpool(analysis_tasks.run_rows, *args)
+        else:
+            page = await worker_pool.run(key, analysis_tasks.run_rows, *args)
+            if row_index.supports_row_index(record.filename):
+                # Uploaded before the index existed: build it for next time
+                background_tasks.add_task(worker_pool.run_sync, key, row_index.build_row_index, record.filepath)
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid columns: {str(e)}")
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Analysis timed out")
+    return FastJSONResponse(page)
+
+@router.get("/analysis/{session_id}/correlations")
+async def get_correlations(
+    session_id: str,
+    method: str = "pearson",
+    top_k: int = correlation.DEFAULT_TOP_K,
+    threshold: float = None,
+    categorical: bool = True,
+    db: Session = Depends(get_db)
+):
+    """
+    Strongest correlated pairs instead of the full matrix. top_k=0 returns
+    every pair with |r| >= threshold (up to correlation.MAX_PAIRS).
+    """
+    if method not in correlation.METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(correlation.METHODS)}")
+    if top_k < 0 or (threshold is not None and not 0 <= threshold <= 1) or (not top_k and threshold is None):
+        raise HTTPException(status_code=400, detail="top_k must be >= 0, threshold between 0 and 1, and one of them set")
+
+    key = (await get_file_record_or_404(session_id, db)).content_hash
+    params = analysis_tasks.correlation_params(method, top_k, threshold, categorical)
+    cached = result_cache.load_result(key, "correlations", params)
+    if cached is None:
+        cached = await run_analysis(
+            session_id, db, analysis_tasks.run_correlations, method, top_k, threshold, categorical
+        )
+    return FastJSONResponse(cached)
+
+async def get_column_profiles(session_id: str, names: list, background_tasks: BackgroundTasks, db: Session) -> dict:
+    """
+    {name: profile JSON bytes}. Cached profiles are read directly; the rest
+    are split across the workers so columns are computed in parallel.
+    """
+    record = await get_file_record_or_404(session_id, db)
+    key = record.content_hash
+    results = {}
+    for name in names:
+        cached = analysis_tasks.load_column_profile(key, name)
+        if cached is not None:
+            results[name] = cached
+    missing = [name for name in names if name not in results]
+    if not missing:
+        return results
+
+    chunk_count = min(len(missing), max(1, worker_pool.max_workers))
+    try:
+        computed = await asyncio.gather(*(
+            worker_pool.run(
+                f"{key}:columns:{i}", analysis_tasks.run_column_profiles,
+                key, record.data_path, record.filename, missing[i::chunk_count]
+            )
+            for i in range(chunk_count)
+        ))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Analysis timed out")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis Error: {str(e)}")
+    for part in computed:
+        results.update(part)
+
+    # Without it every column read parses the raw file; make it for next time
+    schedule_columnar_copy(background_tasks, record)
+    return results
+
+@router.get("/analysis/{session_id}/columns/{name}")
+async def get_column(session_id: str, name: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Stats, histogram data, top values and missingness of one column."""
+    profiles = await get_column_profiles(session_id, [name], background_tasks, db)
+    return FastJSONResponse(profiles[name])
+
+@router.post("/analysis/{session_id}/columns")
+async def get_columns(
+    session_id: str,
+    request: ColumnBatchRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """Column profiles for several columns at once, as {"columns": {name: profile}}."""
+    names = list(dict.fromkeys(request.columns))
+    if not 0 < len(names) <= MAX_BATCH_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Request between 1 and {MAX_BATCH_COLUMNS} columns")
+    profiles = await get_column_profiles(session_id, names, background_tasks, db)
+    columns = join_json_object({name: RawJSON(profiles[name].decode("utf-8")) for name in names})
+    return FastJSONResponse(b'{"columns":' + columns + b"}")
+
+@router.post("/analysis/{session_id}/query")
+async def run_query(
+    session_id: str,
+    request: QueryRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """
+    Filters, then a projection or group-by aggregates, ordered and limited,
+    e.g. mean revenue by region where year = 2025:
+    {"filters": [{"column": "year", "op": "eq", "value": 2025}],
+     "group_by": ["region"], "aggregates": [{"fn": "mean", "column": "revenue"}]}
+
+    A query running past QUERY_TIMEOUT gets a 504. The worker stops it at the
+    next stage (filter, group, sort), so it does not hold up that file's queue.
+    """
+    try:
+        spec = query.normalize_query(request.model_dump())
+    except query.QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    record = await get_file_record_or_404(session_id, db)
+    key = record.content_hash
+    cached = result_cache.load_result(key, "query", analysis_tasks.query_params(spec))
+    if cached is not None:
+        return FastJSONResponse(cached)
+    try:
+        payload = await worker_pool.run(
+            key, analysis_tasks.run_query, key, record.data_path, record.filename, spec,
+            time.time() + query.QUERY_TIMEOUT, timeout=query.QUERY_TIMEOUT
+        )
+    except query.QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (asyncio.TimeoutError, query.QueryTimeout):
+        raise HTTPException(status_code=504, detail=f"Query took longer than {query.QUERY_TIMEOUT:g}s")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query Error: {str(e)}")
+
+    # Later queries read only their columns from it
+    schedule_columnar_copy(background_tasks, record)
+    return FastJSONResponse(payload)
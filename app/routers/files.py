@@ -1,17 +1,121 @@
-from fastapi import APIRouter, Depends
+import asyncio
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.services.file_service import FileService
+from app.routers.analysis import get_file_record_or_404
+from app.schemas.models import SheetRequest
+from app.services import excel
+from app.services.file_service import FileService, InvalidCursorError, record_file_details
+from app.services.profile_store import compute_profile
+from app.services.worker_pool import worker_pool
 
 router = APIRouter()
 
+MAX_PAGE_FILES = 200
+
 @router.get("/files/list")
-async def list_files(db: Session = Depends(get_db)):
+async def list_files(
+    background_tasks: BackgroundTasks,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_FILES),
+    cursor: Optional[str] = None,
+    name: Optional[str] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Newest sessions first, one page at a time. Pass next_cursor back as
+    cursor for the following page; it is null on the last one.
+    """
     service = FileService(db)
-    files = service.get_all_files()
-    return [{
-        "session_id": f.session_id,
-        "name": f.session_name,
-        "filename": f.filename,
-        "date": f.upload_time.isoformat()
-    } for f in files]
+    try:
+        files, next_cursor = service.list_files(limit, cursor, name, uploaded_after, uploaded_before)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Sessions from before these were stored get them filled in for next time, once
+    for f in files:
+        if (f.row_count is None or f.size_bytes is None) and not f.details_checked:
+            background_tasks.add_task(record_file_details, f.session_id, True)
+
+    return {
+        "files": [{
+            "session_id": f.session_id,
+            "name": f.session_name,
+            "filename": f.filename,
+            "date": f.upload_time.isoformat(),
+            "size_bytes": f.size_bytes,
+            "rows": f.row_count,
+            "columns": f.column_count,
+        } for f in files],
+        "next_cursor": next_cursor,
+    }
+
+
+def _workbook_sheets(record) -> tuple:
+    """(workbook path, sheet names) of a workbook session; 400 for other files."""
+    if not excel.is_excel(record.filename):
+        raise HTTPException(status_code=400, detail="Only Excel workbooks have sheets")
+    workbook = record.filepath
+    manifest = excel.read_manifest(workbook)
+    if manifest is not None:
+        return workbook, manifest
+    try:
+        names = excel.list_sheets(workbook)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read workbook: {str(e)}")
+    return workbook, [{"index": i, "name": name, "rows": None, "columns": None} for i, name in enumerate(names)]
+
+
+@router.get("/files/{session_id}/sheets")
+async def list_sheets(session_id: str, db: Session = Depends(get_db)):
+    """
+    The workbook's sheets with their shapes (null until the background
+    conversion finished) and the one this session analyses.
+    """
+    record = await get_file_record_or_404(session_id, db)
+    _, sheets = await run_in_threadpool(_workbook_sheets, record)
+    return {"sheets": sheets, "selected": record.sheet_name or sheets[0]["name"]}
+
+
+@router.put("/files/{session_id}/sheet")
+async def select_sheet(
+    session_id: str,
+    request: SheetRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """
+    Switches the session to another sheet of its workbook. Converts the sheet
+    first if needed; every analysis endpoint then works on that sheet.
+    """
+    record = await get_file_record_or_404(session_id, db)
+    workbook, sheets = await run_in_threadpool(_workbook_sheets, record)
+    sheet = next((s for s in sheets if s["name"] == request.sheet), None)
+    if sheet is None:
+        raise HTTPException(status_code=404, detail=f"Sheet not found: {request.sheet}")
+
+    source_hash = record.source_hash or record.content_hash
+    try:
+        entry = await worker_pool.run(
+            f"{source_hash}:sheet:{sheet['index']}", excel.convert_sheet,
+            workbook, record.filename, sheet["index"], sheet["name"]
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Sheet conversion timed out")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Sheet conversion failed: {str(e)}")
+
+    FileService(db).select_sheet(record, entry["index"], entry["name"], entry["rows"], entry["columns"])
+    background_tasks.add_task(compute_profile, session_id)
+    return {
+        "session_id": session_id,
+        "sheet": entry["name"],
+        "rows": entry["rows"],
+        "columns": entry["columns"],
+    }
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.schemas.models import JobRequest
+from app.routers.analysis import analysis_tasks, get_file_record_or_404
+from app.services.worker_pool import job_manager
+
+router = APIRouter()
+
+@router.post("/analysis/{session_id}/jobs")
+async def submit_job(session_id: str, request: JobRequest, db: Session = Depends(get_db)):
+    task = analysis_tasks.TASKS.get(request.kind)
+    if task is None:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind: {request.kind}")
+
+    record = await get_file_record_or_404(session_id, db)
+    return job_manager.submit(
+        session_id, record.content_hash, request.kind, task,
+        record.content_hash, record.data_path, record.filename,
+        timeout=request.timeout
+    )
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Withdraws a queued job. A running one cannot be stopped: it reports
+    "cancel_requested" and turns "cancelled" when its task returns.
+    """
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
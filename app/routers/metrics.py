@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from app.services import metrics
+from app.services.worker_pool import worker_pool
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint (text exposition format)."""
+    stats = worker_pool.cache_stats()
+    extra = metrics.gauge("analysis_queue_depth", "Worker tasks submitted and not finished.", {(): worker_pool.queue_depth})
+    extra += metrics.gauge(
+        "dataset_cache_lookups_total", "Parsed-dataset cache lookups in the workers, by result.",
+        {("hit",): stats["hits"], ("miss",): stats["misses"]}, ("result",), kind="counter"
+    )
+    extra += metrics.gauge("dataset_cache_hit_ratio", "Share of parsed-dataset lookups that hit.", {(): stats["hit_ratio"]})
+    extra += metrics.gauge("dataset_cache_bytes", "Memory held by the workers' parsed datasets.", {(): stats["bytes"]})
+    extra += metrics.gauge(
+        "dataset_cache_evictions_total", "Parsed datasets evicted by the workers.", {(): stats["evictions"]}, kind="counter"
+    )
+    return Response(metrics.render(extra), media_type="text/plain; version=0.0.4; charset=utf-8")
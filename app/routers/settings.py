@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.services.key_manager import KeyManager
@@ -14,7 +15,8 @@ class KeyPayload(BaseModel):
 async def save_api_key(payload: KeyPayload, db: Session = Depends(get_db)):
     manager = KeyManager(db)
     try:
-        manager.save_key(payload.provider, payload.key)
+        # Validation makes a blocking Gemini request
+        await run_in_threadpool(manager.save_key, payload.provider, payload.key)
         return {"message": "API Key saved and validated successfully"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
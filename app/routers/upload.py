@@ -1,12 +1,19 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.services.file_service import FileService
+from app.services.file_service import FileService, UploadTooLargeError, record_file_details
+from app.services import excel
+from app.services.columnar import convert_to_columnar
+from app.services.profile_store import compute_profile
+from app.services.row_index import build_row_index, supports_row_index
+from app.services.worker_pool import worker_pool
 
 router = APIRouter()
 
 @router.post("/upload")
 async def upload_file(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     session_name: str = Form(...),
     db: Session = Depends(get_db)
@@ -16,12 +23,30 @@ async def upload_file(
     
     try:
         service = FileService(db)
-        session_id = service.save_file(file, session_name)
-        
+        # Copying and hashing a large file would block the event loop
+        session_id = await run_in_threadpool(service.save_file, file, session_name)
+        record = service.get_file_record(session_id)
+
+        # Build the row index and columnar copy, record the file's shape, then warm the profile,
+        # after the response has been sent. All are no-ops when the same content was uploaded before.
+        if supports_row_index(record.filename):
+            background_tasks.add_task(worker_pool.run_sync, record.content_hash, build_row_index, record.filepath)
+        if excel.is_excel(record.filename):
+            # Every sheet gets its own copy, so switching sheets later is instant
+            background_tasks.add_task(excel.convert_workbook, record.content_hash, record.filepath, record.filename)
+        else:
+            background_tasks.add_task(
+                worker_pool.run_sync, record.content_hash, convert_to_columnar, record.filepath, record.filename
+            )
+        background_tasks.add_task(record_file_details, session_id)
+        background_tasks.add_task(compute_profile, session_id)
+
         return {
             "session_id": session_id,
             "filename": file.filename,
             "message": "File uploaded successfully"
         }
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -19,6 +19,48 @@ class AIRequest(BaseModel):
     provider: str = "gemini"
     prompt_type: str = "overview"  # overview, stats, missing, visualization
     context_data: Dict[str, Any]
+    sample: Optional[Dict[str, Any]] = None # Set when context_data was computed from a sample
 
 class AIResponse(BaseModel):
     summary: str
+
+class AIBatchRequest(BaseModel):
+    api_key: Optional[str] = None
+    provider: str = "gemini"
+    prompt_types: List[str] = ["overview", "stats", "missing", "visualization"]
+
+class AIBatchResponse(BaseModel):
+    insights: Dict[str, str] # e.g. "stats" or "visualization:hist_price" -> summary
+    errors: Dict[str, str] # same keys, for insights that failed
+
+class JobRequest(BaseModel):
+    kind: str # overview, stats, streaming_stats, visualizations
+    timeout: Optional[float] = None # seconds
+
+class ColumnBatchRequest(BaseModel):
+    columns: List[str] # column names to profile
+
+class QueryFilter(BaseModel):
+    column: str
+    op: str = "eq" # eq, ne, lt, le, gt, ge (or ==, !=, <, ...), in, not_in, between, is_null, not_null, contains
+    value: Any = None
+
+class QueryAggregate(BaseModel):
+    fn: str # count, size (rows per group), sum, mean, median, min, max, std, nunique
+    column: Optional[str] = None
+    name: Optional[str] = None # result column, default "<fn>_<column>"
+
+class QueryOrder(BaseModel):
+    column: str # a result column
+    desc: bool = False
+
+class QueryRequest(BaseModel):
+    select: Optional[List[str]] = None # columns of a plain (not aggregated) query, default all
+    filters: List[QueryFilter] = [] # ANDed together
+    group_by: List[str] = []
+    aggregates: List[QueryAggregate] = [] # one row overall, or one per group
+    order_by: List[QueryOrder] = []
+    limit: Optional[int] = None
+
+class SheetRequest(BaseModel):
+    sheet: str # worksheet name, as listed by /files/{session_id}/sheets
@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from app.database import SessionLocal
+from app.models import AIInsightRecord
+
+# How long a cached AI response is served
+AI_CACHE_TTL = timedelta(hours=float(os.getenv("AI_CACHE_TTL_HOURS", "24")))
+# Total size of cached responses before the least recently used are evicted
+AI_CACHE_MAX_BYTES = int(float(os.getenv("AI_CACHE_MAX_MB", "50")) * 1024 * 1024)
+
+
+def prompt_cache_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class AICache:
+    """
+    AI responses stored in SQLite by hash of (model, prompt). Entries expire
+    after AI_CACHE_TTL, and the least recently used ones are evicted once
+    their total size passes AI_CACHE_MAX_BYTES.
+
+    Each call opens its own short session, so one cache can serve several
+    concurrent calls (e.g. a batch of insights) from worker threads.
+    """
+    def __init__(self, session_factory=SessionLocal, ttl: timedelta = AI_CACHE_TTL,
+                 max_bytes: int = AI_CACHE_MAX_BYTES):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def get(self, key: str):
+        """Returns the cached response text, or None."""
+        with self.session_factory() as db:
+            record = db.query(AIInsightRecord).filter(AIInsightRecord.cache_key == key).first()
+            if record is None:
+                return None
+            now = datetime.utcnow()
+            if now - record.created_at > self.ttl:
+                db.delete(record)
+                db.commit()
+                return None
+            record.last_used_at = now
+            record.hits = (record.hits or 0) + 1
+            response = record.response
+            db.commit()
+            return response
+
+    def put(self, key: str, model: str, response: str):
+        now = datetime.utcnow()
+        with self.session_factory() as db:
+            record = db.query(AIInsightRecord).filter(AIInsightRecord.cache_key == key).first()
+            if record is None:
+                record = AIInsightRecord(cache_key=key, hits=0)
+                db.add(record)
+            record.model = model
+            record.response = response
+            record.size_bytes = len(response.encode("utf-8"))
+            record.created_at = now
+            record.last_used_at = now
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another process stored the same response first
+                db.rollback()
+                return
+            self._evict(db)
+
+    def _evict(self, db):
+        """Drops expired entries, then least recently used ones until under the size budget."""
+        query = db.query(AIInsightRecord)
+        query.filter(AIInsightRecord.created_at < datetime.utcnow() - self.ttl).delete()
+        total = db.query(func.coalesce(func.sum(AIInsightRecord.size_bytes), 0)).scalar()
+        if total > self.max_bytes:
+            evicted = []
+            rows = db.query(AIInsightRecord.id, AIInsightRecord.size_bytes).order_by(AIInsightRecord.last_used_at)
+            for record_id, size in rows:
+                if total <= self.max_bytes:
+                    break
+                evicted.append(record_id)
+                total -= size or 0
+            query.filter(AIInsightRecord.id.in_(evicted)).delete(synchronize_session=False)
+        db.commit()
+
+
+class _Broadcast:
+    """One streamed call's chunks, kept for every reader from the first one on."""
+    def __init__(self):
+        self.chunks = []
+        self.error = None
+        self.done = False
+        self._changed = asyncio.Event()
+
+    async def pump(self, source):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def replay(self):
+        """The chunks so far, then the rest as they arrive; re-raises the call's error."""
+        i = 0
+        while True:
+            if i < len(self.chunks):
+                yield self.chunks[i]
+                i += 1
+            elif self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one: the first caller
+    starts the coroutine, the others await the same task and share its
+    result (or error). A caller giving up does not cancel the shared call.
+    stream() does the same for async generators.
+    """
+    def __init__(self):
+        self._calls = {}  # key -> Task of the call in flight
+        self._streams = {}  # key -> _Broadcast of the stream in flight
+
+    async def do(self, key: str, fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    async def stream(self, key: str, fn):
+        """
+        Yields the chunks of fn(), an async generator, started once per key:
+        callers joining late get the chunks already produced first. The
+        stream is read to the end even if every caller disconnects.
+        """
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = self._streams[key] = _Broadcast()
+            task = asyncio.ensure_future(flight.pump(fn()))
+            task.add_done_callback(lambda _: self._streams.pop(key, None))
+        async for chunk in flight.replay():
+            yield chunk
+
+    def _finish(self, key: str, task):
+        self._calls.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # Retrieved, in case every waiter gave up
+
+
+# Upstream AI calls in flight in this process
+ai_requests = SingleFlight()
@@ -0,0 +1,148 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import random
+import weakref
+from collections import OrderedDict
+import httpx
+from app.lazy import lazy_module
+
+# The SDK takes longer to import than the rest of the app; load it with the first call
+genai = lazy_module("google.genai")
+
+# Upstream model calls allowed at once in this process
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+# Seconds one model call may take
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "60"))
+# Extra attempts after a transient failure
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "3"))
+AI_BACKOFF_BASE = 0.5
+AI_BACKOFF_MAX = 8.0
+# Distinct API keys keeping a client (and its connection pool) alive
+MAX_CLIENTS = 16
+
+
+class AIServiceError(Exception):
+    """A model call that failed for good; status_code is the HTTP status to answer with."""
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+_clients = OrderedDict()  # api_key -> genai.Client
+_semaphores = weakref.WeakKeyDictionary()  # event loop -> Semaphore bounding calls on it
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+    return semaphore
+
+
+def get_client(api_key: str = None) -> genai.Client:
+    """
+    Long-lived client per API key, so HTTP connections are reused across
+    requests. The least recently used client is dropped past MAX_CLIENTS.
+    """
+    client = _clients.get(api_key)
+    if client is None:
+        # Without a key the SDK falls back to its env var
+        client = genai.Client(api_key=api_key) if api_key else genai.Client()
+        _clients[api_key] = client
+        while len(_clients) > MAX_CLIENTS:
+            _, old = _clients.popitem(last=False)
+            asyncio.ensure_future(_close(old))
+    _clients.move_to_end(api_key)
+    return client
+
+
+async def _close(client):
+    try:
+        await client.aio.aclose()
+    except Exception as e:
+        logging.warning(f"Closing AI client failed: {e}")
+
+
+async def close_clients():
+    """Closes every pooled client; called on shutdown."""
+    while _clients:
+        _, client = _clients.popitem()
+        await _close(client)
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError, ConnectionError)):
+        return True
+    if isinstance(error, genai.errors.ServerError):
+        return True
+    return isinstance(error, genai.errors.ClientError) and error.code in (408, 429)
+
+
+def _to_service_error(error: Exception) -> AIServiceError:
+    if isinstance(error, asyncio.TimeoutError):
+        return AIServiceError(504, "AI provider timed out")
+    if isinstance(error, genai.errors.ClientError):
+        if error.code == 429:
+            return AIServiceError(429, "AI provider rate limit reached, try again later")
+        return AIServiceError(400, f"AI provider rejected the request: {error.message or error}")
+    return AIServiceError(502, f"AI provider error: {error}")
+
+
+async def generate_content(client, model: str, prompt: str, timeout: float = AI_TIMEOUT,
+                           retries: int = AI_MAX_RETRIES) -> str:
+    """
+    One model call through client.aio, bounded by the process-wide semaphore
+    and a per-attempt timeout. Transient failures (timeouts, network errors,
+    5xx, 408/429) are retried with full-jitter exponential backoff; the final
+    failure is raised as AIServiceError.
+    """
+    for attempt in range(retries + 1):
+        try:
+            async with _get_semaphore():
+                response = await asyncio.wait_for(
+                    client.aio.models.generate_content(model=model, contents=prompt), timeout
+                )
+            return response.text
+        except Exception as e:
+            if not _is_transient(e) or attempt == retries:
+                raise _to_service_error(e) from e
+            delay = random.uniform(0, min(AI_BACKOFF_MAX, AI_BACKOFF_BASE * 2 ** attempt))
+            logging.warning(f"AI call failed ({e!r}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def stream_content(client, model: str, prompt: str, timeout: float = AI_TIMEOUT,
+                         retries: int = AI_MAX_RETRIES):
+    """
+    Streaming variant of generate_content: yields the response text in
+    chunks as the model produces them. timeout bounds the wait for each
+    chunk rather than the whole answer. Transient failures are retried only
+    until the first chunk has been yielded; after that they end the stream
+    with AIServiceError.
+    """
+    for attempt in range(retries + 1):
+        started = False
+        try:
+            async with _get_semaphore():
+                stream = await asyncio.wait_for(
+                    client.aio.models.generate_content_stream(model=model, contents=prompt), timeout
+                )
+                iterator = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+                    except StopAsyncIteration:
+                        return
+                    if chunk.text:
+                        started = True
+                        yield chunk.text
+        except Exception as e:
+            if started or not _is_transient(e) or attempt == retries:
+                raise _to_service_error(e) from e
+            delay = random.uniform(0, min(AI_BACKOFF_MAX, AI_BACKOFF_BASE * 2 ** attempt))
+            logging.warning(f"AI stream failed ({e!r}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
@@ -1,45 +1,95 @@
-from google import genai
-from google.genai import types
 import os
-import json
+import logging
+from fastapi.concurrency import run_in_threadpool
+from app.services import metrics
+from app.services.ai_cache import AICache, ai_requests, prompt_cache_key
+from app.services.ai_client import get_client, generate_content, stream_content
+from app.services.prompt_context import build_context
+
+MODEL_NAME = "gemini-2.5-flash"
 
 class AIService:
     """
     Service to generate AI summaries using Google's new GenAI SDK (v2+).
     Uses 'gemini-2.5-flash' as requested.
+
+    Calls go through the shared async client for the API key (see
+    ai_client). client may be any object with the SDK's async
+    aio.models.generate_content(model=, contents=) call (and
+    generate_content_stream for streaming), e.g. the stub in
+    benchmarks/ai_cache.py. With a cache, identical prompts are answered
+    from it and concurrent ones share a single call.
     """
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, client=None, cache: AICache = None):
         self.api_key = api_key
-        # Initialize client with API key if provided, else it might look for env var
-        if self.api_key:
-            self.client = genai.Client(api_key=self.api_key)
-        else:
-            # Fallback to env var if available, though logic usually passes it in
-            self.client = genai.Client()
+        self.cache = cache
+        self.client = client if client is not None else get_client(api_key)
 
-    def generate_insight(self, context_data: dict, prompt_type: str = "overview") -> str:
+    async def generate_insight(self, context_data: dict, prompt_type: str = "overview", sample: dict = None) -> str:
         """
         Generates insights based on the provided context and prompt type.
         prompt_type can be: 'overview', 'stats', 'missing', 'visualization'
+        sample describes the sample the context was computed from, if any.
+        Raises AIServiceError when the model call fails after retries.
         """
-        try:
-            prompt = self._construct_prompt(context_data, prompt_type)
-            
-            # Using the requested model
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
-            )
-            return response.text
-        except Exception as e:
-            return f"Error generating AI insight: {str(e)}"
-
-    def _construct_prompt(self, data: dict, prompt_type: str) -> str:
+        prompt = self._construct_prompt(context_data, prompt_type, sample)
+        return await self._generate(prompt)
+
+    async def stream_insight(self, context_data: dict, prompt_type: str = "overview", sample: dict = None):
+        """
+        Like generate_insight, but yields the answer in chunks as the model
+        writes it. A cached answer is yielded whole; a streamed one is cached
+        once it is complete. Concurrent identical prompts share one stream.
+        """
+        prompt = self._construct_prompt(context_data, prompt_type, sample)
+        key = prompt_cache_key(MODEL_NAME, prompt)
+        if self.cache is not None:
+            cached = metrics.cache_lookup("ai", await run_in_threadpool(self.cache.get, key))
+            if cached is not None:
+                yield cached
+                return
+
+        async for chunk in ai_requests.stream(key, lambda: self._stream_model(key, prompt)):
+            yield chunk
+
+    async def _generate(self, prompt: str) -> str:
+        """Answers from the cache, else makes (or joins) the upstream call."""
+        key = prompt_cache_key(MODEL_NAME, prompt)
+        if self.cache is not None:
+            cached = metrics.cache_lookup("ai", await run_in_threadpool(self.cache.get, key))
+            if cached is not None:
+                return cached
+        return await ai_requests.do(key, lambda: self._call_model(key, prompt))
+
+    async def _call_model(self, key: str, prompt: str) -> str:
+        # Using the requested model
+        with metrics.span("ai"):
+            text = await generate_content(self.client, MODEL_NAME, prompt)
+        await self._store(key, text)
+        return text
+
+    async def _stream_model(self, key: str, prompt: str):
+        chunks = []
+        with metrics.span("ai"):
+            async for chunk in stream_content(self.client, MODEL_NAME, prompt):
+                chunks.append(chunk)
+                yield chunk
+        await self._store(key, "".join(chunks))
+
+    async def _store(self, key: str, text: str):
+        if self.cache is not None and text:
+            try:
+                await run_in_threadpool(self.cache.put, key, MODEL_NAME, text)
+            except Exception as e:
+                # The answer is still good, it just is not cached
+                logging.warning(f"Caching AI response failed: {e}")
+
+    def _construct_prompt(self, data: dict, prompt_type: str, sample: dict = None) -> str:
         """Constructs a specific prompt based on the type of analysis requested."""
         
         base_instruction = """
         You are an expert Data Analyst AI. Your goal is to explain data clearly to a user.
-        Analyze the provided data JSON and respond in Markdown.
+        Analyze the provided data and respond in Markdown.
         Structure your response with these sections:
         - **What does this data mean?**: Brief explanation of the metrics or chart.
         - **Key Observations**: What stands out? (Trends, outliers, high/low values).
@@ -48,25 +98,22 @@ class AIService:
         Keep it concise, professional, yet easy to understand.
         """
 
+        context = build_context(data, prompt_type)
+
         if prompt_type == "overview":
-            columns = data.get('columns', [])
-            missing = data.get('missing_values', {})
-            description = str(data.get('description', {}))[:1500] 
             content = f"""
             Task: Provide a high-level summary of the entire dataset.
             
-            Dataset Context:
-            - Columns: {columns}
-            - Missing Values Summary: {missing}
-            - Statistical Snapshot: {description}
+            Dataset Context (one line per column, most informative first):
+            {context}
             """
             
         elif prompt_type == "stats":
             content = f"""
             Task: Analyze the descriptive statistics table.
             
-            Statistics Data:
-            {json.dumps(data, indent=2)}
+            Statistics Data (one line per column, most informative first):
+            {context}
             
             Focus on distribution, central tendencies (mean/median), and spread.
             """
@@ -76,7 +123,7 @@ class AIService:
             Task: Analyze the missing values profile.
             
             Missing Values Data:
-            {json.dumps(data, indent=2)}
+            {context}
             
             Evaluate the severity of missing data and suggest imputation or handling strategies.
             """
@@ -85,18 +132,24 @@ class AIService:
             # For viz, we might get column stats + chart type info
             col_name = data.get('column', 'Unknown')
             chart_type = data.get('type', 'Chart')
-            stats = data.get('stats', {})
             
             content = f"""
             Task: Analyze a {chart_type} for the column '{col_name}'.
             
             Underlying Statistics for this column:
-            {json.dumps(stats, indent=2)}
+            {context}
             
             Explain what a {chart_type} of this data shows regarding distribution or relationship.
             """
             
         else:
-            content = f"Task: Analyze the following data: {str(data)[:2000]}"
+            content = f"Task: Analyze the following data: {context}"
+
+        if sample:
+            content += f"""
+            Note: These statistics were estimated from a {sample.get('method', 'random')} sample of
+            {sample.get('size')} out of {sample.get('population_rows')} rows. Treat them as approximate
+            and say so where it matters.
+            """
 
         return f"{base_instruction}\n\n{content}"
@@ -0,0 +1,300 @@
+"""
+CPU-bound analysis entry points executed inside worker processes.
+
+Every function here is a top-level callable taking only picklable arguments,
+so it can be shipped to the process pool. Each worker process keeps its own
+dataset cache. The key argument identifies the stored content (its content
+hash), so sessions that share a blob share parsed datasets and charts.
+"""
+import os
+from app.services.dataset import Dataset
+from app.services.dataset_cache import dataset_cache
+from app.services.profiler import Profiler
+from app.services.streaming_profiler import StreamingProfiler
+from app.services.columnar import has_columnar_copy, columnar_path
+from app.services import chart_data, charts, column_profile, correlation, metrics, query, result_cache, row_index, sampling
+from app.utils_json import frame_to_records, dumps_json
+
+
+def load_dataset(key: str, filepath: str, filename: str) -> Dataset:
+    return dataset_cache.get(
+        key, filepath,
+        lambda: Dataset.from_file(filepath, filename)
+    )
+
+
+def run_overview(key: str, filepath: str, filename: str) -> dict:
+    dataset = load_dataset(key, filepath, filename)
+    return {
+        "info": dataset.get_info(),
+        "head": dataset.get_head(),
+        "shape": dataset.get_shape()
+    }
+
+
+def run_shape(key: str, filepath: str, filename: str) -> tuple:
+    """(rows, columns), from the columnar copy's metadata when there is one."""
+    if has_columnar_copy(filepath):
+        import pyarrow.feather as feather
+        table = feather.read_table(columnar_path(filepath), memory_map=True)
+        return table.num_rows, table.num_columns
+    return load_dataset(key, filepath, filename).get_shape()
+
+
+def column_names(key: str, filepath: str, filename: str) -> list:
+    """The file's column names, read without parsing its rows where possible."""
+    dataset = dataset_cache.peek(key, filepath)
+    if dataset is not None:
+        return [str(c) for c in dataset.get_columns()]
+    if has_columnar_copy(filepath):
+        import pyarrow as pa
+        with pa.memory_map(columnar_path(filepath)) as source:
+            return pa.ipc.open_file(source).schema.names
+    if row_index.supports_row_index(filename):
+        import pandas as pd
+        sep = '\t' if filename.lower().endswith('.tsv') else ','
+        return [str(c) for c in pd.read_csv(filepath, sep=sep, nrows=0).columns]
+    return [str(c) for c in load_dataset(key, filepath, filename).get_columns()]
+
+
+COLUMN_PROFILE_PARAMS = {"version": column_profile.COLUMN_PROFILE_VERSION}
+
+
+def load_column_profile(key: str, name: str):
+    """A column's cached profile as JSON bytes, or None."""
+    return result_cache.load_result(key, "column", {**COLUMN_PROFILE_PARAMS, "name": name})
+
+
+def run_column_profiles(key: str, filepath: str, filename: str, names: list) -> dict:
+    """
+    Profiles of the named columns as {name: JSON bytes}. Reads only those
+    columns (from the worker's parsed dataset, the columnar copy, or the raw
+    file) and caches each profile on its own. Raises KeyError for unknown names.
+    """
+    unknown = set(names) - set(column_names(key, filepath, filename))
+    if unknown:
+        raise KeyError(f"Unknown columns: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for name in names:
+        cached = load_column_profile(key, name)
+        if cached is not None:
+            results[name] = cached
+    missing = [name for name in names if name not in results]
+    if not missing:
+        return results
+
+    dataset = dataset_cache.peek(key, filepath)
+    if dataset is not None:
+        df = dataset.get_dataframe()
+        df = df.set_axis([str(c) for c in df.columns], axis=1)[missing]
+    else:
+        df = Dataset.from_file(filepath, filename, columns=missing).get_dataframe()
+    for name in missing:
+        with metrics.span("column_profile"):
+            payload = dumps_json(column_profile.profile_column(df[name]))
+        result_cache.save_result(key, "column", {**COLUMN_PROFILE_PARAMS, "name": name}, payload)
+        results[name] = payload
+    return results
+
+
+def run_stats(key: str, filepath: str, filename: str) -> dict:
+    dataset = load_dataset(key, filepath, filename)
+    return Profiler(dataset.get_dataframe()).get_profile()
+
+
+def run_stats_json(key: str, filepath: str, filename: str) -> bytes:
+    """run_stats encoded to JSON bytes in the worker."""
+    dataset = load_dataset(key, filepath, filename)
+    return Profiler(dataset.get_dataframe()).get_profile_json()
+
+
+def run_streaming_stats(key: str, filepath: str, filename: str) -> dict:
+    return StreamingProfiler(filepath, filename).profile()
+
+
+def load_sample(key: str, filepath: str, filename: str, options: dict) -> sampling.Sample:
+    """
+    Draws (or reuses) the sample described by options. Samples from this
+    worker's parsed dataset when it has one, else streams the file in chunks.
+    """
+    def draw():
+        dataset = dataset_cache.peek(key, filepath)
+        if dataset is not None:
+            chunks = [dataset.get_dataframe()]
+        else:
+            chunks = StreamingProfiler(filepath, filename).iter_chunks()
+        return sampling.draw_sample(chunks, options)
+
+    sample_key = f"{key}:sample:{sorted(options.items())}"
+    return dataset_cache.get(sample_key, filepath, draw)
+
+
+def run_sampled_stats(key: str, filepath: str, filename: str, options: dict) -> bytes:
+    """Profile of a sample, with confidence intervals, as JSON bytes."""
+    sample = load_sample(key, filepath, filename, options)
+    return Profiler(sample.df, sample=sample.meta).get_profile_json()
+
+
+def run_sampled_visualizations(key: str, filepath: str, filename: str, options: dict) -> dict:
+    """Plans and renders charts from a sample; returns name -> URL."""
+    specs = charts.load_plan(key, options)
+    profiler = None
+    if specs is None:
+        sample = load_sample(key, filepath, filename, options)
+        profiler = Profiler(sample.df, sample=sample.meta)
+        specs = profiler.plan_visualizations()
+        charts.save_plan(key, specs, options)
+    for spec in specs:
+        path = charts.chart_path(key, spec)
+        if os.path.exists(path):
+            continue
+        if profiler is None:
+            sample = load_sample(key, filepath, filename, options)
+            profiler = Profiler(sample.df, sample=sample.meta)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        profiler.render_visualization(spec, path)
+    return {spec["name"]: charts.chart_url(key, spec) for spec in specs}
+
+
+def correlation_params(method: str, top_k: int, threshold: float, include_categorical: bool) -> dict:
+    """Everything a cached correlation report depends on besides the content."""
+    return {
+        "version": correlation.CORRELATION_VERSION,
+        "method": method,
+        "top_k": top_k,
+        "threshold": threshold,
+        "categorical": include_categorical,
+    }
+
+
+def run_correlations(key: str, filepath: str, filename: str, method: str, top_k: int,
+                     threshold: float, include_categorical: bool) -> bytes:
+    """Strongest pairs and categorical associations, as JSON bytes cached on disk."""
+    params = correlation_params(method, top_k, threshold, include_categorical)
+    cached = result_cache.load_result(key, "correlations", params)
+    if cached is not None:
+        return cached
+    df = load_dataset(key, filepath, filename).get_dataframe()
+    with metrics.span("correlations"):
+        payload = dumps_json(correlation.correlation_report(df, method, top_k, threshold, include_categorical))
+    result_cache.save_result(key, "correlations", params, payload)
+    return payload
+
+
+def run_chart_plan(key: str, filepath: str, filename: str) -> list:
+    dataset = load_dataset(key, filepath, filename)
+    specs = Profiler(dataset.get_dataframe()).plan_visualizations()
+    charts.save_plan(key, specs)
+    return specs
+
+
+CHART_DATA_PARAMS = {"version": chart_data.CHART_DATA_VERSION, "charts": charts.CHART_PARAMS}
+
+
+def run_chart_data(key: str, filepath: str, filename: str) -> bytes:
+    """Drawing data of every planned chart as {name: data} JSON bytes, cached on disk."""
+    cached = result_cache.load_result(key, "chart_data", CHART_DATA_PARAMS)
+    if cached is not None:
+        return cached
+    specs = charts.load_plan(key) or run_chart_plan(key, filepath, filename)
+    df = load_dataset(key, filepath, filename).get_dataframe()
+    with metrics.span("chart_data"):
+        payload = dumps_json({spec["name"]: chart_data.chart_data(df, spec) for spec in specs})
+    result_cache.save_result(key, "chart_data", CHART_DATA_PARAMS, payload)
+    return payload
+
+
+def run_render_chart(key: str, filepath: str, filename: str, spec: dict) -> str:
+    """Renders one chart into the chart cache unless it is already there."""
+    path = charts.chart_path(key, spec)
+    if os.path.exists(path):
+        return path
+    # Reuse this worker's parsed dataset if it has one, else read only the needed columns
+    dataset = dataset_cache.peek(key, filepath)
+    if dataset is None:
+        dataset = Dataset.from_file(filepath, filename, columns=spec["columns"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Profiler(dataset.get_dataframe()).render_visualization(spec, path)
+    return path
+
+
+def run_visualizations(key: str, filepath: str, filename: str) -> dict:
+    """Plans and renders every chart in this worker; returns name -> URL."""
+    specs = charts.load_plan(key) or run_chart_plan(key, filepath, filename)
+    for spec in specs:
+        run_render_chart(key, filepath, filename, spec)
+    return {spec["name"]: charts.chart_url(key, spec) for spec in specs}
+
+
+def query_params(spec: dict) -> dict:
+    """Cache parameters of a normalized query."""
+    return {"version": query.QUERY_VERSION, **spec}
+
+
+def run_query(key: str, filepath: str, filename: str, spec: dict, deadline: float = None) -> bytes:
+    """
+    Result of a normalized query as JSON bytes, cached on disk. Reads only the
+    referenced columns from the columnar copy unless this worker already has
+    the parsed dataset; without a copy the whole file is parsed once and kept.
+    Raises query.QueryTimeout between stages once deadline has passed.
+    """
+    params = query_params(spec)
+    cached = result_cache.load_result(key, "query", params)
+    if cached is not None:
+        return cached
+    columns = query.referenced_columns(spec)
+    unknown = set(columns or []) - set(column_names(key, filepath, filename))
+    if unknown:
+        raise query.QueryError(f"Unknown columns: {', '.join(sorted(unknown))}")
+
+    dataset = dataset_cache.peek(key, filepath)
+    if dataset is None and not has_columnar_copy(filepath):
+        dataset = load_dataset(key, filepath, filename)
+    if dataset is not None:
+        df = dataset.get_dataframe()
+        df = df.set_axis([str(c) for c in df.columns], axis=1)
+        if columns is not None:
+            df = df[columns]
+    else:
+        df = Dataset.from_file(filepath, filename, columns=columns).get_dataframe()
+    with metrics.span("query"):
+        payload = dumps_json(query.run_query(df, spec, deadline))
+    result_cache.save_result(key, "query", params, payload)
+    return payload
+
+
+def run_rows(key: str, filepath: str, filename: str, offset: int, limit: int, columns: list = None) -> dict:
+    """
+    One page of rows. Uses the byte-offset index for CSV/TSV, else slices the
+    columnar copy, else the parsed dataset (Excel before conversion finished).
+    """
+    if row_index.has_row_index(filepath):
+        df, total_rows = row_index.read_rows(filepath, filename, offset, limit, columns)
+    elif has_columnar_copy(filepath):
+        import pyarrow.feather as feather
+        table = feather.read_table(columnar_path(filepath), columns=columns, memory_map=True)
+        total_rows = table.num_rows
+        df = table.slice(offset, limit).to_pandas()
+    else:
+        df = load_dataset(key, filepath, filename).get_dataframe()
+        total_rows = len(df)
+        df = df.iloc[offset:offset + limit]
+        if columns:
+            df = df[columns]
+    return {
+        "offset": offset,
+        "limit": limit,
+        "total_rows": total_rows,
+        "columns": [str(c) for c in df.columns],
+        "rows": frame_to_records(df),
+    }
+
+
+# Job kinds accepted by the job API
+TASKS = {
+    "overview": run_overview,
+    "stats": run_stats,
+    "streaming_stats": run_streaming_stats,
+    "visualizations": run_visualizations,
+}
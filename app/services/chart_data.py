@@ -0,0 +1,117 @@
+"""
+Numbers behind the dashboard charts, for the browser to draw: histogram
+bins, a KDE curve, box-plot quantiles, top category counts and correlation
+cells. A chart is a few KB of JSON and needs no plotting library here.
+"""
+import numpy as np
+import pandas as pd
+from app.utils_json import series_to_list
+
+# Bump when the payload changes, so cached chart data is recomputed
+CHART_DATA_VERSION = 1
+
+MAX_BINS = 100
+KDE_GRID_SIZE = 128
+TOP_CATEGORIES = 10
+
+
+def _compact(values, digits: int = 6) -> list:
+    """Floats rounded to a few significant digits, to keep the JSON small."""
+    return [float(f"{v:.{digits}g}") for v in np.asarray(values, dtype=np.float64)]
+
+
+def bin_count(values: np.ndarray) -> int:
+    """numpy's "auto" rule (the larger of Sturges and Freedman-Diaconis), capped at MAX_BINS."""
+    n = len(values)
+    sturges = int(np.ceil(np.log2(n))) + 1 if n > 1 else 1
+    q1, q3 = np.percentile(values, [25, 75])
+    width = 2 * (q3 - q1) * n ** (-1 / 3)
+    span = values.max() - values.min()
+    fd = int(np.ceil(span / width)) if width > 0 else sturges
+    return max(1, min(max(sturges, fd), MAX_BINS))
+
+
+def histogram(values: np.ndarray) -> dict:
+    counts, edges = np.histogram(values, bins=bin_count(values))
+    return {"edges": _compact(edges, 8), "counts": counts.tolist()}
+
+
+def kde(values: np.ndarray, grid_size: int = KDE_GRID_SIZE) -> dict:
+    """
+    Gaussian KDE on an even grid, by linear binning onto the grid and an FFT
+    convolution with the kernel: O(n + g log g) instead of O(n g). Bandwidth
+    by Scott's rule, as seaborn uses. None for constant data.
+    """
+    n = len(values)
+    std = values.std(ddof=1) if n > 1 else 0.0
+    if not std > 0:
+        return None
+    bandwidth = std * n ** (-1 / 5)
+    low, high = values.min() - 3 * bandwidth, values.max() + 3 * bandwidth
+    delta = (high - low) / (grid_size - 1)
+
+    # Each value split between its two neighbouring grid points
+    position = (values - low) / delta
+    left = np.clip(np.floor(position).astype(np.int64), 0, grid_size - 2)
+    weight = position - left
+    counts = np.bincount(left, weights=1 - weight, minlength=grid_size)
+    counts += np.bincount(left + 1, weights=weight, minlength=grid_size)
+
+    reach = min(grid_size - 1, int(np.ceil(4 * bandwidth / delta)))
+    offsets = np.arange(-reach, reach + 1) * delta
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    size = grid_size + len(kernel) - 1
+    density = np.fft.irfft(np.fft.rfft(counts, size) * np.fft.rfft(kernel, size), size)
+    density = np.clip(density[reach:reach + grid_size], 0, None) / n
+
+    grid = low + delta * np.arange(grid_size)
+    return {"x": _compact(grid), "density": _compact(density, 4), "bandwidth": float(bandwidth)}
+
+
+def box(values: np.ndarray) -> dict:
+    """Quartiles, Tukey whiskers (1.5 IQR) and how many points lie beyond them."""
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    reach = 1.5 * (q3 - q1)
+    inside = values[(values >= q1 - reach) & (values <= q3 + reach)]
+    return {
+        "min": float(values.min()),
+        "q1": float(q1),
+        "median": float(median),
+        "q3": float(q3),
+        "max": float(values.max()),
+        "mean": float(values.mean()),
+        "whisker_low": float(inside.min()),
+        "whisker_high": float(inside.max()),
+        "outliers": int(len(values) - len(inside)),
+    }
+
+
+def top_categories(series: pd.Series, limit: int = TOP_CATEGORIES) -> dict:
+    counts = series.value_counts()
+    top = counts.head(limit)
+    return {
+        "labels": [str(label) for label in series_to_list(pd.Series(top.index))],
+        "counts": top.to_numpy().tolist(),
+        "other": int(counts.iloc[limit:].sum()),
+        "missing": int(series.isna().sum()),
+    }
+
+
+def chart_data(df: pd.DataFrame, spec: dict) -> dict:
+    """Drawing data for one planned chart (see Profiler.plan_visualizations)."""
+    if spec["type"] == "hist":
+        col = spec["columns"][0]
+        values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        values = values[np.isfinite(values)]
+        data = {"type": "hist", "column": col, "count": len(values)}
+        if len(values):
+            data.update(histogram=histogram(values), kde=kde(values), box=box(values))
+        return data
+    if spec["type"] == "heatmap":
+        corr = df[spec["columns"]].corr()
+        matrix = [[None if np.isnan(r) else round(float(r), 3) for r in row] for row in corr.to_numpy()]
+        return {"type": "heatmap", "columns": [str(c) for c in corr.columns], "matrix": matrix}
+    if spec["type"] == "bar":
+        col = spec["columns"][0]
+        return {"type": "bar", "column": col, **top_categories(df[col])}
+    raise ValueError(f"Unknown chart type: {spec['type']}")
@@ -0,0 +1,67 @@
+import os
+import json
+import hashlib
+from fastapi.staticfiles import StaticFiles
+from app.services.file_service import STORAGE_DIR
+
+# Rendered chart images, one directory per stored content (content hash)
+CHART_DIR = os.path.join(STORAGE_DIR, "charts")
+os.makedirs(CHART_DIR, exist_ok=True)
+
+# Everything that changes the rendered pixels; bump version when the drawing code changes
+CHART_PARAMS = {"version": 3, "format": "png", "max_histograms": 5, "top_categories": 10}
+
+# Chart files are immutable for a given name, so browsers may keep them forever
+CHART_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _params_digest(*parts) -> str:
+    payload = json.dumps([CHART_PARAMS, *parts], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def chart_filename(key: str, spec: dict) -> str:
+    """Cache file name derived from (content, chart type, columns, sample, parameters)."""
+    parts = [key, spec['type'], spec['columns']]
+    if spec.get("sample"):
+        parts.append(spec["sample"])
+    return f"{spec['type']}-{_params_digest(*parts)}.png"
+
+
+def chart_path(key: str, spec: dict) -> str:
+    return os.path.join(CHART_DIR, key, chart_filename(key, spec))
+
+
+def chart_url(key: str, spec: dict) -> str:
+    return f"/charts/{key}/{chart_filename(key, spec)}"
+
+
+def _plan_path(key: str, sample: dict = None) -> str:
+    digest = _params_digest(key, sample) if sample else _params_digest(key)
+    return os.path.join(CHART_DIR, key, f"plan-{digest}.json")
+
+
+def load_plan(key: str, sample: dict = None):
+    """Returns the cached chart plan for the content (or a sample of it), or None."""
+    try:
+        with open(_plan_path(key, sample)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_plan(key: str, specs: list, sample: dict = None):
+    path = _plan_path(key, sample)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(specs, f)
+    os.replace(tmp_path, path)
+
+
+class ChartFiles(StaticFiles):
+    """Static files for rendered charts with long-lived caching headers (ETag comes from StaticFiles)."""
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = CHART_CACHE_CONTROL
+        return response
@@ -0,0 +1,104 @@
+"""
+Profile of a single column: summary statistics, histogram data, top values
+and missingness. Each column is profiled (and cached) on its own, so a wide
+dataset can be explored one field at a time.
+"""
+import numpy as np
+import pandas as pd
+from app.utils_json import clean_for_json, series_to_list
+
+# Bump when the payload changes, so cached column profiles are recomputed
+COLUMN_PROFILE_VERSION = 1
+
+HISTOGRAM_BINS = 30
+TOP_VALUES = 10
+# Numeric columns with at most this many distinct values also get top values
+LOW_CARDINALITY = 20
+
+
+def column_kind(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series):
+        return "boolean"
+    if pd.api.types.is_numeric_dtype(series):
+        return "numeric"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime"
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return "categorical"
+    return "text"
+
+
+def _histogram(values: np.ndarray, bins: int) -> dict:
+    counts, edges = np.histogram(values, bins=bins)
+    return {"edges": edges.tolist(), "counts": counts.tolist()}
+
+
+def numeric_summary(values: pd.Series) -> dict:
+    """values: the column without missing entries."""
+    numbers = values.to_numpy(dtype=np.float64)
+    numbers = numbers[np.isfinite(numbers)]
+    if len(numbers) == 0:
+        return {"stats": {}, "histogram": None}
+    q1, median, q3 = np.percentile(numbers, [25, 50, 75])
+    stats = {
+        "mean": numbers.mean(),
+        "std": numbers.std(ddof=1) if len(numbers) > 1 else None,
+        "min": numbers.min(),
+        "25%": q1,
+        "50%": median,
+        "75%": q3,
+        "max": numbers.max(),
+        "skew": values.skew() if len(numbers) > 2 else None,
+        "zeros": int((numbers == 0).sum()),
+    }
+    return {"stats": stats, "histogram": _histogram(numbers, HISTOGRAM_BINS)}
+
+
+def datetime_summary(values: pd.Series) -> dict:
+    """values: the column without missing entries; histogram edges are ISO timestamps."""
+    if values.empty:
+        return {"stats": {}, "histogram": None}
+    if values.dt.tz is not None:
+        values = values.dt.tz_convert(None)
+    ticks = values.to_numpy(dtype="datetime64[ns]").view("int64")
+    counts, edges = np.histogram(ticks, bins=HISTOGRAM_BINS)
+    edges = pd.to_datetime(edges.astype("int64"))
+    return {
+        "stats": {"min": values.min(), "max": values.max(), "50%": values.quantile(0.5)},
+        "histogram": {"edges": series_to_list(pd.Series(edges)), "counts": counts.tolist()},
+    }
+
+
+def top_values(values: pd.Series, limit: int = TOP_VALUES) -> list[dict]:
+    counts = values.value_counts().head(limit)
+    labels = series_to_list(pd.Series(counts.index, dtype=values.dtype))
+    return [{"value": label, "count": int(count)} for label, count in zip(labels, counts.to_numpy())]
+
+
+def profile_column(series: pd.Series) -> dict:
+    """Everything /analysis/{id}/columns/{name} returns for one column."""
+    rows = len(series)
+    values = series.dropna()
+    missing = rows - len(values)
+    kind = column_kind(series)
+    unique = int(values.nunique())
+
+    profile = {
+        "name": str(series.name),
+        "dtype": str(series.dtype),
+        "kind": kind,
+        "rows": rows,
+        "count": len(values),
+        "missing": {"count": missing, "percentage": 100 * missing / rows if rows else 0.0},
+        "unique": unique,
+        "stats": {},
+        "histogram": None,
+        "top_values": None,
+    }
+    if kind == "numeric":
+        profile.update(numeric_summary(values))
+    elif kind == "datetime":
+        profile.update(datetime_summary(values))
+    if kind != "numeric" or unique <= LOW_CARDINALITY:
+        profile["top_values"] = top_values(values)
+    return clean_for_json(profile)
@@ -0,0 +1,93 @@
+from __future__ import annotations
+import os
+import json
+import logging
+from app.lazy import lazy_module
+from app.services.schema import DOWNCAST_FLOATS
+
+pd = lazy_module("pandas")
+
+# Typed columnar copies (Arrow IPC / Feather) live next to the raw upload
+COLUMNAR_EXT = ".feather"
+# Bump when the typing applied at load changes, so older copies are ignored
+COLUMNAR_VERSION = 2
+
+
+def columnar_path(filepath: str) -> str:
+    """
+    Returns the path of the columnar copy for a stored raw file. A columnar
+    file (e.g. a workbook sheet's copy, see excel.sheet_path) is its own copy.
+    """
+    if filepath.endswith(COLUMNAR_EXT):
+        return filepath
+    # Copies typed with float32 are kept apart from full-precision ones
+    variant = "f32" if DOWNCAST_FLOATS else ""
+    return f"{os.path.splitext(filepath)[0]}.v{COLUMNAR_VERSION}{variant}{COLUMNAR_EXT}"
+
+
+def has_columnar_copy(filepath: str) -> bool:
+    """True if a columnar copy exists and is not older than the raw file."""
+    path = columnar_path(filepath)
+    if not os.path.exists(path) or not os.path.exists(filepath):
+        return False
+    return os.path.getmtime(path) >= os.path.getmtime(filepath)
+
+
+def _memory_report_path(filepath: str) -> str:
+    return os.path.splitext(columnar_path(filepath))[0] + ".memory.json"
+
+
+def read_memory_report(filepath: str):
+    """The memory report saved with the columnar copy, or None."""
+    try:
+        with open(_memory_report_path(filepath)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_columnar(filepath: str, columns: list = None) -> pd.DataFrame:
+    """
+    Opens the columnar copy memory-mapped, reading only the requested columns.
+    """
+    import pyarrow.feather as feather
+    # pd.read_feather has no memory_map option; go through pyarrow for it
+    table = feather.read_table(columnar_path(filepath), columns=columns, memory_map=True)
+    return table.to_pandas()
+
+
+def write_columnar(df: pd.DataFrame, filepath: str, memory: dict = None):
+    """Writes df as the columnar copy of filepath, atomically, with its memory report if given."""
+    if memory is not None:
+        # Written first: the copy counts as present once the .feather file exists
+        with open(_memory_report_path(filepath), "w") as f:
+            json.dump(memory, f)
+    path = columnar_path(filepath)
+    tmp_path = f"{path}.tmp"
+    # Feather needs string column names and a default index
+    df = df.reset_index(drop=True)
+    df.columns = [str(c) for c in df.columns]
+    try:
+        df.to_feather(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def convert_to_columnar(filepath: str, filename: str):
+    """
+    Parses the raw upload once and stores a typed columnar copy next to it.
+    Meant to run as a background task after the upload has returned; on failure
+    the raw file simply stays the only copy and analysis falls back to it.
+    """
+    from app.services.dataset import Dataset
+
+    if has_columnar_copy(filepath):
+        return # Shared blob that was converted for an earlier session
+    try:
+        # From the path, so a large CSV/TSV is parsed range by range (see csv_parallel)
+        dataset = Dataset.from_file(filepath, filename)
+        write_columnar(dataset.get_dataframe(), filepath, dataset.get_memory_report())
+    except Exception as e:
+        logging.warning(f"Columnar conversion failed for {filepath}: {e}")
@@ -0,0 +1,281 @@
+"""
+Correlations for wide datasets.
+
+Pearson and Spearman coefficients are computed block by block with NumPy
+matrix products, so only a block of the p x p matrix is in memory at once,
+and only the strongest pairs (top k, or all above a threshold) are kept.
+Categorical columns get Cramér's V against each other and the correlation
+ratio against numeric columns.
+"""
+from __future__ import annotations
+from app.lazy import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+# Bump when the results change, so cached reports are recomputed
+CORRELATION_VERSION = 1
+
+# Columns per block of the correlation matrix (a block is BLOCK x BLOCK floats)
+CORRELATION_BLOCK_SIZE = 256
+# Up to this many numeric columns the profile keeps the full matrix
+DENSE_CORRELATION_MAX_COLUMNS = 50
+# Columns drawn in the heatmap, and up to how many its cells are annotated
+MAX_HEATMAP_COLUMNS = 20
+ANNOTATE_MAX_COLUMNS = 12
+# Pairs returned when only a threshold is given
+MAX_PAIRS = 10000
+DEFAULT_TOP_K = 20
+
+# Categorical columns with more distinct values than this are skipped (ids, free text)
+MAX_CATEGORIES = 50
+MAX_CATEGORICAL_COLUMNS = 30
+# Rows used for the categorical measures, which are estimates anyway
+ASSOCIATION_SAMPLE_ROWS = 100_000
+
+METHODS = ("pearson", "spearman")
+
+
+def numeric_frame(df: pd.DataFrame) -> pd.DataFrame:
+    return df.select_dtypes(include=[np.number])
+
+
+def _prepare(columns: pd.DataFrame, method: str) -> tuple[np.ndarray, bool]:
+    """
+    A block of columns as a float64 matrix, ranked for Spearman, centred on
+    their means. Returns it with whether nothing is missing (complete), in
+    which case the columns are also scaled to unit length.
+    """
+    if method == "spearman":
+        # Ranks over each column's non-missing values; pandas ranks per pair instead,
+        # which only differs when the two columns are missing on different rows
+        columns = columns.rank(method="average")
+    values = columns.to_numpy(dtype=np.float64, na_value=np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values = values - np.nanmean(values, axis=0) if len(values) else values
+        complete = not np.isnan(values).any()
+        if complete:
+            values = values / np.sqrt((values * values).sum(axis=0))  # constant columns become NaN
+    return values, complete
+
+
+def _block_correlations(x: np.ndarray, y: np.ndarray, complete: bool) -> np.ndarray:
+    """
+    Correlations between the columns of x and of y. Without missing values
+    in either (complete) the columns are expected scaled to unit length
+    already, so a block is a single matrix product; otherwise pairwise-complete
+    sums are used, which do not depend on the scale.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if complete:
+            return x.T @ y
+
+        # Sums restricted to the rows where both columns of a pair are present
+        mx, my = ~np.isnan(x), ~np.isnan(y)
+        x0, y0 = np.where(mx, x, 0.0), np.where(my, y, 0.0)
+        mx, my = mx.astype(np.float64), my.astype(np.float64)
+        n = mx.T @ my
+        sx, sy = x0.T @ my, mx.T @ y0
+        sxx, syy = (x0 * x0).T @ my, mx.T @ (y0 * y0)
+        cov = x0.T @ y0 - sx * sy / n
+        r = cov / np.sqrt((sxx - sx * sx / n) * (syy - sy * sy / n))
+        r[n < 2] = np.nan
+        return np.clip(r, -1.0, 1.0)
+
+
+def strongest_pairs(numeric_df: pd.DataFrame, method: str = "pearson", top_k: int = DEFAULT_TOP_K,
+                    threshold: float = None, block_size: int = CORRELATION_BLOCK_SIZE) -> list[dict]:
+    """
+    The strongest correlated column pairs, by |r|: the top_k of them, or all
+    with |r| >= threshold (at most MAX_PAIRS), or the top_k above threshold
+    when both are given. Returns [{"a", "b", "r"}] strongest first.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown correlation method: {method}")
+    columns = [str(c) for c in numeric_df.columns]
+    keep = top_k if top_k else MAX_PAIRS
+    minimum = threshold or 0.0
+
+    rows_idx, cols_idx, coefs = np.empty(0, int), np.empty(0, int), np.empty(0)
+    p = len(columns)
+    for i in range(0, p, block_size):
+        # One block of columns is converted at a time, never the whole frame
+        x, x_complete = _prepare(numeric_df.iloc[:, i:i + block_size], method)
+        for j in range(i, p, block_size):
+            y, y_complete = (x, x_complete) if j == i else _prepare(numeric_df.iloc[:, j:j + block_size], method)
+            block = _block_correlations(x, y, x_complete and y_complete)
+            strength = np.abs(block)
+            strength[~np.isfinite(strength)] = -1.0
+            if i == j:
+                strength[np.tril_indices(len(strength))] = -1.0  # each pair once, no diagonal
+            flat = strength.ravel()
+            if top_k and flat.size > keep:
+                # Only this block's own top candidates can make the overall top
+                candidates = np.argpartition(-flat, keep - 1)[:keep]
+                candidates = candidates[flat[candidates] >= minimum]
+            else:
+                candidates = np.flatnonzero(flat >= minimum)
+            a, b = np.divmod(candidates, block.shape[1])
+            rows_idx = np.concatenate([rows_idx, a + i])
+            cols_idx = np.concatenate([cols_idx, b + j])
+            coefs = np.concatenate([coefs, block[a, b]])
+            if len(coefs) > keep:
+                top = np.argpartition(-np.abs(coefs), keep - 1)[:keep]
+                rows_idx, cols_idx, coefs = rows_idx[top], cols_idx[top], coefs[top]
+
+    order = np.argsort(-np.abs(coefs), kind="stable")
+    return [
+        {"a": columns[rows_idx[k]], "b": columns[cols_idx[k]], "r": float(coefs[k])}
+        for k in order
+    ]
+
+
+def cluster_order(corr: pd.DataFrame) -> list:
+    """
+    Orders columns so strongly correlated ones sit together: starting from
+    the most connected column, repeatedly appends the remaining column most
+    correlated with the last one placed.
+    """
+    strength = corr.abs().fillna(0.0).to_numpy(copy=True)
+    np.fill_diagonal(strength, 0.0)
+    names = list(corr.columns)
+    if not names:
+        return []
+    remaining = set(range(len(names)))
+    current = int(strength.sum(axis=1).argmax())
+    order = [current]
+    remaining.discard(current)
+    while remaining:
+        candidates = sorted(remaining)
+        current = candidates[int(strength[current, candidates].argmax())]
+        order.append(current)
+        remaining.discard(current)
+    return [names[k] for k in order]
+
+
+def heatmap_columns(numeric_df: pd.DataFrame, limit: int = MAX_HEATMAP_COLUMNS) -> list:
+    """
+    Numeric columns worth drawing in the heatmap: all of them when there are
+    at most limit, else the columns of the strongest pairs; clustered order.
+    """
+    columns = list(numeric_df.columns)
+    if len(columns) > limit:
+        selected = []
+        for pair in strongest_pairs(numeric_df, top_k=limit * 4):
+            for name in (pair["a"], pair["b"]):
+                if name not in selected and len(selected) < limit:
+                    selected.append(name)
+        by_name = {str(c): c for c in columns}
+        columns = [by_name[name] for name in selected]
+    if len(columns) < 2:
+        return columns
+    return cluster_order(numeric_df[columns].corr())
+
+
+def categorical_columns(df: pd.DataFrame) -> list:
+    """Low-cardinality text/category/bool columns, fewest categories first."""
+    candidates = df.select_dtypes(include=["object", "category", "string", "bool"])
+    counts = candidates.nunique()
+    usable = counts[(counts > 1) & (counts <= MAX_CATEGORIES)].sort_values()
+    return list(usable.index[:MAX_CATEGORICAL_COLUMNS])
+
+
+def cramers_v(a_codes: np.ndarray, b_codes: np.ndarray) -> float:
+    """Bias-corrected Cramér's V of two factorized columns (-1 = missing)."""
+    present = (a_codes >= 0) & (b_codes >= 0)
+    a_codes, b_codes = a_codes[present], b_codes[present]
+    n = len(a_codes)
+    if n < 2:
+        return float("nan")
+    _, a_codes = np.unique(a_codes, return_inverse=True)
+    _, b_codes = np.unique(b_codes, return_inverse=True)
+    r, k = a_codes.max() + 1, b_codes.max() + 1
+    if r < 2 or k < 2:
+        return 0.0
+    observed = np.bincount(a_codes * k + b_codes, minlength=r * k).reshape(r, k).astype(np.float64)
+    expected = np.outer(observed.sum(axis=1), observed.sum(axis=0)) / n
+    chi2 = ((observed - expected) ** 2 / expected).sum()
+    # Bergsma's correction, so unrelated columns with many categories come out near 0
+    phi2 = max(0.0, chi2 / n - (k - 1) * (r - 1) / (n - 1))
+    r_corr = r - (r - 1) ** 2 / (n - 1)
+    k_corr = k - (k - 1) ** 2 / (n - 1)
+    denominator = min(k_corr - 1, r_corr - 1)
+    return float(np.sqrt(phi2 / denominator)) if denominator > 0 else 0.0
+
+
+def correlation_ratios(codes: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Correlation ratio (eta) of one factorized categorical column against
+    each column of values, on the rows where both are present: the share of
+    a numeric column's spread explained by the category means.
+    """
+    present = codes >= 0
+    codes, values = codes[present], values[present]
+    if len(codes) == 0:
+        return np.full(values.shape[1], np.nan)
+    order = np.argsort(codes, kind="stable")
+    codes, values = codes[order], values[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+
+    mask = ~np.isnan(values)
+    x0 = np.where(mask, values, 0.0)
+    counts = np.add.reduceat(mask.astype(np.float64), starts, axis=0)
+    sums = np.add.reduceat(x0, starts, axis=0)
+    total_n, total_sum = counts.sum(axis=0), sums.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        grand = total_sum * total_sum / total_n
+        between = np.where(counts > 0, sums * sums / counts, 0.0).sum(axis=0) - grand
+        total = (x0 * x0).sum(axis=0) - grand
+        eta2 = np.where(total > 0, between / total, np.nan)
+    return np.sqrt(np.clip(eta2, 0.0, 1.0))
+
+
+def associations(df: pd.DataFrame, top_k: int = DEFAULT_TOP_K, threshold: float = None,
+                 seed: int = 0) -> list[dict]:
+    """
+    Strongest associations involving categorical columns: Cramér's V between
+    two categorical columns, the correlation ratio between a categorical and
+    a numeric column. Both range 0..1. Estimated on at most
+    ASSOCIATION_SAMPLE_ROWS rows. Returns [{"a", "b", "measure", "value"}].
+    """
+    categories = categorical_columns(df)
+    if not categories:
+        return []
+    if len(df) > ASSOCIATION_SAMPLE_ROWS:
+        df = df.sample(n=ASSOCIATION_SAMPLE_ROWS, random_state=seed)
+
+    codes = {name: pd.factorize(df[name])[0] for name in categories}
+    numeric_df = numeric_frame(df)
+    numeric_values = numeric_df.to_numpy(dtype=np.float64, na_value=np.nan)
+    numeric_values = numeric_values - np.nanmean(numeric_values, axis=0) if numeric_values.size else numeric_values
+
+    results = []
+    for i, a in enumerate(categories):
+        for b in categories[i + 1:]:
+            results.append({"a": str(a), "b": str(b), "measure": "cramers_v",
+                            "value": cramers_v(codes[a], codes[b])})
+        if numeric_values.size:
+            for name, eta in zip(numeric_df.columns, correlation_ratios(codes[a], numeric_values)):
+                results.append({"a": str(a), "b": str(name), "measure": "correlation_ratio", "value": float(eta)})
+
+    minimum = threshold or 0.0
+    results = [r for r in results if np.isfinite(r["value"]) and r["value"] >= minimum]
+    results.sort(key=lambda r: r["value"], reverse=True)
+    return results[:top_k or MAX_PAIRS]
+
+
+def correlation_report(df: pd.DataFrame, method: str = "pearson", top_k: int = DEFAULT_TOP_K,
+                       threshold: float = None, include_categorical: bool = True) -> dict:
+    """Payload of the /correlations endpoint."""
+    numeric_df = numeric_frame(df)
+    report = {
+        "method": method,
+        "top_k": top_k,
+        "threshold": threshold,
+        "numeric_columns": numeric_df.shape[1],
+        "pairs": strongest_pairs(numeric_df, method, top_k, threshold),
+    }
+    if include_categorical:
+        report["categorical_columns"] = len(categorical_columns(df))
+        report["associations"] = associations(df, top_k, threshold)
+    return report
@@ -0,0 +1,202 @@
+"""
+Parallel parsing of large CSV/TSV files.
+
+The file is cut into byte ranges that start at record boundaries, each range
+is parsed on its own core and the pieces are joined. A cut is only placed at
+a newline outside double quotes, found with the same quote parity rule as
+row_index.scan_record_starts, so quoted fields spanning lines stay whole.
+Every range is parsed with the column names of the header and the schema
+inferred from the head of the file, so the pieces line up.
+
+pyarrow's CSV reader releases the GIL, so ranges are parsed in threads and
+joined as Arrow tables without copying before a single conversion to pandas.
+Files pyarrow cannot read the way pandas would (ragged rows, a column typed
+differently between ranges) fall back to pandas' parser, in worker processes
+when called from the main process and range by range inside a pool worker.
+"""
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from app.services.row_index import QUOTE, NEWLINE, SCAN_BLOCK_SIZE
+from app.services.worker_pool import ANALYSIS_WORKERS
+
+# Cores used to parse one file; 1 disables parallel parsing. Every analysis
+# worker may parse a file at once, so by default they share the cores.
+CSV_PARSE_WORKERS = int(os.getenv("CSV_PARSE_WORKERS", str(max(1, (os.cpu_count() or 1) // max(1, ANALYSIS_WORKERS)))))
+# Smaller files are parsed in one piece, where the split costs more than it saves
+CSV_PARALLEL_MIN_BYTES = int(os.getenv("CSV_PARALLEL_MIN_BYTES", str(64 * 1024 * 1024)))
+# Ranges per worker, so a slow range does not leave the other cores idle
+RANGES_PER_WORKER = 2
+MIN_RANGE_BYTES = 4 * 1024 * 1024
+# A cut's newline is usually within the first few bytes scanned
+BOUNDARY_BLOCK_SIZE = 64 * 1024
+
+
+def should_split(filepath: str) -> bool:
+    """Whether read_csv() would parse this file in parallel."""
+    return CSV_PARSE_WORKERS > 1 and os.path.getsize(filepath) >= CSV_PARALLEL_MIN_BYTES
+
+
+def _next_record_start(f, pos: int, in_quotes: int, size: int) -> int:
+    """Offset just past the first newline at or after pos that is outside quotes."""
+    f.seek(pos)
+    while pos < size:
+        block = np.frombuffer(f.read(min(BOUNDARY_BLOCK_SIZE, size - pos)), dtype=np.uint8)
+        if len(block) == 0:
+            break
+        parity = (np.cumsum(block == QUOTE) + in_quotes) % 2
+        newlines = np.flatnonzero((block == NEWLINE) & (parity == 0))
+        if len(newlines):
+            return pos + int(newlines[0]) + 1
+        in_quotes = int(parity[-1])
+        pos += len(block)
+    return size
+
+
+def _count_quotes(f, start: int, end: int) -> int:
+    f.seek(start)
+    count = 0
+    while start < end:
+        block = f.read(min(SCAN_BLOCK_SIZE, end - start))
+        if not block:
+            break
+        count += block.count(b'"')
+        start += len(block)
+    return count
+
+
+def split_ranges(filepath: str, parts: int) -> tuple[int, list]:
+    """
+    (end of the header, [(start, end), ...]): about `parts` byte ranges
+    covering the data rows, each starting at a record boundary. The quote
+    parity at each cut is known from the quotes counted before it, so only
+    the bytes up to the next newline after a cut are scanned for it.
+    """
+    size = os.path.getsize(filepath)
+    with open(filepath, "rb") as f:
+        header_end = _next_record_start(f, 0, 0, size)
+        parts = max(1, min(parts, (size - header_end) // MIN_RANGE_BYTES))
+        step = (size - header_end) // parts
+        cuts = [header_end]
+        quotes, counted_to = 0, header_end
+        for i in range(1, parts):
+            target = header_end + i * step
+            if target <= cuts[-1]:
+                continue  # The previous cut ran past this one inside a long quoted field
+            quotes += _count_quotes(f, counted_to, target)
+            counted_to = target
+            cut = _next_record_start(f, target, quotes % 2, size)
+            if cut < size:
+                cuts.append(cut)
+        cuts.append(size)
+    return header_end, list(zip(cuts[:-1], cuts[1:]))
+
+
+def _read_range(filepath: str, start: int, end: int) -> bytes:
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def _parse_range_arrow(filepath: str, start: int, end: int, sep: str, names: list,
+                       columns: list, categories: list):
+    import pyarrow as pa
+    import pyarrow.csv as pcsv
+
+    table = pcsv.read_csv(
+        pa.py_buffer(_read_range(filepath, start, end)),
+        read_options=pcsv.ReadOptions(column_names=names, use_threads=False),
+        parse_options=pcsv.ParseOptions(delimiter=sep, newlines_in_values=True),
+        convert_options=pcsv.ConvertOptions(
+            include_columns=columns,
+            column_types={name: pa.dictionary(pa.int32(), pa.string()) for name in categories},
+            strings_can_be_null=True,
+            timestamp_parsers=[],  # Dates are parsed by apply_schema, like with pandas
+        ),
+    )
+    # pyarrow still recognizes ISO dates and times; pandas leaves them as text
+    for i, field in enumerate(table.schema):
+        if pa.types.is_temporal(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.string()))
+    return table
+
+
+def _parse_range_pandas(filepath: str, start: int, end: int, sep: str, names: list,
+                        columns: list, categories: list) -> pd.DataFrame:
+    import io
+
+    return pd.read_csv(
+        io.BytesIO(_read_range(filepath, start, end)), sep=sep, header=None, names=names,
+        usecols=columns, dtype={name: "category" for name in categories}
+    )
+
+
+def _sort_categories(df: pd.DataFrame, categories: list) -> pd.DataFrame:
+    """Categories in sorted order, as pandas parses them, rather than in order of appearance."""
+    for name in categories:
+        if name in df.columns:
+            df[name] = df[name].cat.reorder_categories(sorted(df[name].cat.categories))
+    return df
+
+
+def _read_arrow(filepath, ranges, args, workers) -> pd.DataFrame:
+    import pyarrow as pa
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        tables = list(pool.map(lambda r: _parse_range_arrow(filepath, r[0], r[1], *args), ranges))
+    # Joining only links the pieces' buffers; a range with gaps widens int to double
+    table = pa.concat_tables(tables, promote_options="permissive")
+    text = pd.StringDtype("pyarrow", na_value=np.nan)
+    df = table.to_pandas(types_mapper={pa.string(): text, pa.large_string(): text}.get)
+    for field in table.schema:
+        if pa.types.is_null(field.type):
+            df[field.name] = df[field.name].astype("float64")  # All blank, as pandas reads it
+        elif pa.types.is_boolean(field.type) and table.column(field.name).null_count:
+            df[field.name] = df[field.name].where(df[field.name].notna(), np.nan)  # Gaps are NaN, not None
+    return _sort_categories(df, args[-1])
+
+
+def _read_pandas(filepath, ranges, args, workers) -> pd.DataFrame:
+    if multiprocessing.parent_process() is None:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(_parse_range_pandas, *zip(*[(filepath, s, e, *args) for s, e in ranges])))
+    else:
+        # Already in a pool's worker process, whose siblings use the other cores
+        frames = [_parse_range_pandas(filepath, s, e, *args) for s, e in ranges]
+    categories = args[-1]
+    df = pd.concat(frames, ignore_index=True)
+    # Each piece has its own categories, which concat turns back into text
+    for name in categories:
+        if name in df.columns:
+            df[name] = pd.api.types.union_categoricals([f[name] for f in frames], ignore_order=True)
+    return _sort_categories(df, categories)
+
+
+def read_csv(filepath: str, sep: str = ',', columns: list = None, schema: dict = None) -> pd.DataFrame:
+    """
+    Parses a CSV/TSV on CSV_PARSE_WORKERS cores. Same result as
+    pd.read_csv(filepath, sep=sep, usecols=columns, dtype=read_dtypes(schema)),
+    up to how integer columns with gaps are typed before apply_schema().
+    """
+    names = [str(c) for c in pd.read_csv(filepath, sep=sep, nrows=0).columns]
+    if columns is not None:
+        missing = [c for c in columns if c not in names]
+        if missing:
+            raise ValueError(f"Usecols do not match columns, columns expected but not found: {missing}")
+        columns = [name for name in names if name in columns]  # File order, like pandas
+    categories = [name for name, spec in (schema or {}).items() if spec["kind"] == "category"]
+
+    _, ranges = split_ranges(filepath, CSV_PARSE_WORKERS * RANGES_PER_WORKER)
+    if not ranges:
+        return pd.read_csv(filepath, sep=sep, usecols=columns)
+    args = (sep, names, columns, categories)
+    try:
+        return _read_arrow(filepath, ranges, args, CSV_PARSE_WORKERS)
+    except ImportError:
+        pass
+    except Exception as e:
+        logging.info(f"pyarrow could not parse {filepath} ({e}), using pandas")
+    return _read_pandas(filepath, ranges, args, CSV_PARSE_WORKERS)
@@ -1,27 +1,90 @@
 import pandas as pd
 import io
 import os
-from app.utils_json import clean_for_json
+import logging
+from app.utils_json import clean_for_json, frame_to_records, series_to_dict
+from app.services import metrics
+from app.services.columnar import has_columnar_copy, read_columnar, read_memory_report
+from app.services import csv_parallel, excel
+from app.services.schema import (
+    SCHEMA_SAMPLE_ROWS, infer_schema, read_dtypes, apply_schema, memory_report, estimate_untyped_bytes
+)
 
 class Dataset:
     """
     Handles loading and basic operations on datasets.
     Supports CSV, TSV, Excel.
     """
-    def __init__(self, file_content: bytes, filename: str):
+    def __init__(self, file_content, filename: str, columns: list = None, sheet: str = None):
+        """file_content: the file's bytes or its path. sheet picks a workbook's sheet (default: the first)."""
         self.filename = filename
-        self.df = self._load_data(file_content, filename)
+        self.memory = None  # memory footprint before/after typing, see get_memory_report
+        self.df = self._load_data(file_content, filename, columns, sheet)
 
-    def _load_data(self, content: bytes, filename: str) -> pd.DataFrame:
-        """Loads data into a pandas DataFrame based on file extension."""
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, filename: str, memory: dict = None) -> "Dataset":
+        """Wraps an already loaded (and typed) DataFrame."""
+        dataset = cls.__new__(cls)
+        dataset.filename = filename
+        dataset.df = df
+        dataset.memory = memory
+        return dataset
+
+    @classmethod
+    def from_file(cls, filepath: str, filename: str, columns: list = None, sheet: str = None) -> "Dataset":
+        """
+        Loads a stored file, preferring its memory-mapped columnar copy.
+        Falls back to parsing the raw file if the copy is missing or unreadable.
+        If columns is given, only those columns are read. Naming a workbook
+        sheet always parses the workbook (see excel.convert_sheet); so does a
+        sheet's copy that cannot be read.
+        """
+        if sheet is None and has_columnar_copy(filepath):
+            try:
+                # The copy is already typed; its load-time memory report is stored beside it
+                memory = read_memory_report(filepath) if columns is None else None
+                with metrics.span("read"):
+                    df = read_columnar(filepath, columns)
+                return cls.from_dataframe(df, filename, memory)
+            except Exception as e:
+                # Corrupt/partial copy, the raw file is the source of truth
+                logging.warning(f"Columnar copy of {filepath} is unreadable, parsing the raw file: {e}")
+
+        source = excel.sheet_source(filepath, filename) if sheet is None else None
+        if source is not None:
+            # A sheet's copy has no raw file of its own; parse that sheet of the workbook
+            filepath, index = source
+            sheet = excel.list_sheets(filepath)[index]
+        if excel.is_excel(filename) or csv_parallel.should_split(filepath):
+            # Workbooks are streamed from disk while parsing, large CSVs are read range by range
+            return cls(filepath, filename, columns, sheet)
+        with metrics.span("read"), open(filepath, "rb") as f:
+            content = f.read()
+        return cls(content, filename, columns)
+
+    @metrics.span("parse")
+    def _load_data(self, content, filename: str, columns: list = None, sheet: str = None) -> pd.DataFrame:
+        """
+        Loads data into a pandas DataFrame based on file extension, then
+        converts it to compact types inferred from a sample of the rows.
+        """
         filename = filename.lower()
+        source = (lambda: io.BytesIO(content)) if isinstance(content, bytes) else (lambda: content)
         try:
-            if filename.endswith('.csv'):
-                return pd.read_csv(io.BytesIO(content))
-            elif filename.endswith('.tsv'):
-                return pd.read_csv(io.BytesIO(content), sep='\t')
-            elif filename.endswith(('.xls', '.xlsx')):
-                return pd.read_excel(io.BytesIO(content))
+            if filename.endswith(('.csv', '.tsv')):
+                sep = '\t' if filename.endswith('.tsv') else ','
+                sample = pd.read_csv(source(), sep=sep, usecols=columns, nrows=SCHEMA_SAMPLE_ROWS)
+                schema = infer_schema(sample)
+                if isinstance(content, str) and csv_parallel.should_split(content):
+                    df = csv_parallel.read_csv(content, sep, columns, schema)
+                else:
+                    # Repetitive strings are parsed straight into categoricals
+                    df = pd.read_csv(source(), sep=sep, usecols=columns, dtype=read_dtypes(schema))
+                before, estimated = estimate_untyped_bytes(sample, len(df)), len(df) > len(sample)
+            elif excel.is_excel(filename):
+                df = excel.read_sheet(source(), sheet, columns, legacy=filename.endswith('.xls'))
+                schema = infer_schema(df.head(SCHEMA_SAMPLE_ROWS))
+                before, estimated = df.memory_usage(deep=True).sum(), False
             # Basic basic SQL support if uploaded as .db (sqlite)
             # This is risky/complex for web upload generally without a specialized UI, 
             # so we'll stick to file-based formats for this implementation as per standard user flows.
@@ -30,10 +93,13 @@ class Dataset:
         except Exception as e:
             raise ValueError(f"Error loading file: {str(e)}")
 
+        df = apply_schema(df, schema)
+        self.memory = memory_report(before, df, estimated)
+        return df
+
     def get_head(self, n: int = 5) -> list[dict]:
         """Returns the first n rows as a list of dictionaries (JSON-ready)."""
-        data = self.df.head(n).to_dict(orient='records')
-        return clean_for_json(data)
+        return frame_to_records(self.df.head(n))
 
     def get_info(self) -> dict:
         """Returns dataset metadata."""
@@ -45,12 +111,23 @@ class Dataset:
             "rows": self.df.shape[0],
             "columns": self.df.shape[1],
             "column_names": self.df.columns.tolist(),
-            "memory_usage": self.df.memory_usage(deep=True).sum(),
-            "dtypes": self.df.dtypes.astype(str).to_dict(),
+            "memory_usage": self.get_memory_usage(),
+            "memory": self.get_memory_report(),
+            "dtypes": series_to_dict(self.df.dtypes.astype(str)),
             "raw_info": info_str # For display if needed
         }
         return clean_for_json(info_data)
 
+    def get_memory_report(self) -> dict:
+        """Memory footprint before and after typing, measured once at load."""
+        if self.memory is None:
+            self.memory = memory_report(None, self.df)
+        return self.memory
+
+    def get_memory_usage(self) -> int:
+        """Bytes used by the loaded DataFrame."""
+        return self.get_memory_report()["after_bytes"]
+
     def get_columns(self) -> list:
         return self.df.columns.tolist()
         
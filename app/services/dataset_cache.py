@@ -0,0 +1,140 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Default memory budget for parsed datasets held by the process (in MB)
+DATASET_CACHE_MAX_MB = int(os.getenv("DATASET_CACHE_MAX_MB", "1024"))
+
+
+class DatasetCache:
+    """
+    Process-wide LRU cache of parsed datasets.
+
+    Entries are keyed by session and validated against the stored file's
+    (mtime, size) so a rewritten file is re-parsed. The total estimated
+    memory of cached DataFrames is kept under a byte budget by evicting the
+    least recently used entries. Concurrent loads of the same key are
+    collapsed so the file is only parsed once.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (signature, value, nbytes)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> threading.Lock held while a load is in flight
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def file_signature(filepath: str) -> tuple:
+        """
+        Returns the (mtime, size) pair used to detect changed files, or None
+        for a missing one (a sheet's copy not written yet, see Dataset.from_file).
+        """
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, key, filepath: str, loader):
+        """
+        Returns the cached value for key, calling loader() on a miss.
+        loader must return the value to cache (a Dataset).
+        """
+        signature = self.file_signature(filepath)
+
+        value = self._lookup(key, signature)
+        if value is not None:
+            return value
+
+        with self._lock:
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Another request may have finished loading while we waited
+            value = self._lookup(key, signature, count=False)
+            if value is not None:
+                with self._lock:
+                    self.hits += 1
+                return value
+
+            with self._lock:
+                self.misses += 1
+            try:
+                value = loader()
+                self._store(key, signature, value)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            return value
+
+    def peek(self, key, filepath: str):
+        """Returns the cached value for key if present and fresh, without loading."""
+        return self._lookup(key, self.file_signature(filepath))
+
+    def invalidate(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                self._total_bytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _lookup(self, key, signature, count: bool = True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != signature:
+                # File changed on disk, drop the stale parse
+                del self._entries[key]
+                self._total_bytes -= entry[2]
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[1]
+
+    def _store(self, key, signature, value):
+        nbytes = self._estimate_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._total_bytes -= old[2]
+            if nbytes > self.max_bytes:
+                # Too large to cache at all; the caller still gets the value
+                return
+            self._entries[key] = (signature, value, nbytes)
+            self._total_bytes += nbytes
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, _, evicted_bytes) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_bytes
+                self.evictions += 1
+
+    @staticmethod
+    def _estimate_size(value) -> int:
+        if hasattr(value, "get_memory_usage"):
+            return value.get_memory_usage()  # measured once at load
+        df = value.get_dataframe()
+        return int(df.memory_usage(deep=True).sum())
+
+
+dataset_cache = DatasetCache(max_bytes=DATASET_CACHE_MAX_MB * 1024 * 1024)
@@ -0,0 +1,418 @@
+"""
+Excel workbooks: listing sheets, reading one sheet by streaming its rows,
+and converting every sheet once to its own columnar copy.
+
+An .xlsx sheet is streamed straight from its XML part in the zip, cell
+values only, into per-column lists (see iter_rows). pandas' reader goes
+through openpyxl's cell objects and then its own text parser for every
+value; this is over twice as fast and never holds the sheet as rows.
+Legacy .xls files still go through pandas.
+
+The first sheet's copy is the workbook's columnar copy (see columnar), so a
+session on a workbook reads its first sheet by default. Selecting another
+sheet makes the session read that sheet's copy (see FileRecord.data_path);
+if the copy is gone, the sheet is parsed from the workbook again.
+"""
+from __future__ import annotations
+import os
+import re
+import json
+import hashlib
+import logging
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from itertools import islice
+from app.lazy import lazy_module
+from app.services.columnar import COLUMNAR_EXT, COLUMNAR_VERSION, columnar_path, has_columnar_copy
+
+pd = lazy_module("pandas")
+
+EXCEL_EXTENSIONS = ('.xls', '.xlsx')
+# Rows taken from the sheet's row iterator at a time
+READ_CHUNK_ROWS = 50_000
+
+
+def is_excel(filename: str) -> bool:
+    return filename.lower().endswith(EXCEL_EXTENSIONS)
+
+
+def _is_legacy(source) -> bool:
+    """True for a path to an .xls (pre-2007 binary) workbook."""
+    return isinstance(source, str) and source.lower().endswith('.xls')
+
+
+_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_DIGITS = "0123456789"
+
+
+def _workbook_sheets(archive: zipfile.ZipFile) -> list[tuple[str, str]]:
+    """(name, path of the sheet's XML part) for each sheet, in workbook order."""
+    workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+    rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels}
+    sheets = []
+    for sheet in workbook.iter(f"{_NS}sheet"):
+        target = targets[sheet.get(_REL_ID)]
+        # Targets are relative to xl/ unless absolute within the package
+        path = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+        sheets.append((sheet.get("name"), path))
+    return sheets
+
+
+def _shared_strings(archive: zipfile.ZipFile) -> list[str]:
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    root = None
+    text_tag, run_tag = f"{_NS}t", f"{_NS}r"
+    for event, element in ET.iterparse(archive.open("xl/sharedStrings.xml"), events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+        elif element.tag == f"{_NS}si":
+            # Rich text is split in runs (si/r/t); phonetic guides (si/rPh/t) are not part of the value
+            text = []
+            for child in element:
+                if child.tag == text_tag:
+                    text.append(child.text or "")
+                elif child.tag == run_tag:
+                    text.extend(t.text or "" for t in child.iterfind(text_tag))
+            strings.append("".join(text))
+            root.remove(element)
+    return strings
+
+
+def _date_styles(archive: zipfile.ZipFile) -> set[str]:
+    """Indexes (as in the cells' s attribute) of the cell styles with a date/time number format."""
+    from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+
+    if "xl/styles.xml" not in archive.namelist():
+        return set()
+    styles = ET.fromstring(archive.read("xl/styles.xml"))
+    formats = dict(BUILTIN_FORMATS)
+    for fmt in styles.iterfind(f"{_NS}numFmts/{_NS}numFmt"):
+        formats[int(fmt.get("numFmtId"))] = fmt.get("formatCode")
+    return {
+        str(i) for i, xf in enumerate(styles.iterfind(f"{_NS}cellXfs/{_NS}xf"))
+        if is_date_format(formats.get(int(xf.get("numFmtId", 0))))
+    }
+
+
+def iter_rows(source, sheet: str = None):
+    """
+    Yields each row of an .xlsx sheet (the first if sheet is None) as a tuple
+    of cell values, like openpyxl's read-only iter_rows(values_only=True):
+    numbers, strings, booleans, datetimes for date-formatted cells, None for
+    blanks and errors, and an empty tuple for a row left out of the file as
+    blank. Rows are parsed from the XML as they are read and then dropped.
+    """
+    from openpyxl.utils.datetime import from_excel, CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900
+
+    with zipfile.ZipFile(source) as archive:
+        sheets = _workbook_sheets(archive)
+        if sheet is None:
+            path = sheets[0][1]
+        else:
+            path = next((p for name, p in sheets if name == sheet), None)
+            if path is None:
+                raise KeyError(f"Worksheet {sheet} does not exist.")
+        properties = ET.fromstring(archive.read("xl/workbook.xml")).find(f"{_NS}workbookPr")
+        epoch = CALENDAR_MAC_1904 if properties is not None and properties.get("date1904") in ("1", "true") \
+            else CALENDAR_WINDOWS_1900
+        strings = _shared_strings(archive)
+        dates = _date_styles(archive)
+        positions = {}  # column letters -> index
+
+        cell_tag, row_tag, value_tag = f"{_NS}c", f"{_NS}row", f"{_NS}v"
+        inline_tag, text_tag, data_tag = f"{_NS}is", f"{_NS}t", f"{_NS}sheetData"
+        sheet_data = None
+        expected = 1  # Number of the next row
+        for event, element in ET.iterparse(archive.open(path), events=("start", "end")):
+            if event == "start":
+                if element.tag == data_tag:
+                    sheet_data = element
+                continue
+            if element.tag != row_tag:
+                continue
+            number = element.get("r")
+            if number is not None:
+                for _ in range(int(number) - expected):
+                    yield ()  # Rows without any cell are left out of the XML
+                expected = int(number)
+            expected += 1
+            row = []
+            for cell in element:
+                if cell.tag != cell_tag:
+                    continue
+                ref = cell.get("r")
+                if ref:
+                    letters = ref.rstrip(_DIGITS)
+                    index = positions.get(letters)
+                    if index is None:
+                        index = 0
+                        for ch in letters:
+                            index = index * 26 + ord(ch) - 64
+                        index = positions[letters] = index - 1
+                    if index > len(row):
+                        row.extend([None] * (index - len(row)))  # Blank cells are left out
+                kind = cell.get("t")
+                if kind == "inlineStr":
+                    node = cell.find(inline_tag)
+                    value = "".join(t.text or "" for t in node.iter(text_tag)) if node is not None else None
+                else:
+                    text = cell.findtext(value_tag)
+                    if text is None:
+                        value = None
+                    elif kind is None or kind == "n":
+                        value = float(text) if ("." in text or "E" in text or "e" in text) else int(text)
+                        if cell.get("s") in dates:
+                            value = from_excel(value, epoch)
+                    elif kind == "s":
+                        value = strings[int(text)]
+                    elif kind == "b":
+                        value = text == "1"
+                    elif kind == "str":
+                        value = text
+                    elif kind == "d":
+                        value = datetime.fromisoformat(text)
+                    else:
+                        value = None  # Error cells (#N/A, #DIV/0!, ...)
+                row.append(value)
+            # Cleared rows would still pile up under sheetData
+            sheet_data.remove(element)
+            yield tuple(row)
+
+
+def list_sheets(source) -> list[str]:
+    """Sheet names in workbook order, without reading any cells."""
+    if _is_legacy(source):
+        return pd.ExcelFile(source).sheet_names
+    with zipfile.ZipFile(source) as archive:
+        return [name for name, _ in _workbook_sheets(archive)]
+
+
+def _header_names(header: tuple) -> list:
+    """Column names like pandas gives them: "Unnamed: i" for blanks, "x.1" for repeats."""
+    names, seen = [], {}
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None or value == "" else value
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        names.append(f"{name}.{count}" if count else name)
+    return names
+
+
+def read_sheet(source, sheet: str = None, columns: list = None, legacy: bool = None) -> pd.DataFrame:
+    """
+    One sheet (the first if sheet is None) as a DataFrame, first row as the
+    header. source is a path or a binary file object; legacy says it is an
+    .xls workbook (by default judged from the path). columns limits the
+    result to those column names, like usecols.
+    """
+    if legacy if legacy is not None else _is_legacy(source):
+        return pd.read_excel(source, sheet_name=sheet or 0, usecols=columns)
+
+    rows = iter_rows(source, sheet)
+    try:
+        header = list(next(rows, ()))
+        while header and header[-1] is None:
+            header.pop()
+
+        named = len(header)
+        values = [[] for _ in header]  # one list per column
+        read = 0  # rows taken from the sheet so far
+        row_count = 0  # rows up to the last one with any value
+        pending = 0  # blank rows not yet known to be followed by data
+        while True:
+            block = list(islice(rows, READ_CHUNK_ROWS))
+            if not block:
+                break
+            width = max(len(row) for row in block)
+            if width > len(values):
+                # Values past the header get unnamed columns, as in pandas
+                values.extend([None] * read for _ in range(width - len(values)))
+                header.extend([None] * (width - len(header)))
+            for i, column in enumerate(zip(*(row + (None,) * (width - len(row)) for row in block))):
+                values[i].extend(column)
+            for i in range(width, len(values)):
+                values[i].extend([None] * len(block))
+            read += len(block)
+            for row in block:
+                if any(v is not None for v in row):
+                    row_count += pending + 1
+                    pending = 0
+                else:
+                    pending += 1
+    finally:
+        rows.close()
+
+    # Trailing blank rows and unnamed blank columns are formatting, not data
+    names = _header_names(header)
+    data = {
+        name: column[:row_count] for i, (name, column) in enumerate(zip(names, values))
+        if i < named or any(v is not None for v in column)
+    }
+    if columns is not None:
+        missing = [c for c in columns if c not in data]
+        if missing:
+            raise ValueError(f"Usecols do not match columns, columns expected but not found: {missing}")
+        data = {name: data[name] for name in columns}
+    return _to_frame(data)
+
+
+def _to_frame(data: dict) -> pd.DataFrame:
+    """DataFrame of {name: cell values}, with blanks and booleans typed as pandas reads them."""
+    df = pd.DataFrame(data)
+    for name in df.columns:
+        column = df[name]
+        if column.dtype != object:
+            continue
+        if column.isna().all():
+            df[name] = column.astype("float64")  # All blank, as pandas reads it
+        elif pd.api.types.infer_dtype(column, skipna=True) == "boolean":
+            # True/False with blanks stay object otherwise
+            df[name] = column.astype("boolean")
+        elif column.hasnans:
+            df[name] = column.where(column.notna(), float("nan"))  # Blanks are NaN, not None
+    return df
+
+
+def iter_sheet(source, sheet: str = None, chunk_rows: int = READ_CHUNK_ROWS):
+    """
+    Yields one sheet as DataFrames of up to chunk_rows rows, typed like
+    read_sheet, holding one block of rows at a time. The columns are those
+    of the header plus unnamed ones with values in the first block; values
+    further right in later rows are left out. Legacy .xls sheets cannot be
+    streamed and are read whole, then sliced.
+    """
+    if _is_legacy(source):
+        df = read_sheet(source, sheet)
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+        return
+
+    rows = iter_rows(source, sheet)
+    try:
+        header = list(next(rows, ()))
+        while header and header[-1] is None:
+            header.pop()
+        names = keep = None
+        pending = []  # blank rows not yet known to be followed by data
+        while True:
+            block = list(islice(rows, chunk_rows))
+            if not block:
+                break
+            if names is None:
+                width = max(len(header), max(len(row) for row in block))
+                keep = [
+                    i for i in range(width)
+                    if i < len(header) or any(i < len(row) and row[i] is not None for row in block)
+                ]
+                names = _header_names(header + [None] * (width - len(header)))
+            end = len(block)
+            while end and all(v is None for v in block[end - 1]):
+                end -= 1
+            if not end:
+                pending.extend(block)
+                continue
+            block, pending = pending + block[:end], block[end:]
+            width = len(names)
+            columns = list(zip(*(row[:width] + (None,) * (width - len(row)) for row in block)))
+            yield _to_frame({names[i]: columns[i] for i in keep})
+    finally:
+        rows.close()
+
+
+def sheet_path(filepath: str, index: int) -> str:
+    """Columnar copy of the workbook's sheet at index; the first sheet's is the workbook's own copy."""
+    if index == 0:
+        return columnar_path(filepath)
+    return f"{os.path.splitext(filepath)[0]}.sheet{index}.v{COLUMNAR_VERSION}{COLUMNAR_EXT}"
+
+
+_SHEET_COPY = re.compile(rf"(.*)\.sheet(\d+)\.v\d+{re.escape(COLUMNAR_EXT)}")
+
+
+def sheet_source(path: str, filename: str):
+    """(workbook path, sheet index) if path is a sheet's copy from sheet_path, else None."""
+    match = _SHEET_COPY.fullmatch(path)
+    if match is None:
+        return None
+    # Blobs have a lower-case extension, older uploads kept the original one
+    ext = os.path.splitext(filename)[1]
+    workbook = match[1] + ext.lower()
+    if not os.path.exists(workbook) and os.path.exists(match[1] + ext):
+        workbook = match[1] + ext
+    return workbook, int(match[2])
+
+
+def sheet_content_hash(content_hash: str, index: int) -> str:
+    """Key of a sheet's derived data: the workbook's own hash for the first sheet."""
+    if index == 0:
+        return content_hash
+    return hashlib.sha256(f"{content_hash}:sheet:{index}".encode()).hexdigest()
+
+
+def _manifest_path(filepath: str) -> str:
+    return f"{os.path.splitext(filepath)[0]}.sheets.v{COLUMNAR_VERSION}.json"
+
+
+def read_manifest(filepath: str):
+    """[{"index", "name", "rows", "columns"}] of a converted workbook, or None."""
+    try:
+        with open(_manifest_path(filepath)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def convert_sheet(filepath: str, filename: str, index: int, name: str) -> dict:
+    """
+    Parses one sheet and writes its typed columnar copy, unless a fresh one
+    exists. Runs in a worker process. Returns the sheet's manifest entry.
+    """
+    from app.services.dataset import Dataset
+    from app.services.columnar import write_columnar
+
+    path = sheet_path(filepath, index)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(filepath):
+        import pyarrow.feather as feather
+        table = feather.read_table(path, memory_map=True)
+        return {"index": index, "name": name, "rows": table.num_rows, "columns": table.num_columns}
+
+    dataset = Dataset.from_file(filepath, filename, sheet=name)
+    write_columnar(dataset.get_dataframe(), path, dataset.get_memory_report())
+    rows, columns = dataset.get_shape()
+    return {"index": index, "name": name, "rows": rows, "columns": columns}
+
+
+def convert_workbook(content_hash: str, filepath: str, filename: str):
+    """
+    Converts every sheet of a stored workbook to its columnar copy, sheets in
+    parallel on the worker pool, and saves the sheet manifest. Meant to run
+    as a background task after the upload; never raises.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from app.services.worker_pool import worker_pool
+
+    if read_manifest(filepath) is not None and has_columnar_copy(filepath):
+        return  # Shared blob that was converted for an earlier session
+    try:
+        names = list_sheets(filepath)
+        # Each sheet has its own queue, so they spread over the workers
+        with ThreadPoolExecutor(max_workers=max(1, min(len(names), worker_pool.max_workers))) as threads:
+            manifest = list(threads.map(
+                lambda item: worker_pool.run_sync(
+                    f"{content_hash}:sheet:{item[0]}", convert_sheet, filepath, filename, item[0], item[1]
+                ),
+                enumerate(names)
+            ))
+        tmp_path = f"{_manifest_path(filepath)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, _manifest_path(filepath))
+    except Exception as e:
+        logging.warning(f"Workbook conversion failed for {filepath}: {e}")
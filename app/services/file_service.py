@@ -1,40 +1,228 @@
 import os
-import shutil
+import base64
+import hashlib
+import logging
+from datetime import datetime
 from fastapi import UploadFile
+from sqlalchemy import or_, and_
 from sqlalchemy.orm import Session
+from app.database import SessionLocal
 from app.models import FileRecord
+from app.services import excel
 import uuid
 
 STORAGE_DIR = "storage"
 os.makedirs(STORAGE_DIR, exist_ok=True)
 
+# Uploads are stored once per content: storage/blobs/<sha[:2]>/<sha><ext>
+BLOB_DIR = os.path.join(STORAGE_DIR, "blobs")
+UPLOAD_TMP_DIR = os.path.join(STORAGE_DIR, "tmp")
+os.makedirs(BLOB_DIR, exist_ok=True)
+os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "2048")) * 1024 * 1024
+
+class UploadTooLargeError(ValueError):
+    pass
+
+class InvalidCursorError(ValueError):
+    pass
+
+def encode_cursor(record: FileRecord) -> str:
+    """Opaque position after record in the newest-first listing."""
+    raw = f"{record.upload_time.isoformat()}|{record.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        upload_time, record_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(upload_time), int(record_id)
+    except ValueError as e:
+        raise InvalidCursorError("Invalid cursor") from e
+
+def compute_file_hash(filepath: str) -> str:
+    """Returns the sha256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 class FileService:
     def __init__(self, db: Session):
         self.db = db
 
     def save_file(self, file: UploadFile, session_name: str) -> str:
-        """Saves file to disk and creates DB record. Returns session_id."""
+        """
+        Streams the upload to content-addressed storage and creates the DB record.
+        Identical bytes are stored once; later sessions point at the existing blob
+        and so share its columnar copy, profile and charts. Returns session_id.
+        """
         session_id = str(uuid.uuid4())
-        file_ext = os.path.splitext(file.filename)[1]
-        stored_filename = f"{session_id}{file_ext}"
-        filepath = os.path.join(STORAGE_DIR, stored_filename)
-
-        with open(filepath, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        file_ext = os.path.splitext(file.filename)[1].lower()
+        content_hash, filepath, size = self._store_blob(file.file, file_ext)
 
         record = FileRecord(
             session_id=session_id,
             session_name=session_name,
             filename=file.filename,
             filepath=filepath,
-            file_type=file_ext
+            file_type=file_ext,
+            content_hash=content_hash,
+            size_bytes=size,
+            details_checked=True  # The upload's background tasks record the shape
         )
+        # Another session may already have parsed the same content
+        known = self.db.query(FileRecord.row_count, FileRecord.column_count).filter(
+            FileRecord.content_hash == content_hash, FileRecord.row_count.isnot(None)
+        ).first()
+        if known:
+            record.row_count, record.column_count = known
         self.db.add(record)
         self.db.commit()
         return session_id
 
+    def _store_blob(self, source, file_ext: str) -> tuple[str, str, int]:
+        """Copies source in chunks while hashing it. Returns (sha256, blob path, size)."""
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4()}{file_ext}")
+        try:
+            with open(tmp_path, "wb") as buffer:
+                for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+                    size += len(chunk)
+                    if size > MAX_UPLOAD_BYTES:
+                        raise UploadTooLargeError(
+                            f"File exceeds the upload limit of {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
+                        )
+                    digest.update(chunk)
+                    buffer.write(chunk)
+
+            content_hash = digest.hexdigest()
+            blob_path = os.path.join(BLOB_DIR, content_hash[:2], f"{content_hash}{file_ext}")
+            if os.path.exists(blob_path):
+                # Already stored; keep the existing blob (and its derived files' mtimes)
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(tmp_path, blob_path)
+            return content_hash, blob_path, size
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
     def get_file_record(self, session_id: str) -> FileRecord:
         return self.db.query(FileRecord).filter(FileRecord.session_id == session_id).first()
 
-    def get_all_files(self):
-        return self.db.query(FileRecord).order_by(FileRecord.upload_time.desc()).all()
+    def ensure_content_hash(self, record: FileRecord) -> str:
+        """Backfills the content hash for records created before it was stored."""
+        if not record.content_hash:
+            record.content_hash = compute_file_hash(record.filepath)
+            self.db.commit()
+        return record.content_hash
+
+    def list_files(self, limit: int, cursor: str = None, name: str = None,
+                   uploaded_after: datetime = None, uploaded_before: datetime = None) -> tuple[list, str]:
+        """
+        One page of records, newest first, and the cursor of the next page
+        (None on the last one). Pages are found by keyset on (upload_time, id)
+        rather than OFFSET, so every page costs the same however deep it is.
+        name matches session or file names, case-insensitively.
+        """
+        query = self.db.query(FileRecord)
+        if name:
+            pattern = f"%{name}%"
+            query = query.filter(or_(FileRecord.session_name.ilike(pattern), FileRecord.filename.ilike(pattern)))
+        if uploaded_after:
+            query = query.filter(FileRecord.upload_time >= uploaded_after)
+        if uploaded_before:
+            query = query.filter(FileRecord.upload_time < uploaded_before)
+        if cursor:
+            upload_time, record_id = decode_cursor(cursor)
+            query = query.filter(or_(
+                FileRecord.upload_time < upload_time,
+                and_(FileRecord.upload_time == upload_time, FileRecord.id < record_id)
+            ))
+        records = query.order_by(FileRecord.upload_time.desc(), FileRecord.id.desc()).limit(limit + 1).all()
+        next_cursor = encode_cursor(records[limit - 1]) if len(records) > limit else None
+        return records[:limit], next_cursor
+
+    def select_sheet(self, record: FileRecord, index: int, name: str, rows: int = None, columns: int = None):
+        """
+        Points a workbook session at one of its sheets. filepath stays the
+        workbook; analysis reads the sheet's columnar copy (see
+        FileRecord.data_path and excel.convert_sheet), the first sheet through
+        the workbook itself. Derived data is keyed per sheet.
+        """
+        if record.source_hash is None:
+            record.source_hash = self.ensure_content_hash(record)
+        record.content_hash = excel.sheet_content_hash(record.source_hash, index)
+        record.sheet_index, record.sheet_name = index, name
+        record.row_count, record.column_count = rows, columns
+        self.db.commit()
+
+    def set_shape(self, content_hash: str, rows: int, columns: int):
+        """Stores the parsed shape on every session of this content."""
+        self.db.query(FileRecord).filter(FileRecord.content_hash == content_hash).update(
+            {FileRecord.row_count: rows, FileRecord.column_count: columns}, synchronize_session=False
+        )
+        self.db.commit()
+
+def record_file_details(session_id: str, backfill: bool = False):
+    """
+    Fills in the size and row/column counts of a session's file, so listings
+    can show them without opening it. Runs as a background task after the
+    columnar conversion; opens its own database session and never raises.
+    With backfill (sessions from before these were stored), it runs once per
+    record: the first caller marks it checked, even if the file cannot be parsed.
+    """
+    from app.services.worker_pool import worker_pool
+    from app.services import analysis_tasks
+
+    db = SessionLocal()
+    try:
+        if backfill:
+            claimed = db.query(FileRecord).filter(
+                FileRecord.session_id == session_id,
+                or_(FileRecord.details_checked.is_(None), FileRecord.details_checked.is_(False))
+            ).update({FileRecord.details_checked: True}, synchronize_session=False)
+            db.commit()
+            if not claimed:
+                return  # Checked before, or by a concurrent listing
+        service = FileService(db)
+        record = service.get_file_record(session_id)
+        if record is None:
+            return
+        if record.size_bytes is None:
+            record.size_bytes = os.path.getsize(record.filepath)
+            db.commit()
+        if record.row_count is None:
+            content_hash = service.ensure_content_hash(record)
+            rows, columns = worker_pool.run_sync(
+                content_hash, analysis_tasks.run_shape, content_hash, record.data_path, record.filename
+            )
+            service.set_shape(content_hash, int(rows), int(columns))
+    except Exception as e:
+        logging.warning(f"Recording file details failed for session {session_id}: {e}")
+    finally:
+        db.close()
+
+def backfill_content_hashes():
+    """
+    Hashes the files of records created before content hashes were stored,
+    so requests find them keyed already. Meant for a background thread at
+    startup: opens its own database session and never raises.
+    """
+    db = SessionLocal()
+    try:
+        service = FileService(db)
+        for record in db.query(FileRecord).filter(FileRecord.content_hash.is_(None)).all():
+            try:
+                if os.path.exists(record.filepath):
+                    service.ensure_content_hash(record)
+            except Exception as e:
+                db.rollback()
+                logging.warning(f"Hashing failed for session {record.session_id}: {e}")
+    finally:
+        db.close()
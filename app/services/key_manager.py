@@ -2,7 +2,6 @@ from cryptography.fernet import Fernet
 import os
 from sqlalchemy.orm import Session
 from app.models import AppSetting
-from google import genai
 import logging
 
 # Ensure we have a key for encryption
@@ -52,6 +51,8 @@ class KeyManager:
 
     def _validate_key(self, provider: str, key: str) -> bool:
         if provider == "gemini":
+            from google import genai
+
             try:
                 client = genai.Client(api_key=key)
                 client.models.generate_content(
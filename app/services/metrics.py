@@ -0,0 +1,334 @@
+"""
+Request and analysis-stage instrumentation: timed spans sent back as
+Server-Timing headers, and counters/histograms served in the Prometheus
+text format by /metrics.
+
+Spans and cache lookups are recorded into the collector of the current
+context (one per request, see server_timing). In a worker process the
+collector is "remote": nothing is observed there, the records travel back
+with the task's result and are observed by the web process (see
+worker_report / record_worker_report), which is the one /metrics reads.
+"""
+import cProfile
+import contextvars
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows: peak memory is not reported there
+    resource = None
+
+# Requests (and worker tasks) slower than this many seconds are logged. While
+# set, every worker task runs under cProfile (roughly doubling its CPU time)
+# and the slow ones keep their profile; unset or 0 disables both
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "0") or 0)
+# Where the profiles of slow worker tasks are written (pstats files)
+SLOW_PROFILE_DIR = os.getenv("SLOW_PROFILE_DIR", os.path.join("storage", "profiles"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MEMORY_BUCKETS = tuple(2 ** n * 1024 * 1024 for n in range(5, 15))  # 32 MB .. 16 GB
+# Stages whose repeats within one request can run at the same time
+OVERLAPPING_STAGES = {"queue"}
+
+
+class Collector:
+    """Spans, cache lookups and profile files recorded while serving one request or running one task."""
+    def __init__(self, remote: bool = False):
+        self.remote = remote
+        self.spans = []  # (stage, seconds)
+        self.caches = []  # (cache, hit)
+        self.profiles = []
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing header value, with the durations of repeated stages
+        summed. Waits for tasks submitted side by side overlap, so queue
+        reports the longest one instead.
+        """
+        totals = {}
+        for stage, seconds in self.spans:
+            if stage in OVERLAPPING_STAGES:
+                totals[stage] = max(totals.get(stage, 0.0), seconds)
+            else:
+                totals[stage] = totals.get(stage, 0.0) + seconds
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+_collector = contextvars.ContextVar("metrics_collector", default=None)
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def series(self) -> list:
+        """Label values seen so far."""
+        with self._lock:
+            return list(self._values)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, values)} {_number(total)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.setdefault(label_values, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets + ("+Inf",), series[:-2] + [series[-1]]):
+                    le = _labels(self.labels + ("le",), values + (bound if bound == "+Inf" else _number(float(bound)),))
+                    lines.append(f"{self.name}_bucket{le} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, values)} {_number(series[-2])}")
+                lines.append(f"{self.name}_count{_labels(self.labels, values)} {series[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+REQUESTS = Counter("http_requests_total", "HTTP requests answered.", ("method", "route", "status"))
+STAGE_SECONDS = Histogram("analysis_stage_duration_seconds", "Time spent in each analysis stage.", ("stage",))
+TASK_SECONDS = Histogram("analysis_task_duration_seconds", "Worker task run time, excluding queueing.", ("task",))
+TASK_PEAK_RSS = Histogram(
+    "analysis_task_peak_rss_bytes", "Peak resident memory of the worker while running a task.", ("task",), MEMORY_BUCKETS
+)
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Result cache lookups.", ("cache", "result"))
+
+REGISTRY = [REQUEST_SECONDS, REQUESTS, STAGE_SECONDS, TASK_SECONDS, TASK_PEAK_RSS, CACHE_LOOKUPS]
+
+
+def _record_span(stage: str, seconds: float):
+    collector = _collector.get()
+    if collector is not None:
+        collector.spans.append((stage, seconds))
+    if collector is None or not collector.remote:
+        STAGE_SECONDS.observe(seconds, stage)
+
+
+def count_cache(cache: str, hit: bool):
+    """Counts one lookup in cache."""
+    collector = _collector.get()
+    if collector is not None:
+        collector.caches.append((cache, hit))
+    if collector is None or not collector.remote:
+        CACHE_LOOKUPS.inc(cache, "hit" if hit else "miss")
+
+
+@contextmanager
+def span(stage: str):
+    """Times the enclosed block as stage. Usable as a decorator too."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_span(stage, time.perf_counter() - start)
+
+
+def cache_lookup(cache: str, value):
+    """Counts a lookup in cache as a hit when value is not None; returns value."""
+    count_cache(cache, value is not None)
+    return value
+
+
+def cache_hit_ratio(cache: str) -> float:
+    hits, misses = CACHE_LOOKUPS.value(cache, "hit"), CACHE_LOOKUPS.value(cache, "miss")
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+def _reset_peak_rss():
+    """Restarts the kernel's peak RSS (VmHWM) count for this process, where supported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss() -> int:
+    """Peak resident memory of this process in bytes (since the last reset, on Linux), or None where unknown."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _write_profile(profiler: cProfile.Profile, task: str) -> str:
+    os.makedirs(SLOW_PROFILE_DIR, exist_ok=True)
+    path = os.path.join(SLOW_PROFILE_DIR, f"{task}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.prof")
+    profiler.dump_stats(path)
+    return path
+
+
+def worker_report(fn, args):
+    """
+    Runs fn(*args) in a worker with a remote collector. Returns the result and
+    a report of the task's spans, cache lookups, run time and peak RSS; slow
+    tasks also get a cProfile dump, whose path is in the report. Peak RSS is
+    only measured in a worker process: with thread workers (ANALYSIS_WORKERS=0)
+    it would be the web process's, and resetting it would clear its count.
+    """
+    collector = Collector(remote=True)
+    token = _collector.set(collector)
+    profiler = cProfile.Profile() if SLOW_REQUEST_SECONDS > 0 else None
+    in_worker = multiprocessing.parent_process() is not None
+    if in_worker:
+        _reset_peak_rss()
+    start = time.perf_counter()
+    try:
+        if profiler is not None:
+            try:
+                profiler.enable()
+            except ValueError:
+                profiler = None  # Another task in this process is being profiled (thread mode)
+        result = fn(*args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _collector.reset(token)
+    seconds = time.perf_counter() - start
+    task = getattr(fn, "__name__", "task")
+    if profiler is not None and seconds > SLOW_REQUEST_SECONDS:
+        collector.profiles.append(_write_profile(profiler, task))
+        logging.warning(f"Slow task {task}: {seconds:.2f}s, profile written to {collector.profiles[-1]}")
+    report = {
+        "task": task,
+        "seconds": seconds,
+        "peak_rss": peak_rss() if in_worker else None,
+        "spans": collector.spans,
+        "caches": collector.caches,
+        "profiles": collector.profiles,
+    }
+    return result, report
+
+
+def record_worker_report(report: dict, elapsed: float):
+    """
+    Observes a worker task's report in this process and adds its spans to the
+    current request. elapsed is the caller's wait, so the rest is queueing.
+    """
+    TASK_SECONDS.observe(report["seconds"], report["task"])
+    if report["peak_rss"] is not None:
+        TASK_PEAK_RSS.observe(report["peak_rss"], report["task"])
+    _record_span("queue", max(0.0, elapsed - report["seconds"]))
+    for stage, seconds in report["spans"]:
+        _record_span(stage, seconds)
+    for cache, hit in report["caches"]:
+        count_cache(cache, hit)
+    collector = _collector.get()
+    if collector is not None:
+        collector.profiles.extend(report["profiles"])
+
+
+def _route_label(request) -> str:
+    """The route's path template, so session ids do not become label values."""
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+async def server_timing(request, call_next):
+    """
+    HTTP middleware: collects the request's spans, sends them as a
+    Server-Timing header, observes the request latency and logs slow requests.
+    """
+    collector = Collector()
+    token = _collector.set(collector)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _collector.reset(token)
+    elapsed = time.perf_counter() - start
+
+    route = _route_label(request)
+    REQUEST_SECONDS.observe(elapsed, request.method, route)
+    REQUESTS.inc(request.method, route, str(response.status_code))
+    timing = collector.server_timing()
+    response.headers["Server-Timing"] = f"{timing}, total;dur={elapsed * 1000:.1f}" if timing else f"total;dur={elapsed * 1000:.1f}"
+
+    if SLOW_REQUEST_SECONDS > 0 and elapsed > SLOW_REQUEST_SECONDS:
+        profiles = f", profiles: {', '.join(collector.profiles)}" if collector.profiles else ""
+        logging.warning(
+            f"Slow request {request.method} {request.url.path} ({response.status_code}): "
+            f"{elapsed:.2f}s [{timing}]{profiles}"
+        )
+    return response
+
+
+def gauge(name: str, help: str, samples: dict, labels: tuple = (), kind: str = "gauge") -> list:
+    """
+    Prometheus lines for a value read at scrape time, given {label values:
+    value}. kind="counter" for totals kept elsewhere (e.g. by the workers).
+    """
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for values, value in samples.items():
+        lines.append(f"{name}{_labels(labels, values)} {_number(value)}")
+    return lines
+
+
+def render(extra_lines: list = ()) -> str:
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    caches = sorted({values[0] for values in CACHE_LOOKUPS.series()})
+    lines.extend(gauge(
+        "cache_hit_ratio", "Share of result cache lookups that hit.",
+        {(cache,): cache_hit_ratio(cache) for cache in caches}, ("cache",)
+    ))
+    rss = peak_rss()
+    if rss is not None:
+        lines.extend(gauge("process_peak_rss_bytes", "Peak resident memory of the web process.", {(): rss}))
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,141 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import ProfileRecord
+from app.utils_json import dumps_json
+
+# Bump when the profile payload changes so stored profiles get recomputed
+PROFILE_VERSION = 3
+
+# A job still "pending" after this long is assumed lost; marks left by a
+# previous process are cleared at startup (see reset_pending_profiles)
+PENDING_TIMEOUT = timedelta(minutes=30)
+
+
+class ProfileStore:
+    """
+    Durable storage of computed /stats profiles, keyed by file content hash.
+    An uploaded file never changes, so a profile is computed once per content.
+    """
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get(self, content_hash: str) -> ProfileRecord:
+        return self.db.query(ProfileRecord).filter(ProfileRecord.content_hash == content_hash).first()
+
+    def get_status(self, content_hash: str) -> dict:
+        """Returns {"status": missing|pending|ready|failed, "error": ...}."""
+        record = self.get(content_hash)
+        if record is None or (record.status == "ready" and record.version != PROFILE_VERSION):
+            return {"status": "missing", "error": None}
+        if record.status == "pending" and datetime.utcnow() - record.updated_at > PENDING_TIMEOUT:
+            return {"status": "failed", "error": "Profile job timed out"}
+        return {"status": record.status, "error": record.error}
+
+    def load_result(self, content_hash: str) -> dict:
+        """Returns the stored profile payload, or None if it is not ready."""
+        raw = self.load_result_json(content_hash)
+        return json.loads(raw) if raw is not None else None
+
+    def load_result_json(self, content_hash: str) -> str:
+        """Returns the stored profile as JSON text, ready to send as a response."""
+        if self.get_status(content_hash)["status"] != "ready":
+            return None
+        return self.get(content_hash).result
+
+    def try_mark_pending(self, content_hash: str, force: bool = False) -> bool:
+        """
+        Marks the profile pending if no live job holds it and, unless force,
+        no current profile is stored. Check and mark are one conditional
+        UPDATE (or INSERT for a new hash), so of several concurrent callers
+        exactly one gets True and computes the profile.
+        """
+        now = datetime.utcnow()
+        fields = {"status": "pending", "result": None, "error": None, "version": PROFILE_VERSION, "updated_at": now}
+        query = self.db.query(ProfileRecord).filter(
+            ProfileRecord.content_hash == content_hash,
+            or_(ProfileRecord.status != "pending", ProfileRecord.updated_at < now - PENDING_TIMEOUT),
+        )
+        if not force:
+            query = query.filter(or_(ProfileRecord.status != "ready", ProfileRecord.version != PROFILE_VERSION))
+        claimed = query.update(fields, synchronize_session=False)
+        self.db.commit()
+        if claimed or self.get(content_hash) is not None:
+            return bool(claimed)
+        try:
+            self.db.add(ProfileRecord(content_hash=content_hash, **fields))
+            self.db.commit()
+            return True
+        except IntegrityError:
+            self.db.rollback()  # Another caller inserted it first
+            return False
+
+    def save_result(self, content_hash: str, result):
+        """result is the payload dict or its already encoded JSON bytes."""
+        encoded = result if isinstance(result, bytes) else dumps_json(result)
+        self._upsert(content_hash, status="ready", result=encoded.decode("utf-8"), error=None)
+
+    def save_error(self, content_hash: str, error: str):
+        self._upsert(content_hash, status="failed", result=None, error=error)
+
+    def _upsert(self, content_hash: str, **fields):
+        record = self.get(content_hash)
+        if record is None:
+            record = ProfileRecord(content_hash=content_hash)
+            self.db.add(record)
+        for name, value in fields.items():
+            setattr(record, name, value)
+        record.version = PROFILE_VERSION
+        record.updated_at = datetime.utcnow()
+        self.db.commit()
+
+
+def reset_pending_profiles():
+    """
+    Drops the pending marks of jobs lost with the previous process (jobs only
+    live in memory), so their profiles read as missing and are recomputed on
+    the next request instead of answering 202 until PENDING_TIMEOUT. Run at
+    startup, before any job of this process is queued.
+    """
+    db = SessionLocal()
+    try:
+        db.query(ProfileRecord).filter(ProfileRecord.status == "pending").delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def compute_profile(session_id: str, force: bool = False):
+    """
+    Computes and stores the profile for a session. Runs as a background task,
+    so it opens its own database session and never raises.
+    """
+    from app.services.file_service import FileService
+    from app.services.worker_pool import worker_pool
+    from app.services import analysis_tasks
+
+    db = SessionLocal()
+    try:
+        file_service = FileService(db)
+        record = file_service.get_file_record(session_id)
+        if record is None:
+            return
+        content_hash = file_service.ensure_content_hash(record)
+        store = ProfileStore(db)
+        if not store.try_mark_pending(content_hash, force):
+            return  # Already stored, or being computed by another task
+        try:
+            result = worker_pool.run_sync(
+                content_hash, analysis_tasks.run_stats_json,
+                content_hash, record.data_path, record.filename
+            )
+            store.save_result(content_hash, result)
+        except Exception as e:
+            logging.error(f"Profiling failed for session {session_id}: {e}")
+            store.save_error(content_hash, str(e))
+    finally:
+        db.close()
@@ -1,93 +1,170 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import io
-import base64
-from app.utils_json import clean_for_json
+import os
+from app.utils_json import frame_to_dict, series_to_dict, frame_to_json, join_json_object, RawJSON
+from app.services.sampling import confidence_intervals
+from app.services import correlation, metrics
 
 class Profiler:
     """
     Computes statistics and generates visualizations for a pandas DataFrame.
+
+    If df is a sample, pass its description (see sampling.draw_sample) as
+    sample: the profile then carries it with confidence intervals, and chart
+    titles say the chart was drawn from a sample.
     """
-    def __init__(self, df: pd.DataFrame):
+    def __init__(self, df: pd.DataFrame, sample: dict = None):
         self.df = df
+        self.sample = sample
+        self._heatmap_columns = None
 
+    @metrics.span("describe")
     def get_description(self) -> dict:
         """
         Returns descriptive statistics including numeric and categorical data.
         """
         # include='all' gets both numeric and categorical summaries
-        desc = self.df.describe(include='all').to_dict()
-        return clean_for_json(desc)
+        desc = self.df.describe(include='all')
+        return frame_to_dict(desc)
 
+    @metrics.span("missing")
     def get_missing_values(self) -> dict:
         """Returns count and percentage of missing values per column."""
         missing = self.df.isnull().sum()
         percent = (missing / len(self.df)) * 100
         
-        data = {
-            "count": missing.to_dict(),
-            "percentage": percent.to_dict()
+        return {
+            "count": series_to_dict(missing),
+            "percentage": series_to_dict(percent)
         }
-        return clean_for_json(data)
+
+    def get_heatmap_columns(self) -> list:
+        """Numeric columns shown in the heatmap (see correlation.heatmap_columns)."""
+        if self._heatmap_columns is None:
+            self._heatmap_columns = correlation.heatmap_columns(correlation.numeric_frame(self.df))
+        return self._heatmap_columns
+
+    @metrics.span("correlations")
+    def _correlation_frame(self) -> pd.DataFrame:
+        """
+        Correlation matrix of the numeric columns. Past
+        DENSE_CORRELATION_MAX_COLUMNS it only covers the heatmap columns; all
+        strong pairs are served by the /correlations endpoint instead.
+        """
+        numeric_df = correlation.numeric_frame(self.df)
+        if numeric_df.shape[1] > correlation.DENSE_CORRELATION_MAX_COLUMNS:
+            numeric_df = numeric_df[self.get_heatmap_columns()]
+        return numeric_df.corr()
 
     def get_correlations(self) -> dict:
         """Returns correlation matrix for numeric columns."""
-        numeric_df = self.df.select_dtypes(include=[np.number])
-        if numeric_df.empty:
+        if correlation.numeric_frame(self.df).empty:
             return {}
-        corr = numeric_df.corr().to_dict()
-        return clean_for_json(corr)
+        return frame_to_dict(self._correlation_frame())
+
+    def get_correlations_json(self) -> RawJSON:
+        """Same as get_correlations, encoded straight to JSON text."""
+        if correlation.numeric_frame(self.df).empty:
+            return RawJSON("{}")
+        return frame_to_json(self._correlation_frame())
+
+    def get_sample_info(self) -> dict:
+        """The sample description plus confidence intervals for its estimates."""
+        return {**self.sample, "confidence_intervals": confidence_intervals(self.df, self.sample)}
 
-    def generate_visualizations(self) -> dict:
+    def get_profile_json(self) -> bytes:
+        """get_profile() encoded to JSON bytes, for storing and sending as-is."""
+        parts = {
+            "description": self.get_description(),
+            "missing_values": self.get_missing_values(),
+            "correlations": self.get_correlations_json()
+        }
+        if self.sample:
+            parts["sample"] = self.get_sample_info()
+        with metrics.span("serialize"):
+            return join_json_object(parts)
+
+    def get_profile(self) -> dict:
+        """Returns the full statistics payload served by /stats."""
+        profile = {
+            "description": self.get_description(),
+            "missing_values": self.get_missing_values(),
+            "correlations": self.get_correlations()
+        }
+        if self.sample:
+            profile["sample"] = self.get_sample_info()
+        return profile
+
+    def plan_visualizations(self) -> list[dict]:
         """
-        Generates base64 encoded strings for various plots.
+        Lists the charts to draw for this DataFrame. Each spec names the chart,
+        its type and the columns it needs, so it can be rendered on its own.
         """
-        plots = {}
-        
-        # Ensure we use a non-GUI backend
-        plt.switch_backend('Agg')
-        
+        specs = []
         numeric_columns = self.df.select_dtypes(include=[np.number]).columns.tolist()
-        # Limit to top 5 numeric columns to avoid overwhelming the UI/Backend
-        target_numeric = numeric_columns[:5] 
-        
+
         # 1. Histogram (Distribution of numeric cols)
-        for col in target_numeric:
-            plt.figure(figsize=(6, 4))
-            sns.histplot(self.df[col].dropna(), kde=True)
-            plt.title(f'Distribution of {col}')
-            plots[f'hist_{col}'] = self._plot_to_base64()
-            plt.close()
-
-        # 2. Correlation Heatmap
+        # Limit to top 5 numeric columns to avoid overwhelming the UI/Backend
+        for col in numeric_columns[:5]:
+            specs.append({"name": f"hist_{col}", "type": "hist", "columns": [col]})
+
+        # 2. Correlation Heatmap (strongest pairs only on wide data, clustered)
         if len(numeric_columns) > 1:
-            plt.figure(figsize=(8, 6))
-            corr = self.df[numeric_columns].corr()
-            sns.heatmap(corr, annot=True, cmap='coolwarm', fmt=".2f")
-            plt.title('Correlation Heatmap')
-            plots['correlation_heatmap'] = self._plot_to_base64()
-            plt.close()
+            specs.append({"name": "correlation_heatmap", "type": "heatmap", "columns": self.get_heatmap_columns()})
 
         # 3. Bar Chart for Categorical Data (Top 1 categorical col)
-        cat_columns = self.df.select_dtypes(include=['object', 'category']).columns.tolist()
+        cat_columns = self.df.select_dtypes(include=['object', 'category', 'string']).columns.tolist()
         if cat_columns:
             col = cat_columns[0]
+            specs.append({"name": f"bar_{col}", "type": "bar", "columns": [col]})
+
+        if self.sample:
+            # Part of the chart cache key, so sampled charts never replace exact ones
+            sample = {k: self.sample[k] for k in ("method", "size", "stratify_by", "seed")}
+            for spec in specs:
+                spec["sample"] = sample
+
+        return specs
+
+    @metrics.span("render")
+    def render_visualization(self, spec: dict, path: str):
+        """
+        Renders one planned chart to a PNG file. Uses the object-oriented
+        Figure API rather than global pyplot state, so it is safe to call
+        from several threads or processes at once.
+        """
+        import seaborn as sns
+        from matplotlib.figure import Figure
+
+        if spec["type"] == "hist":
+            col = spec["columns"][0]
+            fig = Figure(figsize=(6, 4))
+            ax = fig.subplots()
+            sns.histplot(self.df[col].dropna(), kde=True, ax=ax)
+            ax.set_title(f'Distribution of {col}')
+        elif spec["type"] == "heatmap":
+            fig = Figure(figsize=(8, 6))
+            ax = fig.subplots()
+            corr = self.df[spec["columns"]].corr()
+            # Cell labels become unreadable past a dozen columns
+            annotate = len(spec["columns"]) <= correlation.ANNOTATE_MAX_COLUMNS
+            sns.heatmap(corr, annot=annotate, cmap='coolwarm', fmt=".2f", vmin=-1, vmax=1, ax=ax)
+            ax.set_title('Correlation Heatmap')
+        elif spec["type"] == "bar":
+            col = spec["columns"][0]
             top_counts = self.df[col].value_counts().head(10)
-            plt.figure(figsize=(8, 5))
-            sns.barplot(x=top_counts.values, y=top_counts.index)
-            plt.title(f'Top Categories in {col}')
-            plots[f'bar_{col}'] = self._plot_to_base64()
-            plt.close()
-
-        return plots
-
-    def _plot_to_base64(self) -> str:
-        """Helper to convert current matplotlib plot to base64 string."""
-        buf = io.BytesIO()
-        plt.tight_layout()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        img_str = base64.b64encode(buf.read()).decode('utf-8')
-        return f"data:image/png;base64,{img_str}"
+            fig = Figure(figsize=(8, 5))
+            ax = fig.subplots()
+            sns.barplot(x=top_counts.values, y=top_counts.index.astype(str), ax=ax)
+            ax.set_title(f'Top Categories in {col}')
+        else:
+            raise ValueError(f"Unknown chart type: {spec['type']}")
+
+        if spec.get("sample"):
+            ax.set_title(f"{ax.get_title()} (sample of {len(self.df):,} rows)")
+
+        fig.tight_layout()
+        # Write to a temporary name first so readers never see a partial PNG
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fig.savefig(tmp_path, format='png')
+        os.replace(tmp_path, path)
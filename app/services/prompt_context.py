@@ -0,0 +1,162 @@
+"""
+Compact, token-budgeted text renderings of the statistics sent to the AI.
+
+Columns are ranked by how much they are likely to say about the data (gaps,
+spread, skew, category balance), written one per line with numbers rounded
+to a few significant digits, and added until the token budget is used up.
+"""
+import math
+import os
+
+# Approximate tokens the data part of a prompt may use
+AI_PROMPT_TOKEN_BUDGET = int(os.getenv("AI_PROMPT_TOKEN_BUDGET", "2000"))
+# Rough size of a token in English/JSON-ish text
+CHARS_PER_TOKEN = 4
+# Longest text value (category name, note) kept verbatim
+MAX_TEXT_CHARS = 40
+
+# Order in which describe() statistics are written
+STAT_ORDER = ["count", "unique", "top", "freq", "mean", "std", "min", "25%", "50%", "75%", "max"]
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def format_value(value) -> str:
+    """Short text for one value: 4 significant digits, clipped strings."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NA"
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() and abs(value) < 1e6 else f"{value:.4g}"
+    text = str(value)
+    return text if len(text) <= MAX_TEXT_CHARS else text[:MAX_TEXT_CHARS - 1] + "…"
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value) else None
+
+
+def column_score(stats: dict, rows: int) -> float:
+    """
+    Heuristic informativeness of one column's describe() stats: missing
+    share, relative spread, tail length and category balance add up;
+    constant and identifier-like columns score lowest.
+    """
+    count = _number(stats.get("count")) or 0
+    score = 1 - count / rows if rows else 0.0  # gaps are worth mentioning
+
+    std, mean = _number(stats.get("std")), _number(stats.get("mean"))
+    if std is not None:
+        if std == 0:
+            return score
+        score += min(std / (abs(mean) + 1e-12), 5.0) / 5.0 if mean is not None else 0.5
+        q1, q3, top = _number(stats.get("25%")), _number(stats.get("75%")), _number(stats.get("max"))
+        if None not in (q1, q3, top) and q3 > q1:
+            score += min((top - q3) / (q3 - q1), 10.0) / 10.0  # long right tail / outliers
+        return score + 0.5
+
+    unique = _number(stats.get("unique"))
+    if unique is not None:
+        if unique <= 1:
+            return score
+        if count and unique >= count:
+            return score + 0.1  # identifier-like
+        freq = _number(stats.get("freq")) or 0
+        dominance = freq / count if count else 1.0
+        return score + (1 - dominance) + 0.3
+    return score + 0.2
+
+
+def _fit(lines: list, budget_tokens: int, what: str = "columns") -> str:
+    """Joins ranked lines until the budget is reached, noting what was left out."""
+    kept, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget_tokens and kept:
+            break
+        kept.append(line)
+        used += cost
+    omitted = len(lines) - len(kept)
+    if omitted:
+        kept.append(f"({omitted} more {what} omitted as less informative)")
+    return "\n".join(kept)
+
+
+def _stats_line(name: str, stats: dict, rows: int) -> str:
+    parts = [f"{stat}={format_value(stats[stat])}" for stat in STAT_ORDER
+             if stat in stats and stats[stat] is not None]
+    count = _number(stats.get("count"))
+    if rows and count is not None and count < rows:
+        parts.append(f"missing={format_value(100 * (1 - count / rows))}%")
+    return f"{name}: " + " ".join(parts)
+
+
+def describe_context(description: dict, budget_tokens: int) -> str:
+    """describe() output ({column: {stat: value}}), most informative columns first."""
+    columns = {name: stats for name, stats in description.items() if isinstance(stats, dict)}
+    notes = [f"{name}: {format_value(value)}" for name, value in description.items() if not isinstance(value, dict)]
+    rows = max((_number(s.get("count")) or 0 for s in columns.values()), default=0)
+    ranked = sorted(columns, key=lambda name: column_score(columns[name], rows), reverse=True)
+    lines = notes + [_stats_line(name, columns[name], rows) for name in ranked]
+    header = f"{len(columns)} columns, {format_value(rows)} rows" if columns else ""
+    return "\n".join(filter(None, [header, _fit(lines, budget_tokens)]))
+
+
+def missing_context(missing: dict, budget_tokens: int) -> str:
+    """Missing-value profile ({"count": ..., "percentage": ...}), worst columns first."""
+    counts = missing.get("count", {})
+    percentages = missing.get("percentage", {})
+    gaps = sorted((name for name, n in counts.items() if n), key=lambda name: percentages.get(name) or 0, reverse=True)
+    complete = len(counts) - len(gaps)
+    lines = [
+        f"{name}: {format_value(counts[name])} missing"
+        + (f" ({format_value(percentages[name])}%)" if percentages.get(name) is not None else "")
+        for name in gaps
+    ]
+    summary = f"{len(gaps)} of {len(counts)} columns have missing values; {complete} are complete."
+    return summary + ("\n" + _fit(lines, budget_tokens) if lines else "")
+
+
+def correlation_context(matrix: dict, budget_tokens: int) -> str:
+    """Correlation matrix ({col: {col: r}}) as its strongest pairs."""
+    pairs = {}
+    for a, row in matrix.items():
+        for b, r in (row or {}).items():
+            if a != b and _number(r) is not None and (b, a) not in pairs:
+                pairs[(a, b)] = r
+    ranked = sorted(pairs.items(), key=lambda item: abs(item[1]), reverse=True)
+    lines = [f"{a} ~ {b}: r={format_value(r)}" for (a, b), r in ranked]
+    return _fit(lines, budget_tokens, what="pairs")
+
+
+def build_context(data: dict, prompt_type: str, budget_tokens: int = AI_PROMPT_TOKEN_BUDGET) -> str:
+    """The data part of a prompt of the given type, within budget_tokens."""
+    if prompt_type == "overview":
+        # The dashboard sends describe() output; the batch endpoint wraps it with columns/missing
+        batch_shape = isinstance(data.get("columns"), list)
+        description = data.get("description", {}) if batch_shape else data
+        parts = [describe_context(description, budget_tokens * 3 // 4)]
+        missing = data.get("missing_values") if batch_shape else None
+        if missing:
+            # The missing-value profile, or just its counts (without percentages)
+            missing = missing if isinstance(missing.get("count"), dict) else {"count": missing}
+            parts.append("Missing values: " + missing_context(missing, budget_tokens // 4))
+        return "\n".join(parts)
+    if prompt_type == "stats":
+        return describe_context(data, budget_tokens)
+    if prompt_type == "missing":
+        return missing_context(data, budget_tokens)
+    if prompt_type == "visualization":
+        stats = data.get("stats", {})
+        if stats and all(isinstance(v, dict) for v in stats.values()):
+            return correlation_context(stats, budget_tokens)
+        return _stats_line(data.get("column", "column"), stats, 0)
+    # Unknown prompt types: whatever fits of the flat text
+    text = str(data)
+    limit = budget_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:limit] + " …"
@@ -0,0 +1,244 @@
+"""
+Filter / project / group-by queries over a session's data.
+
+A query is a dict (see QueryRequest): filters ANDed together, then either a
+projection of columns or group-by keys with aggregates, then ordering and a
+row limit. Everything runs as vectorized pandas/NumPy operations over only
+the columns the query references. normalize_query() puts equivalent queries
+in one canonical form, which is what results are cached under.
+"""
+from __future__ import annotations
+import os
+import time
+from app.lazy import lazy_module
+from app.utils_json import frame_to_records
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+# Bump when results change, so cached query results are recomputed
+QUERY_VERSION = 1
+
+DEFAULT_QUERY_ROWS = 1000
+MAX_QUERY_ROWS = 10_000
+MAX_FILTER_VALUES = 1000
+# Seconds a query may run before the caller gets a 504 and the worker gives up on it
+QUERY_TIMEOUT = float(os.getenv("QUERY_TIMEOUT", "30"))
+
+OPERATORS = ("eq", "ne", "lt", "le", "gt", "ge", "in", "not_in", "between", "is_null", "not_null", "contains")
+OPERATOR_ALIASES = {"=": "eq", "==": "eq", "!=": "ne", "<": "lt", "<=": "le", ">": "gt", ">=": "ge"}
+AGGREGATES = ("count", "size", "sum", "mean", "median", "min", "max", "std", "nunique")
+
+
+class QueryError(ValueError):
+    """Raised for queries that do not fit the API or the data."""
+
+
+class QueryTimeout(Exception):
+    """Raised between stages of a query that ran past its deadline."""
+
+
+def _check_deadline(deadline, stage: str):
+    if deadline is not None and time.time() > deadline:
+        raise QueryTimeout(f"Query ran past its deadline before {stage}")
+
+
+def _sort_key(value):
+    return type(value).__name__, str(value)
+
+
+def _normalize_filter(f: dict) -> dict:
+    column, op, value = f.get("column"), f.get("op", "eq"), f.get("value")
+    op = OPERATOR_ALIASES.get(op, op)
+    if not column:
+        raise QueryError("Every filter needs a column")
+    if op not in OPERATORS:
+        raise QueryError(f"Unknown filter operator: {op}")
+    if op in ("is_null", "not_null"):
+        value = None
+    elif op in ("in", "not_in"):
+        if not isinstance(value, list) or not 0 < len(value) <= MAX_FILTER_VALUES:
+            raise QueryError(f"'{op}' needs a list of 1 to {MAX_FILTER_VALUES} values")
+        value = sorted(set(value), key=_sort_key)
+    elif op == "between":
+        if not isinstance(value, list) or len(value) != 2:
+            raise QueryError("'between' needs a [low, high] pair")
+    elif op == "contains":
+        if not isinstance(value, str):
+            raise QueryError("'contains' needs a string")
+    elif value is None or isinstance(value, (list, dict)):
+        raise QueryError(f"'{op}' needs a single value; use is_null / not_null for missing values")
+    return {"column": column, "op": op, "value": value}
+
+
+def normalize_query(query: dict) -> dict:
+    """
+    Validates a query and returns its canonical form: operator aliases
+    resolved, filters and 'in' lists sorted, duplicates dropped, aggregate
+    names filled in. Raises QueryError on bad input.
+    """
+    filters = [_normalize_filter(f) for f in query.get("filters") or []]
+    filters = sorted({repr(f): f for f in filters}.values(), key=repr)
+    group_by = list(dict.fromkeys(query.get("group_by") or []))
+    select = list(dict.fromkeys(query.get("select") or [])) or None
+
+    aggregates = []
+    for agg in query.get("aggregates") or []:
+        fn, column = agg.get("fn"), agg.get("column")
+        if fn not in AGGREGATES:
+            raise QueryError(f"Unknown aggregate: {fn}")
+        if fn == "size":
+            column = None
+        elif not column:
+            raise QueryError(f"Aggregate '{fn}' needs a column")
+        elif column in group_by:
+            raise QueryError(f"Cannot aggregate the group_by key {column}")
+        name = agg.get("name") or (f"{fn}_{column}" if column else "count")
+        aggregates.append({"fn": fn, "column": column, "name": name})
+    if group_by and not aggregates:
+        aggregates = [{"fn": "size", "column": None, "name": "count"}]
+    if aggregates and select:
+        raise QueryError("select cannot be combined with aggregates; the group_by keys are returned with them")
+    names = group_by + [agg["name"] for agg in aggregates]
+    if len(set(names)) != len(names):
+        raise QueryError("Aggregate names must be unique and differ from the group_by keys")
+
+    order_by = [{"column": o["column"], "desc": bool(o.get("desc", False))} for o in query.get("order_by") or []]
+    if aggregates:
+        unknown = [o["column"] for o in order_by if o["column"] not in names]
+        if unknown:
+            raise QueryError(f"order_by must name result columns: {', '.join(unknown)}")
+
+    limit = query.get("limit") or DEFAULT_QUERY_ROWS
+    if not 0 < limit <= MAX_QUERY_ROWS:
+        raise QueryError(f"limit must be between 1 and {MAX_QUERY_ROWS}")
+    return {
+        "select": select,
+        "filters": filters,
+        "group_by": group_by,
+        "aggregates": aggregates,
+        "order_by": order_by,
+        "limit": int(limit),
+    }
+
+
+def referenced_columns(query: dict):
+    """Source columns a normalized query reads, or None for all of them (a plain select *)."""
+    if query["select"] is None and not query["aggregates"]:
+        return None
+    columns = (query["select"] or []) + [f["column"] for f in query["filters"]] + query["group_by"]
+    columns += [agg["column"] for agg in query["aggregates"] if agg["column"]]
+    if not query["aggregates"]:
+        columns += [o["column"] for o in query["order_by"]]
+    return list(dict.fromkeys(columns))
+
+
+def _comparable(series: pd.Series) -> pd.Series:
+    """Unordered categoricals cannot be compared with < and >; their values can."""
+    if isinstance(series.dtype, pd.CategoricalDtype) and not series.cat.ordered:
+        return series.astype(series.cat.categories.dtype)
+    return series
+
+
+def _filter_mask(series: pd.Series, op: str, value) -> np.ndarray:
+    if op == "is_null":
+        return series.isna().to_numpy()
+    if op == "not_null":
+        return series.notna().to_numpy()
+    if op == "in":
+        return series.isin(value).to_numpy()
+    if op == "not_in":
+        return (~series.isin(value) & series.notna()).to_numpy()
+    if op == "contains":
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Test each category once instead of every row
+            hits = series.cat.categories.astype(str).str.contains(value, regex=False)
+            return np.isin(series.cat.codes.to_numpy(), np.flatnonzero(hits))
+        return series.astype("str").str.contains(value, regex=False, na=False).to_numpy()
+    if op == "eq":
+        return (series == value).fillna(False).to_numpy(dtype=bool)
+    if op == "ne":
+        return ((series != value) & series.notna()).to_numpy(dtype=bool)
+    series = _comparable(series)
+    if op == "between":
+        mask = (series >= value[0]) & (series <= value[1])
+    else:
+        mask = {"lt": series.__lt__, "le": series.__le__, "gt": series.__gt__, "ge": series.__ge__}[op](value)
+    return mask.fillna(False).to_numpy(dtype=bool)
+
+
+def _aggregate(df: pd.DataFrame, query: dict) -> pd.DataFrame:
+    if not query["group_by"]:
+        row = {}
+        for agg in query["aggregates"]:
+            row[agg["name"]] = len(df) if agg["fn"] == "size" else df[agg["column"]].agg(agg["fn"])
+        return pd.DataFrame([row])
+    grouped = df.groupby(query["group_by"], observed=True, dropna=False, sort=not query["order_by"])
+    named = {
+        agg["name"]: (query["group_by"][0], "size") if agg["fn"] == "size" else (agg["column"], agg["fn"])
+        for agg in query["aggregates"]
+    }
+    return grouped.agg(**named).reset_index()
+
+
+def _selectable(series: pd.Series) -> bool:
+    """Whether nsmallest/nlargest work on the series (plain numbers and dates)."""
+    return (pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)) \
+        or pd.api.types.is_datetime64_any_dtype(series)
+
+
+def run_query(df: pd.DataFrame, query: dict, deadline: float = None) -> dict:
+    """
+    Runs a normalized query over df, which holds at least the referenced
+    columns. Returns {"columns", "rows", "matched_rows", "total_rows",
+    "truncated"}; total_rows counts result rows before the limit. Past
+    deadline (a time.time() value) it raises QueryTimeout at the next stage.
+    """
+    unknown = [c for c in referenced_columns(query) or [] if c not in df.columns]
+    if unknown:
+        raise QueryError(f"Unknown columns: {', '.join(unknown)}")
+
+    _check_deadline(deadline, "filtering")
+    if query["filters"]:
+        mask = np.ones(len(df), dtype=bool)
+        for f in query["filters"]:
+            try:
+                mask &= _filter_mask(df[f["column"]], f["op"], f["value"])
+            except (TypeError, ValueError) as e:
+                raise QueryError(f"Cannot apply {f['op']} {f['value']!r} to column {f['column']}: {e}")
+        df = df[mask]
+    matched = len(df)
+
+    _check_deadline(deadline, "grouping")
+    if query["aggregates"]:
+        try:
+            result = _aggregate(df, query)
+        except (KeyError, TypeError, ValueError) as e:
+            raise QueryError(f"Cannot aggregate: {e}")
+    else:
+        result = df[query["select"]] if query["select"] else df
+        unknown = [o["column"] for o in query["order_by"] if o["column"] not in result.columns]
+        if unknown:
+            raise QueryError(f"Unknown columns: {', '.join(unknown)}")
+
+    total = len(result)
+    limit = query["limit"]
+    if query["order_by"]:
+        _check_deadline(deadline, "sorting")
+        by = [o["column"] for o in query["order_by"]]
+        ascending = [not o["desc"] for o in query["order_by"]]
+        series = result[by[0]]
+        if total > limit and len(by) == 1 and _selectable(series) and series.count() >= limit:
+            # Only the top rows are returned, so skip sorting the rest
+            top = series.nsmallest(limit) if ascending[0] else series.nlargest(limit)
+            result = result.loc[top.index]
+        else:
+            result = result.sort_values(by, ascending=ascending, kind="stable")
+    result = result.head(limit)
+    return {
+        "columns": [str(c) for c in result.columns],
+        "rows": frame_to_records(result),
+        "matched_rows": matched,
+        "total_rows": total,
+        "truncated": total > limit,
+    }
@@ -0,0 +1,35 @@
+import os
+import json
+import hashlib
+from app.services import metrics
+from app.services.file_service import STORAGE_DIR
+
+# Encoded analysis results, one directory per stored content (content hash)
+RESULT_DIR = os.path.join(STORAGE_DIR, "results")
+os.makedirs(RESULT_DIR, exist_ok=True)
+
+
+def result_path(key: str, name: str, params: dict) -> str:
+    """Cache file for result name of the content key computed with params."""
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return os.path.join(RESULT_DIR, key, f"{name}-{digest}.json")
+
+
+def load_result(key: str, name: str, params: dict):
+    """Returns the cached JSON bytes, or None."""
+    try:
+        with open(result_path(key, name, params), "rb") as f:
+            payload = f.read()
+    except OSError:
+        payload = None
+    return metrics.cache_lookup(name, payload)
+
+
+def save_result(key: str, name: str, params: dict, payload: bytes):
+    path = result_path(key, name, params)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary name first so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
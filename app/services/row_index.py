@@ -0,0 +1,154 @@
+from __future__ import annotations
+import io
+import os
+import json
+from app.lazy import lazy_module
+from app.services.schema import SCHEMA_SAMPLE_ROWS, infer_schema, apply_schema
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+# A byte offset is recorded for every ROW_INDEX_STRIDE-th data row
+ROW_INDEX_STRIDE = 1000
+SCAN_BLOCK_SIZE = 16 * 1024 * 1024
+
+QUOTE = ord('"')
+NEWLINE = ord('\n')
+CARRIAGE_RETURN = ord('\r')
+
+
+def row_index_path(filepath: str) -> str:
+    return os.path.splitext(filepath)[0] + ".rowidx.npz"
+
+
+def has_row_index(filepath: str) -> bool:
+    path = row_index_path(filepath)
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(filepath)
+
+
+def supports_row_index(filename: str) -> bool:
+    return filename.lower().endswith(('.csv', '.tsv'))
+
+
+def scan_record_starts(filepath: str, start: int = 0, end: int = None):
+    """
+    Yields arrays of byte offsets where CSV records start, in order.
+
+    Newlines inside double-quoted fields are not record boundaries: quote
+    parity is tracked with a running count (an escaped "" toggles twice).
+    Empty lines are skipped, like pandas' skip_blank_lines. The scan must
+    start at a record boundary. Yields the first record (usually the header)
+    too.
+    """
+    end = os.path.getsize(filepath) if end is None else end
+    in_quotes = 0
+    record_start = start  # start of the record currently being read
+    prev_byte = None
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            block = np.frombuffer(f.read(min(SCAN_BLOCK_SIZE, end - pos)), dtype=np.uint8)
+            if len(block) == 0:
+                break
+            parity = (np.cumsum(block == QUOTE) + in_quotes) % 2
+            newlines = np.flatnonzero((block == NEWLINE) & (parity == 0)) + pos
+
+            if len(newlines):
+                starts = np.concatenate([[record_start], newlines[:-1] + 1])
+                lengths = newlines - starts
+                # Byte before each newline, to spot "\r\n" blank lines
+                before = np.empty(len(newlines), dtype=np.int64)
+                local = newlines - pos - 1
+                inside = local >= 0
+                before[inside] = block[local[inside]]
+                before[~inside] = -1 if prev_byte is None else prev_byte
+                blank = (lengths == 0) | ((lengths == 1) & (before == CARRIAGE_RETURN))
+                yield starts[~blank]
+                record_start = int(newlines[-1]) + 1
+
+            in_quotes = int(parity[-1])
+            prev_byte = int(block[-1])
+            pos += len(block)
+
+    # Last record without a trailing newline
+    if record_start < end:
+        yield np.array([record_start])
+
+
+def build_row_index(filepath: str):
+    """
+    Scans a CSV/TSV once and stores a sparse index of row byte offsets next to
+    it. No-op if an up-to-date index already exists (shared blob).
+    """
+    if has_row_index(filepath):
+        return
+    offsets = []
+    seen_header = False
+    header_end = None  # byte offset of the first data row
+    rows = 0
+    for starts in scan_record_starts(filepath):
+        if not seen_header:
+            seen_header = True
+            starts = starts[1:]
+        if header_end is None and len(starts):
+            header_end = int(starts[0])
+        # Data row numbers of this batch are rows .. rows + len(starts) - 1
+        row_numbers = np.arange(rows, rows + len(starts))
+        offsets.append(starts[row_numbers % ROW_INDEX_STRIDE == 0])
+        rows += len(starts)
+
+    if header_end is None:
+        header_end = os.path.getsize(filepath)
+
+    # Pages are typed like the full dataset, so they need the schema inferred from its head
+    sep = '\t' if filepath.lower().endswith('.tsv') else ','
+    schema = infer_schema(pd.read_csv(filepath, sep=sep, nrows=SCHEMA_SAMPLE_ROWS))
+
+    path = row_index_path(filepath)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(
+        tmp_path,
+        offsets=np.concatenate(offsets) if offsets else np.empty(0, dtype=np.int64),
+        header_end=header_end,
+        rows=rows,
+        stride=ROW_INDEX_STRIDE,
+        schema=json.dumps(schema),
+    )
+    os.replace(tmp_path, path)
+
+
+def read_rows(filepath: str, filename: str, offset: int, limit: int, columns: list = None) -> tuple[pd.DataFrame, int]:
+    """
+    Reads rows [offset, offset + limit) by seeking to the nearest indexed
+    offset and parsing only that window, typed with the stored schema.
+    Returns (rows, total row count).
+    """
+    with np.load(row_index_path(filepath)) as index:
+        offsets = index["offsets"]
+        header_end = int(index["header_end"])
+        total_rows = int(index["rows"])
+        stride = int(index["stride"])
+        schema = json.loads(str(index["schema"])) if "schema" in index.files else {}
+
+    sep = '\t' if filename.lower().endswith('.tsv') else ','
+    with open(filepath, "rb") as f:
+        header = f.read(header_end)
+        if offset >= total_rows or limit <= 0:
+            window = b""
+            skip = 0
+        else:
+            block = offset // stride
+            skip = offset - block * stride
+            end_block = -(-(offset + limit) // stride)  # ceil
+            start_byte = int(offsets[block])
+            end_byte = int(offsets[end_block]) if end_block < len(offsets) else os.path.getsize(filepath)
+            f.seek(start_byte)
+            window = f.read(end_byte - start_byte)
+
+    if not header.endswith(b"\n"):
+        header += b"\n"
+    # skiprows counts physical lines, which differ from records once a quoted
+    # field spans lines, so parse the leading rows of the block and drop them
+    df = pd.read_csv(io.BytesIO(header + window), sep=sep, usecols=columns, nrows=skip + limit)
+    return apply_schema(df.iloc[skip:].reset_index(drop=True), schema), total_rows
@@ -0,0 +1,217 @@
+from __future__ import annotations
+import math
+import os
+from app.lazy import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+# Rows drawn when neither a sample size nor a target error is given
+DEFAULT_SAMPLE_SIZE = int(os.getenv("SAMPLE_SIZE", "50000"))
+MAX_SAMPLE_SIZE = 1_000_000
+# Stratified sampling keeps a reservoir per stratum, so their number is capped
+MAX_STRATA = 50
+CONFIDENCE = 0.95
+Z_SCORE = 1.959963984540054  # two-sided 95%
+
+SAMPLE_METHODS = ("reservoir", "stratified")
+
+
+class SamplingError(ValueError):
+    """Raised for sampling parameters that do not fit the request or the data."""
+
+
+def sample_size_for_error(target_error: float) -> int:
+    """
+    Rows needed for a 95% confidence interval of half-width target_error,
+    in standard deviations for means (z / sqrt(n)). Proportions such as
+    missing-value rates then stay within target_error too.
+    """
+    return math.ceil((Z_SCORE / target_error) ** 2)
+
+
+def normalize_options(method: str = "reservoir", size: int = None, target_error: float = None,
+                      stratify_by: str = None, seed: int = 0) -> dict:
+    """Validates sampling parameters. Raises SamplingError on bad input."""
+    if method not in SAMPLE_METHODS:
+        raise SamplingError(f"Unknown sample method: {method}")
+    if method == "stratified" and not stratify_by:
+        raise SamplingError("Stratified sampling needs a stratify_by column")
+    if target_error is not None:
+        if not 0 < target_error < 1:
+            raise SamplingError("target_error must be between 0 and 1")
+        size = max(size or 0, sample_size_for_error(target_error))
+    size = size or DEFAULT_SAMPLE_SIZE
+    if not 0 < size <= MAX_SAMPLE_SIZE:
+        raise SamplingError(f"Sample size must be between 1 and {MAX_SAMPLE_SIZE}")
+    return {
+        "method": method,
+        "size": int(size),
+        "stratify_by": stratify_by if method == "stratified" else None,
+        "seed": int(seed),
+    }
+
+
+class Sample:
+    """A drawn sample and its description, cacheable like a Dataset."""
+    def __init__(self, df: pd.DataFrame, meta: dict):
+        self.df = df
+        self.meta = meta
+
+    def get_dataframe(self) -> pd.DataFrame:
+        return self.df
+
+
+def _smallest_keys(keys: np.ndarray, n: int) -> np.ndarray:
+    """Positions of the n smallest keys, in their original order."""
+    if len(keys) <= n:
+        return np.arange(len(keys))
+    return np.sort(np.argpartition(keys, n)[:n])
+
+
+def _concat(frames: list) -> pd.DataFrame:
+    """
+    Concatenates sample parts. Chunks typed one at a time have categoricals
+    with different categories, which pandas would turn back into strings.
+    """
+    df = pd.concat(frames, ignore_index=True)
+    for col in df.columns:
+        if not isinstance(df[col].dtype, pd.CategoricalDtype) \
+                and any(isinstance(f[col].dtype, pd.CategoricalDtype) for f in frames if col in f.columns):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def reservoir_sample(chunks, size: int, seed: int = 0) -> tuple[pd.DataFrame, int]:
+    """
+    Uniform sample of up to size rows in one pass over DataFrame chunks.
+    Each row gets a random key and the rows with the smallest keys are kept,
+    so chunks are filtered against the current cut-off before concatenating.
+    Returns (sample, population rows).
+    """
+    rng = np.random.default_rng(seed)
+    kept, kept_keys = None, np.empty(0)
+    population = 0
+    for chunk in chunks:
+        population += len(chunk)
+        keys = rng.random(len(chunk))
+        if kept is not None and len(kept) >= size:
+            selected = keys < kept_keys.max()
+            chunk, keys = chunk[selected], keys[selected]
+        if kept is not None:
+            chunk = _concat([kept, chunk])
+            keys = np.concatenate([kept_keys, keys])
+        positions = _smallest_keys(keys, size)
+        kept = chunk.iloc[positions].reset_index(drop=True)
+        kept_keys = keys[positions]
+    return (kept if kept is not None else pd.DataFrame()), population
+
+
+def stratified_sample(chunks, size: int, column: str, seed: int = 0) -> tuple[pd.DataFrame, int, dict]:
+    """
+    Proportionally allocated stratified sample by the values of column, in one
+    pass. A random-key reservoir is kept per stratum; at the end each stratum
+    gets round(size * N_h / N) rows (at least one). Returns (sample,
+    population rows, {stratum: {"population", "sample"}}).
+    """
+    rng = np.random.default_rng(seed)
+    reservoirs = {}  # stratum -> (rows, keys)
+    counts = {}
+    population = 0
+    for chunk in chunks:
+        if column not in chunk.columns:
+            raise SamplingError(f"Column not found: {column}")
+        population += len(chunk)
+        keys = rng.random(len(chunk))
+        for value, positions in chunk.groupby(column, dropna=False, sort=False).indices.items():
+            stratum = str(value)
+            if stratum not in counts and len(counts) >= MAX_STRATA:
+                raise SamplingError(f"Column {column} has more than {MAX_STRATA} distinct values to stratify by")
+            counts[stratum] = counts.get(stratum, 0) + len(positions)
+            rows, row_keys = chunk.iloc[positions], keys[positions]
+            if stratum in reservoirs:
+                rows = _concat([reservoirs[stratum][0], rows])
+                row_keys = np.concatenate([reservoirs[stratum][1], row_keys])
+            keep = _smallest_keys(row_keys, size)
+            reservoirs[stratum] = (rows.iloc[keep].reset_index(drop=True), row_keys[keep])
+
+    strata = {}
+    parts = []
+    for stratum, (rows, row_keys) in reservoirs.items():
+        allocated = min(counts[stratum], max(1, round(size * counts[stratum] / population)))
+        parts.append(rows.iloc[_smallest_keys(row_keys, allocated)])
+        strata[stratum] = {"population": counts[stratum], "sample": allocated}
+    sample = _concat(parts) if parts else pd.DataFrame()
+    return sample, population, strata
+
+
+def draw_sample(chunks, options: dict) -> Sample:
+    """Draws a sample as described by normalize_options() from DataFrame chunks."""
+    meta = dict(options)
+    if options["method"] == "stratified":
+        df, population, strata = stratified_sample(chunks, options["size"], options["stratify_by"], options["seed"])
+        meta["strata"] = strata
+    else:
+        df, population = reservoir_sample(chunks, options["size"], options["seed"])
+    meta["size"] = len(df)
+    meta["population_rows"] = population
+    meta["fraction"] = len(df) / population if population else 1.0
+    meta["confidence"] = CONFIDENCE
+    return Sample(df, meta)
+
+
+def _interval(estimate: pd.Series, se: pd.Series, scale: float = 1.0) -> dict:
+    half = Z_SCORE * se
+    return {
+        col: {
+            "estimate": None if pd.isna(estimate[col]) else float(estimate[col]) * scale,
+            "standard_error": None if pd.isna(se[col]) else float(se[col]) * scale,
+            "lower": None if pd.isna(half[col]) else float(estimate[col] - half[col]) * scale,
+            "upper": None if pd.isna(half[col]) else float(estimate[col] + half[col]) * scale,
+        }
+        for col in estimate.index
+    }
+
+
+def _mean_estimates(values: pd.DataFrame, meta: dict) -> tuple[pd.Series, pd.Series]:
+    """
+    Estimated population means and standard errors per column, with the
+    finite population correction; stratified samples use the stratified
+    estimator sum(W_h * mean_h).
+    """
+    population = meta["population_rows"]
+    if meta.get("strata"):
+        groups = values.groupby(meta["_strata_labels"], sort=False)
+        means, variances, counts = groups.mean(), groups.var().fillna(0.0), groups.count()
+        sizes = pd.Series({s: info["population"] for s, info in meta["strata"].items()}).reindex(means.index)
+        weights = (sizes / population).to_numpy()[:, None]
+        fpc = (1 - counts.div(sizes, axis=0)).clip(lower=0)
+        # Strata with no observed value for a column drop out, re-weighting the rest
+        observed = counts > 0
+        w = observed * weights
+        w = w / w.sum()
+        estimate = (w * means.fillna(0.0)).sum()
+        variance = (w ** 2 * variances * fpc / counts.where(observed)).sum()
+        return estimate, np.sqrt(variance)
+
+    counts = values.count()
+    fpc = 1 - meta["size"] / population if population else 0.0
+    se = np.sqrt(values.var() / counts.where(counts > 0) * max(fpc, 0.0))
+    return values.mean(), se
+
+
+def confidence_intervals(df: pd.DataFrame, meta: dict) -> dict:
+    """
+    95% confidence intervals for the population mean of each numeric column
+    and for the missing-value percentage of every column.
+    """
+    meta = dict(meta)
+    if meta.get("strata"):
+        meta["_strata_labels"] = df[meta["stratify_by"]].astype(object).map(str).to_numpy()
+    numeric = df.select_dtypes(include=[np.number]).select_dtypes(exclude=["bool"])
+    mean_estimate, mean_se = _mean_estimates(numeric.astype(float), meta)
+    missing_estimate, missing_se = _mean_estimates(df.isna().astype(float), meta)
+    return {
+        "mean": _interval(mean_estimate, mean_se),
+        "missing_percentage": _interval(missing_estimate, missing_se, scale=100.0),
+    }
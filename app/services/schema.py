@@ -0,0 +1,130 @@
+from __future__ import annotations
+import os
+from app.lazy import lazy_module
+
+np = lazy_module("numpy")
+pd = lazy_module("pandas")
+
+# Rows read to infer the schema before the full parse
+SCHEMA_SAMPLE_ROWS = 10_000
+# Text columns repeating values at least this much become categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+# Store non-integer floats as float32, halving their memory. Off by default:
+# float32 keeps about 7 significant digits, so statistics can shift slightly
+DOWNCAST_FLOATS = os.getenv("DOWNCAST_FLOATS", "0") == "1"
+
+
+def _is_text(series: pd.Series) -> bool:
+    return pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+
+
+def infer_schema(sample: pd.DataFrame) -> dict:
+    """
+    Infers compact types for text columns from a sample of rows:
+    {column: {"kind": "datetime", "format": ...} | {"kind": "category"}}.
+    Numeric columns are not listed; apply_schema() checks them on the full
+    data, since a sample cannot prove a value range.
+    """
+    from pandas.tseries.api import guess_datetime_format
+
+    schema = {}
+    for col in sample.columns:
+        series = sample[col]
+        if not _is_text(series):
+            continue
+        values = series.dropna()
+        if values.empty or not all(isinstance(v, str) for v in values.head(100)):
+            continue
+
+        fmt = guess_datetime_format(values.iloc[0])
+        if fmt:
+            try:
+                pd.to_datetime(values, format=fmt)
+                schema[col] = {"kind": "datetime", "format": fmt}
+                continue
+            except (ValueError, TypeError):
+                pass
+
+        if values.nunique() <= CATEGORY_MAX_UNIQUE_RATIO * len(values):
+            schema[col] = {"kind": "category"}
+    return schema
+
+
+def read_dtypes(schema: dict) -> dict:
+    """dtype= argument for read_csv, so repetitive strings are parsed straight into categoricals."""
+    return {col: "category" for col, spec in schema.items() if spec["kind"] == "category"}
+
+
+def _compact_integers(series: pd.Series) -> pd.Series:
+    """
+    Smallest integer type holding every value. Float columns of whole numbers
+    (read as float because of gaps, or written as 3.0) become integers too,
+    nullable when there are gaps.
+    """
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast="integer")
+    if pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+        gaps = np.isnan(values)
+        present = values[~gaps]
+        if len(present) and np.isfinite(present).all() and (present == np.round(present)).all() \
+                and np.abs(present).max() < 2 ** 53:
+            return pd.to_numeric(series.astype("Int64" if gaps.any() else "int64"), downcast="integer")
+    return series
+
+
+def _compact_floats(series: pd.Series) -> pd.Series:
+    """float64 to float32 when every finite value fits, used with DOWNCAST_FLOATS."""
+    if series.dtype != np.float64:
+        return series
+    values = series.to_numpy()
+    finite = values[np.isfinite(values)]
+    if len(finite) and np.abs(finite).max() > np.finfo(np.float32).max:
+        return series
+    return series.astype("float32")
+
+
+def apply_schema(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
+    """
+    Converts a loaded DataFrame to the inferred schema: dates are parsed once
+    with the sampled format, repetitive strings become categoricals and
+    integer data gets the smallest (nullable where needed) integer type.
+    Other floats stay float64 unless DOWNCAST_FLOATS is set.
+    A column that does not fit its inferred type outside the sample is left as read.
+    """
+    for col in df.columns:
+        spec = schema.get(col)
+        series = df[col]
+        if spec and spec["kind"] == "datetime":
+            try:
+                df[col] = pd.to_datetime(series, format=spec["format"])
+            except (ValueError, TypeError):
+                pass
+        elif spec and spec["kind"] == "category":
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                df[col] = series.astype("category")
+        else:
+            compact = _compact_integers(series)
+            df[col] = _compact_floats(compact) if DOWNCAST_FLOATS else compact
+    return df
+
+
+def memory_report(before_bytes: int, df: pd.DataFrame, estimated: bool = False) -> dict:
+    """Memory footprint of the data before (None if unknown) and after typing."""
+    after_bytes = int(df.memory_usage(deep=True).sum())
+    return {
+        "before_bytes": None if before_bytes is None else int(before_bytes),
+        "after_bytes": after_bytes,
+        "ratio": before_bytes / after_bytes if before_bytes is not None and after_bytes else None,
+        "before_estimated": estimated,
+    }
+
+
+def estimate_untyped_bytes(sample: pd.DataFrame, rows: int) -> int:
+    """Scales the default-dtype sample's memory to the full row count."""
+    if len(sample) == 0:
+        return 0
+    per_row = sample.memory_usage(deep=True, index=False).sum() / len(sample)
+    return int(per_row * rows)
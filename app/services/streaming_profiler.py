@@ -0,0 +1,449 @@
+import math
+import numpy as np
+import pandas as pd
+from app.services.columnar import has_columnar_copy, columnar_path
+from app.services import excel
+from app.services.schema import SCHEMA_SAMPLE_ROWS, infer_schema, apply_schema
+from app.utils_json import clean_for_json, frame_to_dict
+
+DEFAULT_CHUNKSIZE = 100_000
+
+NUMERIC_STATS = ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+OBJECT_STATS = ["count", "unique", "top", "freq"]
+
+
+class QuantileSketch:
+    """
+    Mergeable approximate quantile sketch (KLL-style compactors).
+
+    Level h holds items that each stand for 2**h original values. When a level
+    grows past k items it is sorted and every other item (random offset) is
+    promoted to the next level. The normalized rank error is at most
+    levels / k.
+    """
+    def __init__(self, k: int = 1024, seed: int = 0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values: np.ndarray):
+        if len(values) == 0:
+            return
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values.astype(float)])
+        self._compress()
+
+    def merge(self, other: "QuantileSketch"):
+        self.n += other.n
+        for h, items in enumerate(other.levels):
+            if h >= len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self._compress()
+
+    def quantile(self, q: float):
+        if self.n == 0:
+            return None
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(l), 2 ** h, dtype=float) for h, l in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        cum = np.cumsum(weights[order])
+        idx = np.searchsorted(cum, q * cum[-1], side="left")
+        return float(items[order][min(idx, len(items) - 1)])
+
+    @property
+    def rank_error(self) -> float:
+        # Exact while nothing has been compacted
+        return 0.0 if len(self.levels) == 1 else len(self.levels) / self.k
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) > self.k:
+                level = np.sort(level)
+                # Keep one item back if the level has odd length
+                keep = level[:1] if len(level) % 2 else np.empty(0)
+                pairs = level[len(keep):]
+                offset = int(self._rng.integers(0, 2))
+                promoted = pairs[offset::2]
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+
+class HyperLogLog:
+    """Mergeable distinct-count estimator with 2**p one-byte registers."""
+    def __init__(self, p: int = 12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def update(self, values):
+        if len(values) == 0:
+            return
+        hashes = pd.util.hash_array(np.asarray(values))
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # Position of the leftmost 1-bit in the remaining 64 - p bits
+        rank = (64 - self.p) - _bit_length(rest) + 1
+        np.maximum.at(self.registers, idx, rank.astype(np.uint8))
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m ** 2 / np.sum(np.power(2.0, -self.registers.astype(float)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * self.m and zeros:
+            # Small range correction (linear counting)
+            raw = self.m * math.log(self.m / zeros)
+        return int(round(raw))
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+
+class FrequentItems:
+    """Misra-Gries heavy hitters; counts are under-estimated by at most n / (k + 1)."""
+    def __init__(self, k: int = 256):
+        self.k = k
+        self.counts = {}
+        self.n = 0
+
+    def update(self, values):
+        if len(values) == 0:
+            return
+        self.n += len(values)
+        for value, count in pd.Series(values).value_counts(sort=False).items():
+            self.counts[value] = self.counts.get(value, 0) + int(count)
+        self._prune()
+
+    def merge(self, other: "FrequentItems"):
+        self.n += other.n
+        for value, count in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        self._prune()
+
+    def top(self):
+        if not self.counts:
+            return None, None
+        value = max(self.counts, key=self.counts.get)
+        return value, self.counts[value]
+
+    @property
+    def max_undercount(self) -> int:
+        return self.n // (self.k + 1)
+
+    def _prune(self):
+        if len(self.counts) <= self.k:
+            return
+        threshold = sorted(self.counts.values(), reverse=True)[self.k]
+        self.counts = {v: c - threshold for v, c in self.counts.items() if c > threshold}
+
+
+class MomentAccumulator:
+    """
+    Mergeable count/mean/variance (Welford/Chan), min/max and co-moment
+    matrices for a fixed set of numeric columns.
+
+    Co-moments are accumulated over pairwise-complete rows (like
+    DataFrame.corr) from sums shifted by the first chunk's means for
+    numerical stability.
+    """
+    def __init__(self, columns: list):
+        p = len(columns)
+        self.columns = columns
+        self.count = np.zeros(p)
+        self.mean = np.zeros(p)
+        self.m2 = np.zeros(p)
+        self.min = np.full(p, np.inf)
+        self.max = np.full(p, -np.inf)
+        self.shift = None
+        self.pair_n = np.zeros((p, p))
+        self.pair_sx = np.zeros((p, p))
+        self.pair_sxx = np.zeros((p, p))
+        self.pair_sxy = np.zeros((p, p))
+
+    def update(self, values: np.ndarray):
+        """values: 2-D float array (rows x columns) with NaN for missing."""
+        if values.shape[0] == 0:
+            return
+        mask = ~np.isnan(values)
+        count = mask.sum(axis=0).astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, np.nansum(values, axis=0) / np.maximum(count, 1), 0.0)
+            m2 = np.nansum((values - mean) ** 2, axis=0)
+        self._merge_moments(count, mean, m2)
+        if mask.any():
+            self.min = np.fmin(self.min, np.nanmin(np.where(mask, values, np.inf), axis=0))
+            self.max = np.fmax(self.max, np.nanmax(np.where(mask, values, -np.inf), axis=0))
+
+        if self.shift is None:
+            self.shift = mean.copy()
+        centered = np.where(mask, values - self.shift, 0.0)
+        m = mask.astype(float)
+        self.pair_n += m.T @ m
+        self.pair_sx += centered.T @ m
+        self.pair_sxx += (centered ** 2).T @ m
+        self.pair_sxy += centered.T @ centered
+
+    def merge(self, other: "MomentAccumulator"):
+        self._merge_moments(other.count, other.mean, other.m2)
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        if other.shift is None:
+            return
+        if self.shift is None:
+            self.shift = other.shift.copy()
+        # Re-base the other accumulator's shifted sums onto our shift
+        d = (other.shift - self.shift)[:, None]  # per-row column shift
+        n, sx, sxx = other.pair_n, other.pair_sx, other.pair_sxx
+        self.pair_n += n
+        self.pair_sx += sx + d * n
+        self.pair_sxx += sxx + 2 * d * sx + d ** 2 * n
+        self.pair_sxy += other.pair_sxy + d * sx.T + (d * sx.T).T + (d @ d.T) * n
+
+    def std(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+    def correlation(self) -> np.ndarray:
+        n, sx, sxx, sxy = self.pair_n, self.pair_sx, self.pair_sxx, self.pair_sxy
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = n * sxy - sx * sx.T
+            var_x = n * sxx - sx ** 2
+            var_y = var_x.T
+            corr = cov / np.sqrt(var_x * var_y)
+        corr[(n < 2) | (var_x <= 0) | (var_y <= 0)] = np.nan
+        return np.clip(corr, -1.0, 1.0)
+
+    def _merge_moments(self, count, mean, m2):
+        total = self.count + count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = mean - self.mean
+            self.mean = np.where(total > 0, self.mean + delta * count / np.maximum(total, 1), 0.0)
+            self.m2 = self.m2 + m2 + np.where(total > 0, delta ** 2 * self.count * count / np.maximum(total, 1), 0.0)
+        self.count = total
+
+
+def _with_schema(chunks):
+    """Applies the schema inferred from the first chunk's leading rows to every chunk."""
+    schema = None
+    for chunk in chunks:
+        if schema is None:
+            schema = infer_schema(chunk.head(SCHEMA_SAMPLE_ROWS))
+        yield apply_schema(chunk, schema)
+
+
+def _epoch_ns(series: pd.Series) -> np.ndarray:
+    """Datetimes as float nanoseconds since the epoch, NaN for missing."""
+    if not pd.api.types.is_datetime64_any_dtype(series):
+        # A later chunk may not parse with the format sampled from the first
+        series = pd.to_datetime(series, errors="coerce", format="mixed")
+    if getattr(series.dt, "tz", None) is not None:
+        series = series.dt.tz_convert(None)
+    values = series.to_numpy(dtype="datetime64[ns]")
+    out = values.view("int64").astype(float)
+    out[np.isnat(values)] = np.nan
+    return out
+
+
+def _timestamp(ns: float, dtype) -> pd.Timestamp:
+    """A statistic of a date column as a Timestamp in the column's unit and time zone."""
+    unit = getattr(dtype, "unit", None) or np.datetime_data(dtype)[0]
+    stamp = pd.Timestamp(int(round(ns))).as_unit(unit, round_ok=True)
+    tz = getattr(dtype, "tz", None)
+    return stamp.tz_localize("UTC").tz_convert(tz) if tz is not None else stamp
+
+
+class StreamingProfiler:
+    """
+    Profiles a stored file chunk by chunk in bounded memory.
+
+    Produces the same description / missing_values / correlations payload
+    as Profiler, with quantiles, distinct counts and top values estimated
+    from sketches. Missing counts, moments and correlations are exact.
+    """
+    def __init__(self, filepath: str, filename: str, chunksize: int = DEFAULT_CHUNKSIZE,
+                 quantile_k: int = 1024, hll_p: int = 12, top_k: int = 256):
+        self.filepath = filepath
+        self.filename = filename
+        self.chunksize = chunksize
+        self.quantile_k = quantile_k
+        self.hll_p = hll_p
+        self.top_k = top_k
+
+    def iter_chunks(self):
+        """
+        Yields DataFrame chunks from the columnar copy or the raw file. Raw
+        chunks get the schema inferred from the first rows, as Dataset types
+        the whole file, so dates and categories profile the same either way.
+        """
+        name = self.filename.lower()
+        if has_columnar_copy(self.filepath):
+            import pyarrow as pa
+
+            with pa.memory_map(columnar_path(self.filepath)) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    yield reader.get_batch(i).to_pandas()
+        elif name.endswith(('.csv', '.tsv')):
+            sep = '\t' if name.endswith('.tsv') else ','
+            yield from _with_schema(pd.read_csv(self.filepath, sep=sep, chunksize=self.chunksize))
+        elif excel.is_excel(name):
+            source = excel.sheet_source(self.filepath, self.filename)
+            if source is None:
+                chunks = excel.iter_sheet(self.filepath, chunk_rows=self.chunksize)
+            else:
+                workbook, index = source
+                chunks = excel.iter_sheet(workbook, excel.list_sheets(workbook)[index], chunk_rows=self.chunksize)
+            yield from _with_schema(chunks)
+        else:
+            raise ValueError(f"Unsupported file format: {self.filename}")
+
+    def profile(self) -> dict:
+        rows = 0
+        columns = None
+        numeric, dates = [], []
+        date_types = {}
+        nulls = None
+        moments = date_moments = None
+        sketches, distinct, frequent = {}, {}, {}
+
+        for chunk in self.iter_chunks():
+            if columns is None:
+                columns = chunk.columns.tolist()
+                numeric = [c for c in columns if pd.api.types.is_numeric_dtype(chunk[c])
+                           and not pd.api.types.is_bool_dtype(chunk[c])]
+                dates = [c for c in columns if pd.api.types.is_datetime64_any_dtype(chunk[c])]
+                date_types = {c: chunk[c].dtype for c in dates}
+                nulls = dict.fromkeys(columns, 0)
+                moments = MomentAccumulator(numeric)
+                date_moments = MomentAccumulator(dates)
+                for col in columns:
+                    distinct[col] = HyperLogLog(self.hll_p)
+                    if col in numeric or col in dates:
+                        sketches[col] = QuantileSketch(self.quantile_k)
+                    else:
+                        frequent[col] = FrequentItems(self.top_k)
+
+            rows += len(chunk)
+            for col, count in chunk.isna().sum().items():
+                nulls[col] += int(count)
+
+            if numeric:
+                # Later chunks may infer a different dtype; coerce to float
+                values = chunk[numeric].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+                moments.update(values)
+                for i, col in enumerate(numeric):
+                    present = values[:, i][~np.isnan(values[:, i])]
+                    sketches[col].update(present)
+                    distinct[col].update(present)
+
+            if dates:
+                # Dates are summarized like numbers, on their nanosecond timestamps
+                values = np.column_stack([_epoch_ns(chunk[col]) for col in dates])
+                date_moments.update(values)
+                for i, col in enumerate(dates):
+                    present = values[:, i][~np.isnan(values[:, i])]
+                    sketches[col].update(present)
+                    distinct[col].update(present)
+
+            for col in frequent:
+                present = chunk[col].dropna().to_numpy()
+                frequent[col].update(present)
+                distinct[col].update(present)
+
+        if columns is None:
+            return {"description": {}, "missing_values": {"count": {}, "percentage": {}},
+                    "correlations": {}, "approximate": False, "error_bounds": {}, "rows": 0}
+
+        return self._build_result(rows, columns, numeric, nulls, moments, sketches, distinct, frequent,
+                                  dates, date_moments, date_types)
+
+    def _build_result(self, rows, columns, numeric, nulls, moments, sketches, distinct, frequent,
+                      dates, date_moments, date_types) -> dict:
+        # Same key set describe(include='all') produces for this mix of columns
+        stat_names = OBJECT_STATS if frequent else ["count"]
+        if numeric:
+            stat_names = stat_names + NUMERIC_STATS[1:]
+        elif dates:
+            # Dates get no standard deviation
+            stat_names = stat_names + [s for s in NUMERIC_STATS[1:] if s != "std"]
+
+        std = moments.std()
+        description = {}
+        for col in columns:
+            desc = dict.fromkeys(stat_names)
+            desc["count"] = rows - nulls[col]
+            if col in numeric:
+                i = numeric.index(col)
+                has_values = moments.count[i] > 0
+                desc.update({
+                    "mean": moments.mean[i] if has_values else None,
+                    "std": std[i],
+                    "min": moments.min[i] if has_values else None,
+                    "25%": sketches[col].quantile(0.25),
+                    "50%": sketches[col].quantile(0.5),
+                    "75%": sketches[col].quantile(0.75),
+                    "max": moments.max[i] if has_values else None,
+                })
+            elif col in dates:
+                i = dates.index(col)
+                if date_moments.count[i] > 0:
+                    stats = {
+                        "mean": date_moments.mean[i],
+                        "min": date_moments.min[i],
+                        "25%": sketches[col].quantile(0.25),
+                        "50%": sketches[col].quantile(0.5),
+                        "75%": sketches[col].quantile(0.75),
+                        "max": date_moments.max[i],
+                    }
+                    desc.update({k: _timestamp(v, date_types[col]) for k, v in stats.items()})
+            else:
+                top, freq = frequent[col].top()
+                desc.update({"unique": distinct[col].estimate(), "top": top, "freq": freq})
+            description[col] = desc
+
+        missing = {
+            "count": nulls,
+            "percentage": {c: (n / rows) * 100 if rows else None for c, n in nulls.items()}
+        }
+
+        correlations = {}
+        if numeric:
+            corr = pd.DataFrame(moments.correlation(), index=numeric, columns=numeric)
+            correlations = frame_to_dict(corr)
+
+        error_bounds = {
+            "quantile_rank_error": max((s.rank_error for s in sketches.values()), default=0.0),
+            "unique_relative_error": distinct[columns[0]].relative_error,
+            "freq_max_undercount": max((f.max_undercount for f in frequent.values()), default=0),
+        }
+
+        # The correlation matrix is already JSON-ready; only the small parts need cleaning
+        result = clean_for_json({
+            "description": description,
+            "missing_values": missing,
+            "approximate": True,
+            "error_bounds": error_bounds,
+            "rows": rows,
+        })
+        result["correlations"] = correlations
+        return result
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Vectorized int.bit_length() for uint64 arrays."""
+    hi = (values >> np.uint64(32)).astype(float)
+    lo = (values & np.uint64(0xFFFFFFFF)).astype(float)
+    # frexp is exact for integers below 2**53
+    hi_bits = np.frexp(hi)[1]
+    lo_bits = np.frexp(lo)[1]
+    return np.where(hi > 0, 32 + hi_bits, lo_bits)
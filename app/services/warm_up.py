@@ -0,0 +1,47 @@
+"""
+Optional background warm-up after startup.
+
+The web process imports pandas, the AI SDK and the analysis code on first
+use (see app.lazy), and analysis workers start with the first task routed
+to them, so the first requests after a restart pay for both. With
+WARM_UP_ON_STARTUP=1 that cost is paid in a background thread instead,
+shortly after the server starts accepting connections.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from app.lazy import preload
+from app.services.worker_pool import worker_pool
+
+# Preload heavy modules and start the analysis workers after startup
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "0") == "1"
+# Seconds between startup and the warm-up, so the server is listening first
+WARM_UP_DELAY = float(os.getenv("WARM_UP_DELAY", "1"))
+
+# What the web process needs to submit analysis tasks and call the AI API
+WEB_MODULES = ("pandas", "numpy", "app.services.analysis_tasks", "google.genai")
+# What each analysis worker needs to run them
+WORKER_MODULES = ("app.services.analysis_tasks", "pyarrow.feather", "pyarrow.csv", "matplotlib.figure", "seaborn")
+
+
+def warm_up():
+    """Preloads WORKER_MODULES in every analysis worker and WEB_MODULES here. Blocks until done."""
+    start = time.perf_counter()
+    futures = worker_pool.warm_up(preload, WORKER_MODULES)
+    preload(WEB_MODULES)
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            logging.warning(f"Warming up an analysis worker failed: {e}")
+    logging.info(f"Warm-up finished in {time.perf_counter() - start:.1f}s")
+
+
+def schedule_warm_up():
+    """Runs warm_up() in a daemon thread WARM_UP_DELAY seconds from now. Call from a startup handler."""
+    def start():
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+    asyncio.get_running_loop().call_later(WARM_UP_DELAY, start)
@@ -0,0 +1,291 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from app.services import metrics
+
+# Number of analysis worker processes; 0 runs tasks in threads of this process
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Seconds a caller waits for an analysis task before giving up
+ANALYSIS_TIMEOUT = float(os.getenv("ANALYSIS_TIMEOUT", "300"))
+# Seconds a finished job stays available for polling
+JOB_TTL = float(os.getenv("ANALYSIS_JOB_TTL", "600"))
+
+
+def _invoke(fn, args):
+    """Runs in the worker: calls fn and reports the worker's cache counters and task metrics."""
+    from app.services.dataset_cache import dataset_cache
+
+    result, report = metrics.worker_report(fn, args)
+    return result, os.getpid(), dataset_cache.stats(), report
+
+
+class WorkerPool:
+    """
+    Bounded pool of analysis worker processes.
+
+    Tasks are routed by key (usually the file's content hash) to a fixed
+    single-process executor, so work for one dataset queues up in order on
+    the same worker and finds the data that worker already parsed, while
+    other datasets run in parallel on other workers.
+
+    A timeout releases the caller and withdraws the task if it is still
+    queued, but cannot interrupt one that already started; the worker
+    finishes it and moves on to its queue. A worker that dies (killed for
+    memory, a crash in a C extension) is replaced: the task it was running
+    fails, tasks queued behind it run on the new worker.
+    """
+    def __init__(self, max_workers: int, timeout: float):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executors = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._worker_cache_stats = {}  # pid -> last dataset cache counters
+
+    @property
+    def queue_depth(self) -> int:
+        """Tasks submitted and not yet finished."""
+        return self._pending
+
+    async def run(self, key: str, fn, *args, timeout: float = None):
+        """Runs fn(*args) on the worker for key without blocking the event loop."""
+        return await self.wait(self.submit(key, fn, *args), timeout)
+
+    def run_sync(self, key: str, fn, *args, timeout: float = None):
+        """Blocking variant of run() for background threads."""
+        future = self.submit(key, fn, *args)
+        while True:
+            try:
+                return self._unpack(future, future.result(timeout or self.timeout))
+            except FutureTimeoutError:
+                future.cancel()
+                raise
+            except BrokenProcessPool:
+                future = self._recover(future)
+
+    def submit(self, key: str, fn, *args) -> Future:
+        """
+        Queues fn(*args) on the worker for key and returns the
+        concurrent.futures.Future to pass to wait(). Until a worker picks the
+        task up, future.cancel() withdraws it; after that it runs to the end.
+        """
+        slot, executor = self._executor_for(key)
+        try:
+            future = executor.submit(_invoke, fn, args)
+        except BrokenProcessPool:
+            executor = self._replace(slot, executor)
+            future = executor.submit(_invoke, fn, args)
+        future.submitted_at = time.perf_counter()
+        future.key, future.task, future.slot, future.executor = key, (fn, args), slot, executor
+        self._watch_start(future)
+        self._track(1)
+        future.add_done_callback(lambda _: self._track(-1))
+        return future
+
+    async def wait(self, future: Future, timeout: float = None):
+        """Awaits a future from submit() without blocking the event loop and returns fn's result."""
+        while True:
+            try:
+                outcome = await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+                return self._unpack(future, outcome)
+            except asyncio.TimeoutError:
+                future.cancel()  # Still queued: do not hold up the key's worker with it
+                raise
+            except BrokenProcessPool:
+                future = self._recover(future)
+
+    def cache_stats(self) -> dict:
+        """Dataset cache counters summed over all workers seen so far."""
+        totals = {"entries": 0, "bytes": 0, "max_bytes": 0, "hits": 0, "misses": 0, "evictions": 0}
+        for stats in list(self._worker_cache_stats.values()):
+            for name in totals:
+                totals[name] += stats[name]
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_ratio"] = totals["hits"] / lookups if lookups else 0.0
+        totals["workers"] = len(self._worker_cache_stats)
+        return totals
+
+    def warm_up(self, fn, *args) -> list:
+        """Starts every worker and runs fn(*args) on each, ahead of the first task. Returns the futures."""
+        self._executor_for("")
+        with self._lock:
+            executors = list(self._executors or [])
+        return [executor.submit(fn, *args) for executor in executors]
+
+    def shutdown(self):
+        with self._lock:
+            for executor in self._executors or []:
+                executor.shutdown(wait=False, cancel_futures=True)
+            self._executors = None
+
+    def _executor_for(self, key: str) -> tuple:
+        """(slot, executor) that runs the tasks for key."""
+        with self._lock:
+            if self._executors is None:
+                if self.max_workers > 0:
+                    self._executors = [ProcessPoolExecutor(max_workers=1) for _ in range(self.max_workers)]
+                else:
+                    self._executors = [ThreadPoolExecutor(max_workers=4)]
+            executors = self._executors
+        slot = zlib.crc32(str(key).encode()) % len(executors)
+        return slot, executors[slot]
+
+    def _replace(self, slot: int, broken):
+        """Swaps a fresh executor in for a broken one (once) and returns the slot's executor."""
+        with self._lock:
+            if self._executors is None:
+                raise BrokenProcessPool("The worker pool was shut down")
+            if self._executors[slot] is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executors[slot] = ProcessPoolExecutor(max_workers=1)
+            return self._executors[slot]
+
+    def _recover(self, future: Future) -> Future:
+        """
+        Called when future failed because its worker died. Replaces the worker;
+        re-raises for the task that was running, resubmits one that was queued.
+        """
+        self._replace(future.slot, future.executor)
+        # The worker runs its tasks in order; later started ones were only fetched ahead
+        started = getattr(future.executor, "started", [])
+        if started and started[0] is future:
+            raise BrokenProcessPool("The analysis worker died while running this task")
+        return self.submit(future.key, future.task[0], *future.task[1])
+
+    @staticmethod
+    def _watch_start(future: Future):
+        """
+        Keeps the executor's started list: its tasks handed to the worker and
+        not finished, oldest first, so _recover can tell which one was running.
+        """
+        executor = future.executor
+        if not hasattr(executor, "started"):
+            executor.started = []
+        start = future.set_running_or_notify_cancel
+
+        def set_running_or_notify_cancel():
+            running = start()
+            if running:
+                executor.started.append(future)
+            return running
+
+        def finished(f):
+            if not f.cancelled() and isinstance(f.exception(), BrokenProcessPool):
+                return  # Left for _recover
+            if f in executor.started:
+                executor.started.remove(f)
+
+        future.set_running_or_notify_cancel = set_running_or_notify_cancel
+        # The executor may already have handed it to the worker before the hook was in place
+        if (future.running() or future.done()) and future not in executor.started:
+            executor.started.append(future)
+        future.add_done_callback(finished)
+
+    def _unpack(self, future: Future, outcome):
+        result, pid, cache_stats, report = outcome
+        self._worker_cache_stats[pid] = cache_stats
+        metrics.record_worker_report(report, time.perf_counter() - future.submitted_at)
+        return result
+
+    def _track(self, delta: int):
+        with self._lock:
+            self._pending += delta
+
+
+class JobManager:
+    """
+    Submit/poll API over the worker pool for long-running analysis.
+    Jobs live in memory and expire JOB_TTL seconds after finishing.
+
+    A job is "queued" until a worker picks it up, then "running", and ends
+    "done", "failed" or "cancelled". Cancelling a queued job withdraws it.
+    A running task cannot be interrupted: the job becomes "cancel_requested"
+    and ends "cancelled", with its result dropped, once the task returns.
+    A worker process takes its next task or two off the queue early, so
+    those already count as running.
+    """
+    def __init__(self, pool: WorkerPool):
+        self.pool = pool
+        self._jobs = {}
+
+    def submit(self, session_id: str, key: str, kind: str, fn, *args, timeout: float = None) -> dict:
+        """Starts fn(*args) on the worker for key and returns the job's public state."""
+        self._expire()
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "kind": kind,
+            "status": "running",  # Reported as "queued" until a worker starts it, see _public
+            "result": None,
+            "error": None,
+            "submitted_at": time.time(),
+            "finished_at": None,
+        }
+        job["task"] = asyncio.create_task(self._execute(job, key, fn, args, timeout))
+        self._jobs[job["job_id"]] = job
+        return self._public(job)
+
+    def get(self, job_id: str) -> dict:
+        self._expire()
+        job = self._jobs.get(job_id)
+        return self._public(job) if job else None
+
+    def cancel(self, job_id: str) -> dict:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job["status"] == "running":
+            future = job.get("future")
+            if future is None or future.cancel():
+                job["task"].cancel()
+                self._finish(job, "cancelled")
+            else:
+                job["status"] = "cancel_requested"
+        return self._public(job)
+
+    async def _execute(self, job, key, fn, args, timeout):
+        try:
+            job["future"] = self.pool.submit(key, fn, *args)
+            job["result"] = await self.pool.wait(job["future"], timeout)
+            self._finish(job, "done")
+        except asyncio.CancelledError:
+            self._finish(job, "cancelled")
+        except asyncio.TimeoutError:
+            job["error"] = "Job timed out"
+            self._finish(job, "failed")
+        except Exception as e:
+            job["error"] = str(e)
+            self._finish(job, "failed")
+
+    def _finish(self, job, status):
+        if job["finished_at"] is None:
+            if job["status"] == "cancel_requested":
+                status, job["result"] = "cancelled", None
+            job["status"] = status
+            job["finished_at"] = time.time()
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job["finished_at"] and now - job["finished_at"] > JOB_TTL:
+                del self._jobs[job_id]
+
+    @staticmethod
+    def _public(job) -> dict:
+        data = {k: v for k, v in job.items() if k not in ("task", "future")}
+        future = job.get("future")
+        if data["status"] == "running" and (future is None or not (future.running() or future.done())):
+            data["status"] = "queued"
+        end = job["finished_at"] or time.time()
+        data["elapsed"] = end - job["submitted_at"]
+        return data
+
+
+worker_pool = WorkerPool(max_workers=ANALYSIS_WORKERS, timeout=ANALYSIS_TIMEOUT)
+job_manager = JobManager(worker_pool)
@@ -1,15 +1,24 @@
-import pandas as pd
-import numpy as np
+from __future__ import annotations
+import json
+from fastapi.responses import Response
+from app.lazy import lazy_module
+from app.services import metrics
+
+# Loaded on first use; the web process often only passes encoded bytes through
+pd = lazy_module("pandas")
+np = lazy_module("numpy")
 
 def clean_for_json(obj):
     """
-    Recursively converts numpy types to native Python types 
+    Recursively converts numpy types to native Python types
     and replaces NaNs with None for JSON serialization.
     """
     if isinstance(obj, dict):
         return {k: clean_for_json(v) for k, v in obj.items()}
     elif isinstance(obj, list):
         return [clean_for_json(v) for v in obj]
+    elif isinstance(obj, (np.bool_, bool)):
+        return bool(obj)
     elif isinstance(obj, (np.integer, int)):
         return int(obj)
     elif isinstance(obj, (np.floating, float)):
@@ -22,3 +31,114 @@ def clean_for_json(obj):
         return clean_for_json(obj.tolist())
     else:
         return obj
+
+def series_to_list(series: pd.Series) -> list:
+    """
+    Converts a Series to a list of JSON-ready Python values.
+    Works per column with vectorized null masks instead of visiting each cell;
+    only object columns holding non-string values fall back to clean_for_json.
+    """
+    mask = series.isna().to_numpy()
+
+    if pd.api.types.is_bool_dtype(series) and not mask.any():
+        return series.to_numpy(dtype=bool).tolist()
+
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        if pd.api.types.is_integer_dtype(series):
+            if not mask.any():
+                return series.to_numpy().tolist()
+            # Nullable integer column: keep ints, NA becomes None
+            return series.astype(object).where(~mask, None).tolist()
+        if series.dtype == np.float32:
+            # Through the shortest float32 text, so 0.1 is sent as 0.1 and not 0.10000000149011612
+            values = series.to_numpy().astype(str).astype(float)
+        else:
+            values = series.to_numpy(dtype=float, na_value=np.nan)
+        # inf is not valid JSON either
+        mask = mask | ~np.isfinite(values)
+        if not mask.any():
+            return values.tolist()
+        out = values.astype(object)
+        out[mask] = None
+        return out.tolist()
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        if getattr(series.dt, "tz", None) is None:
+            values = series.to_numpy(dtype="datetime64[ns]")
+            # Same text as Timestamp.isoformat(): seconds unless there are fractions
+            fractional = (values.view("int64")[~mask] % 10**9).any()
+            out = np.datetime_as_string(values, unit="us" if fractional else "s").astype(object)
+        else:
+            out = np.array([t.isoformat() if not pd.isna(t) else None for t in series], dtype=object)
+        out[mask] = None
+        return out.tolist()
+
+    out = series.to_numpy(dtype=object).copy()
+    out[mask] = None
+    if pd.api.types.infer_dtype(out, skipna=True) in ("string", "empty"):
+        return out.tolist()
+    return [clean_for_json(v) for v in out]
+
+def series_to_dict(series: pd.Series) -> dict:
+    """Vectorized equivalent of clean_for_json(series.to_dict())."""
+    return dict(zip(series.index.tolist(), series_to_list(series)))
+
+def frame_to_dict(df: pd.DataFrame) -> dict:
+    """Vectorized equivalent of clean_for_json(df.to_dict()): {column: {index: value}}."""
+    index = df.index.tolist()
+    return {col: dict(zip(index, series_to_list(df.iloc[:, i]))) for i, col in enumerate(df.columns.tolist())}
+
+def frame_to_records(df: pd.DataFrame) -> list[dict]:
+    """Vectorized equivalent of clean_for_json(df.to_dict(orient='records'))."""
+    columns = df.columns.tolist()
+    values = [series_to_list(df.iloc[:, i]) for i in range(len(columns))]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+def frame_to_json(df: pd.DataFrame) -> "RawJSON":
+    """
+    Encodes a DataFrame as {column: {index: value}} JSON text in pandas' C
+    encoder (NaN/inf -> null). Much faster than building dicts for wide
+    numeric frames such as correlation matrices.
+    """
+    return RawJSON(df.to_json(orient="columns", double_precision=15, date_format="iso"))
+
+class RawJSON(str):
+    """Pre-encoded JSON text, embedded verbatim by join_json_object."""
+
+def _json_default(obj):
+    # Leftover numpy / pandas scalars that the column encoders did not see
+    return clean_for_json(obj.item() if isinstance(obj, np.generic) else obj)
+
+def dumps_json(content) -> bytes:
+    """Encodes already JSON-ready content (see series_to_list) to UTF-8 bytes."""
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False,
+        separators=(",", ":"), default=_json_default
+    ).encode("utf-8")
+
+def join_json_object(parts: dict) -> bytes:
+    """
+    Encodes a top-level object whose values are either JSON-ready Python
+    values or RawJSON fragments, without decoding the fragments.
+    """
+    items = []
+    for key, value in parts.items():
+        encoded = value.encode("utf-8") if isinstance(value, RawJSON) else dumps_json(value)
+        items.append(dumps_json(str(key)) + b":" + encoded)
+    return b"{" + b",".join(items) + b"}"
+
+class FastJSONResponse(Response):
+    """
+    JSON response for payloads built with the helpers above. Returning it from
+    a route skips FastAPI's recursive jsonable_encoder pass; content may also
+    be pre-encoded bytes/str (e.g. a stored profile) which is sent as-is.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        if isinstance(content, str):
+            return content.encode("utf-8")
+        with metrics.span("serialize"):
+            return dumps_json(content)
@@ -0,0 +1,361 @@
+"""
+Profiles every stored file again, in parallel, e.g. after upgrading pandas
+or changing the chart settings:
+
+    python batch_profile.py --workers 4 --charts --force
+
+Walks the sessions in the database and profiles each distinct content once,
+largest files first so the long jobs start early and the small ones fill the
+gaps at the end. Each worker process has a resident memory budget; a file
+that does not fit fails on its own instead of taking the machine down. Contents whose
+stored profile is current are skipped unless --force is given.
+
+Progress is appended to a checkpoint, so an interrupted run continues where
+it stopped when started again (--fresh starts over). A JSON report of
+throughput and failures is written at the end.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+
+from app.services.file_service import STORAGE_DIR
+
+CHECKPOINT_PATH = os.path.join(STORAGE_DIR, "batch_profile.checkpoint.jsonl")
+REPORT_DIR = os.path.join(STORAGE_DIR, "batch_reports")
+# Files a worker process profiles before it is replaced, returning its memory to the system
+TASKS_PER_WORKER = 20
+# A content whose worker died (OOM killer, crash) is tried this many times
+MAX_ATTEMPTS = 2
+# Seconds between checks of a worker's resident memory against its budget
+MEMORY_CHECK_INTERVAL = 0.2
+
+# Set in a worker while it profiles a file, and once that task went over budget
+_task_running = threading.Event()
+_over_budget = threading.Event()
+
+
+def default_memory_budget(workers: int) -> int:
+    """MB per worker: 80% of physical memory shared between the workers."""
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):  # No sysconf on Windows
+        return 0
+    return int(total * 0.8 / workers / (1024 * 1024))
+
+
+def _current_rss():
+    """Resident memory of this process in bytes, or None where /proc is missing (Windows, macOS)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _watch_memory(budget: int):
+    """
+    Interrupts the running task once the worker's resident memory passes
+    budget bytes (see _over_budget_handler). Resident memory rather than
+    address space, which pyarrow and the BLAS threads reserve far beyond
+    what they use. The interrupt lands when the current pandas/NumPy call
+    returns.
+    """
+    import _thread
+
+    while True:
+        time.sleep(MEMORY_CHECK_INTERVAL)
+        if _task_running.is_set() and not _over_budget.is_set() and (_current_rss() or 0) > budget:
+            _over_budget.set()
+            _thread.interrupt_main(signal.SIGUSR1)
+
+
+def _over_budget_handler(signum, frame):
+    """Runs in the worker's main thread: fails the task, unless it finished before the interrupt landed."""
+    if _task_running.is_set():
+        raise MemoryError("Memory budget exceeded")
+
+
+def _init_worker(memory_budget_mb: int, workers: int):
+    """Starts the worker's memory watchdog, so an oversized file raises MemoryError in its task."""
+    # Ctrl-C is for the parent, which stops the pool; a worker would only fail its current file
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_budget_mb and _current_rss() is not None:
+        signal.signal(signal.SIGUSR1, _over_budget_handler)
+        threading.Thread(target=_watch_memory, args=(memory_budget_mb * 1024 * 1024,), daemon=True).start()
+    # The pool already runs a file per worker; large CSVs get the cores left over
+    from app.services import csv_parallel
+    csv_parallel.CSV_PARSE_WORKERS = max(1, (os.cpu_count() or 1) // workers)
+
+
+def charts_done(content_hash: str) -> bool:
+    """Whether the chart plan, every chart image and the chart data are cached for this content."""
+    from app.services import analysis_tasks, charts, result_cache
+
+    specs = charts.load_plan(content_hash)
+    if specs is None:
+        return False
+    if not os.path.exists(result_cache.result_path(content_hash, "chart_data", analysis_tasks.CHART_DATA_PARAMS)):
+        return False
+    return all(os.path.exists(charts.chart_path(content_hash, spec)) for spec in specs)
+
+
+def _render_charts(content_hash: str, filepath: str, filename: str, force: bool):
+    from app.services import analysis_tasks, charts, result_cache
+
+    if force:
+        # Plan again and redraw, the drawing code may have changed without a settings bump
+        specs = analysis_tasks.run_chart_plan(content_hash, filepath, filename)
+        stale = [charts.chart_path(content_hash, spec) for spec in specs]
+        stale.append(result_cache.result_path(content_hash, "chart_data", analysis_tasks.CHART_DATA_PARAMS))
+        for path in stale:
+            if os.path.exists(path):
+                os.remove(path)
+    analysis_tasks.run_visualizations(content_hash, filepath, filename)
+    analysis_tasks.run_chart_data(content_hash, filepath, filename)
+
+
+def profile_content(content_hash: str, filepath: str, filename: str, with_charts: bool, force: bool) -> dict:
+    """
+    Runs in a worker: profiles one content, stores the profile and optionally
+    renders its charts. Returns the task's run time and peak memory; on failure
+    the error is stored with the profile and re-raised.
+    """
+    from app.database import SessionLocal
+    from app.services import analysis_tasks, metrics
+    from app.services.dataset_cache import dataset_cache
+    from app.services.profile_store import ProfileStore
+
+    def work():
+        payload = analysis_tasks.run_stats_json(content_hash, filepath, filename)
+        db = SessionLocal()
+        try:
+            ProfileStore(db).save_result(content_hash, payload)
+        finally:
+            db.close()
+        if with_charts:
+            _render_charts(content_hash, filepath, filename, force)
+
+    _over_budget.clear()
+    _task_running.set()
+    try:
+        try:
+            _, report = metrics.worker_report(work, ())
+        finally:
+            _task_running.clear()
+    except Exception as e:
+        db = SessionLocal()
+        try:
+            ProfileStore(db).save_error(content_hash, str(e))
+        except Exception:
+            pass
+        finally:
+            db.close()
+        raise
+    finally:
+        dataset_cache.clear()  # The next file is a different one
+    return {"seconds": report["seconds"], "peak_rss": report["peak_rss"]}
+
+
+def read_checkpoint(path: str) -> dict:
+    """content_hash -> last entry recorded for it by earlier runs."""
+    entries = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Line cut short by the interruption
+                entries[entry["content_hash"]] = entry
+    except OSError:
+        pass
+    return entries
+
+
+def collect_work(force: bool, with_charts: bool, checkpoint: dict, retry_failed: bool) -> tuple[list, dict]:
+    """
+    Distinct contents still to profile, largest first, and counts of the
+    sessions skipped and why.
+    """
+    from app.database import SessionLocal
+    from app.models import FileRecord
+    from app.services.file_service import FileService
+    from app.services.profile_store import ProfileStore
+
+    skipped = {"missing_file": 0, "up_to_date": 0, "checkpoint": 0}
+    contents = {}
+    db = SessionLocal()
+    try:
+        service, store = FileService(db), ProfileStore(db)
+        for record in db.query(FileRecord).order_by(FileRecord.id):
+            if not os.path.exists(record.filepath):
+                skipped["missing_file"] += 1
+                continue
+            content_hash = service.ensure_content_hash(record)
+            if content_hash in contents:
+                contents[content_hash]["sessions"] += 1
+                continue
+            done = checkpoint.get(content_hash)
+            if done and (done["status"] == "done" or not retry_failed):
+                skipped["checkpoint"] += 1
+                continue
+            if not force and store.get_status(content_hash)["status"] == "ready" \
+                    and (not with_charts or charts_done(content_hash)):
+                skipped["up_to_date"] += 1
+                continue
+            contents[content_hash] = {
+                "content_hash": content_hash,
+                "filepath": record.data_path,
+                "filename": record.filename,
+                "size_bytes": os.path.getsize(record.filepath),
+                "sessions": 1,
+            }
+    finally:
+        db.close()
+    work = sorted(contents.values(), key=lambda item: item["size_bytes"], reverse=True)
+    return work, skipped
+
+
+def run_batch(work: list, args, checkpoint_file) -> list:
+    """Profiles the work items on a process pool; returns one result entry per item."""
+    results = []
+    attempts = {}
+    queue = list(work)
+    while queue:
+        retry = []
+        pool = ProcessPoolExecutor(
+            max_workers=args.workers, initializer=_init_worker, initargs=(args.memory_per_worker, args.workers),
+            max_tasks_per_child=TASKS_PER_WORKER
+        )
+        try:
+            futures = {
+                pool.submit(profile_content, item["content_hash"], item["filepath"], item["filename"],
+                            args.charts, args.force): item
+                for item in queue
+            }
+            for future in as_completed(futures):
+                item = futures[future]
+                entry = {"content_hash": item["content_hash"], "filename": item["filename"],
+                         "size_bytes": item["size_bytes"], "sessions": item["sessions"]}
+                try:
+                    entry.update(status="done", **future.result())
+                except BrokenProcessPool:
+                    # A worker died and took every unfinished task with it; which one caused it is unknown
+                    attempts[item["content_hash"]] = attempts.get(item["content_hash"], 0) + 1
+                    if attempts[item["content_hash"]] < MAX_ATTEMPTS:
+                        retry.append(item)
+                        continue
+                    entry.update(status="failed", error="Worker process died (out of memory?)")
+                except MemoryError:
+                    entry.update(status="failed", error="Memory budget exceeded")
+                except Exception as e:
+                    entry.update(status="failed", error=str(e))
+                results.append(entry)
+                checkpoint_file.write(json.dumps(entry) + "\n")
+                checkpoint_file.flush()
+                if not args.quiet:
+                    mark = "ok " if entry["status"] == "done" else "ERR"
+                    print(f"[{len(results)}/{len(work)}] {mark} {item['filename']} "
+                          f"({item['size_bytes'] / 1e6:.1f} MB) {entry.get('error', '')}", flush=True)
+        except KeyboardInterrupt:
+            # Drop the queued files and stop the running ones; finished ones are in the checkpoint
+            processes = list((pool._processes or {}).values())  # shutdown() forgets them
+            pool.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.terminate()
+            raise
+        pool.shutdown()
+        queue = retry
+    return results
+
+
+def summarize(results: list, skipped: dict, seconds: float, args, interrupted: bool) -> dict:
+    done = [r for r in results if r["status"] == "done"]
+    failed = [r for r in results if r["status"] == "failed"]
+    processed_bytes = sum(r["size_bytes"] for r in done)
+    return {
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "interrupted": interrupted,
+        "options": {"workers": args.workers, "memory_per_worker_mb": args.memory_per_worker,
+                    "charts": args.charts, "force": args.force},
+        "wall_seconds": seconds,
+        "contents": {"done": len(done), "failed": len(failed)},
+        "sessions": sum(r["sessions"] for r in done),
+        "skipped_sessions": skipped,
+        "throughput": {
+            "files_per_second": len(done) / seconds if seconds else 0.0,
+            "mb_per_second": processed_bytes / 1e6 / seconds if seconds else 0.0,
+            "task_seconds": sum(r["seconds"] for r in done),
+            "max_peak_rss_mb": max((r["peak_rss"] or 0 for r in done), default=0) / (1024 * 1024),
+        },
+        "slowest": sorted(done, key=lambda r: r["seconds"], reverse=True)[:10],
+        "failures": failed,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Profile every stored file in parallel.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--memory-per-worker", type=int, default=None,
+                        help="resident memory budget per worker in MB (default: 80%% of RAM / workers, "
+                             "0: none; needs /proc, so Linux only)")
+    parser.add_argument("--charts", action="store_true", help="also render charts and chart data")
+    parser.add_argument("--force", action="store_true", help="recompute contents whose profile is current")
+    parser.add_argument("--fresh", action="store_true", help="ignore the checkpoint of an earlier run")
+    parser.add_argument("--retry-failed", action="store_true", help="retry contents that failed in an earlier run")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--report", default=None, help="report path (default: storage/batch_reports/batch-<time>.json)")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.memory_per_worker is None:
+        args.memory_per_worker = default_memory_budget(args.workers)
+
+    from app.database import engine, Base, run_migrations
+    Base.metadata.create_all(bind=engine)
+    run_migrations()
+
+    if args.fresh and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    checkpoint = read_checkpoint(args.checkpoint)
+    work, skipped = collect_work(args.force, args.charts, checkpoint, args.retry_failed)
+    print(f"{len(work)} files to profile, {sum(skipped.values())} sessions skipped {skipped}", flush=True)
+
+    start = time.perf_counter()
+    results, interrupted = [], False
+    os.makedirs(os.path.dirname(args.checkpoint) or ".", exist_ok=True)
+    with open(args.checkpoint, "a") as checkpoint_file:
+        try:
+            results = run_batch(work, args, checkpoint_file)
+        except KeyboardInterrupt:
+            interrupted = True
+            print("Interrupted; run again to continue from the checkpoint", file=sys.stderr)
+            results = list(read_checkpoint(args.checkpoint).values())
+            results = [r for r in results if r["content_hash"] not in checkpoint]
+    report = summarize(results, skipped, time.perf_counter() - start, args, interrupted)
+
+    report_path = args.report or os.path.join(REPORT_DIR, f"batch-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    throughput = report["throughput"]
+    print(f"{report['contents']['done']} profiled, {report['contents']['failed']} failed in "
+          f"{report['wall_seconds']:.1f}s ({throughput['files_per_second']:.2f} files/s, "
+          f"{throughput['mb_per_second']:.1f} MB/s). Report written to {report_path}")
+    if not interrupted and all(e["status"] == "done" for e in read_checkpoint(args.checkpoint).values()):
+        # Nothing is left over, so the next run starts over
+        if os.path.exists(args.checkpoint):
+            os.remove(args.checkpoint)
+    return 1 if report["failures"] or interrupted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Benchmark of the AI insight path (cache and request coalescing) against a stub model.
+
+Run from the project root:
+    python -m benchmarks.ai_cache --concurrency 20 --latency 0.2
+
+A stub client stands in for the Gemini SDK, so no API key or network is
+needed: it answers after --latency seconds and counts the calls it gets.
+With a cache in a scratch SQLite database, the benchmark times a cold
+insight, the same insight answered from the cache, and --concurrency
+identical requests for a new prompt made at once, which share a single
+upstream call, both plain and streamed. The exit status is 1 if a cached
+or coalesced request reached the stub anyway.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.services.ai_cache import AICache
+from app.services.ai_service import AIService
+
+
+class StubModels:
+    """The part of the SDK's client.aio.models that AIService calls."""
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def generate_content(self, model: str, contents: str):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(text=f"Insight from {model} for a {len(contents)}-character prompt")
+
+    async def generate_content_stream(self, model: str, contents: str):
+        self.calls += 1
+
+        async def chunks():
+            for word in f"Insight from {model} for a {len(contents)}-character prompt".split(" "):
+                await asyncio.sleep(self.latency / 10)
+                yield SimpleNamespace(text=word + " ")
+        return chunks()
+
+
+class StubClient:
+    def __init__(self, latency: float):
+        self.models = StubModels(latency)
+        self.aio = SimpleNamespace(models=self.models)
+
+
+def context(seed: int) -> dict:
+    """describe() output as the dashboard sends it; a different seed gives a different prompt."""
+    return {
+        "price": {"count": 1000, "mean": 12.5 + seed, "std": 3.1, "min": 0.5, "50%": 12.0, "max": 40.0},
+        "quantity": {"count": 990, "mean": 3.2, "std": 1.4, "min": 1, "50%": 3, "max": 12},
+    }
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - start
+
+
+async def collect(stream) -> str:
+    return "".join([chunk async for chunk in stream])
+
+
+async def run(cache: AICache, latency: float, concurrency: int) -> tuple[dict, list]:
+    client = StubClient(latency)
+    service = AIService(client=client, cache=cache)
+    results, failures = {}, []
+
+    text, results["cold_seconds"] = await timed(service.generate_insight(context(0), "stats"))
+    calls = client.models.calls
+    cached, results["cached_seconds"] = await timed(service.generate_insight(context(0), "stats"))
+    if client.models.calls != calls or cached != text:
+        failures.append("a repeated prompt was not answered from the cache")
+
+    calls = client.models.calls
+    answers, results["concurrent_seconds"] = await timed(asyncio.gather(
+        *(service.generate_insight(context(1), "stats") for _ in range(concurrency))
+    ))
+    results["concurrent_upstream_calls"] = client.models.calls - calls
+    if results["concurrent_upstream_calls"] != 1 or len(set(answers)) != 1:
+        failures.append(f"{concurrency} identical concurrent prompts made "
+                        f"{results['concurrent_upstream_calls']} upstream calls instead of 1")
+
+    calls = client.models.calls
+    answers, results["streamed_seconds"] = await timed(asyncio.gather(
+        *(collect(service.stream_insight(context(2), "stats")) for _ in range(concurrency))
+    ))
+    results["streamed_upstream_calls"] = client.models.calls - calls
+    if results["streamed_upstream_calls"] != 1 or len(set(answers)) != 1:
+        failures.append(f"{concurrency} identical concurrent streams made "
+                        f"{results['streamed_upstream_calls']} upstream calls instead of 1")
+    return results, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the AI cache and request coalescing with a stub model.")
+    parser.add_argument("--concurrency", type=int, default=20, help="identical requests made at once")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds the stub model takes per call")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench-ai-")
+    try:
+        engine = create_engine(f"sqlite:///{os.path.join(scratch, 'ai_cache.db')}")
+        Base.metadata.create_all(bind=engine)
+        cache = AICache(session_factory=sessionmaker(bind=engine))
+        results, failures = asyncio.run(run(cache, args.latency, args.concurrency))
+        engine.dispose()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print(f"  cold insight        {results['cold_seconds'] * 1000:9.1f} ms")
+    print(f"  cached insight      {results['cached_seconds'] * 1000:9.1f} ms")
+    print(f"  {args.concurrency} concurrent     {results['concurrent_seconds'] * 1000:9.1f} ms"
+          f"  ({results['concurrent_upstream_calls']} upstream calls)")
+    print(f"  {args.concurrency} streamed       {results['streamed_seconds'] * 1000:9.1f} ms"
+          f"  ({results['streamed_upstream_calls']} upstream calls)")
+    if failures:
+        print("Failures:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("Cache and coalescing OK.")
+
+
+if __name__ == "__main__":
+    main()
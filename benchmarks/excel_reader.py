@@ -0,0 +1,185 @@
+"""
+Check of the streaming .xlsx reader (app.services.excel) against pandas.
+
+Run from the project root:
+    python -m benchmarks.excel_reader --rows 50000
+
+Writes small workbooks with the cases a hand-written reader gets wrong:
+blank rows and columns left out of the XML, rich text and phonetic runs
+in the shared strings, and date, time and non-date number formats. Each
+one is read with excel.read_sheet, in chunks with excel.iter_sheet and
+with pd.read_excel (openpyxl) and the frames compared. Then a --rows sheet is read both ways for timing.
+The exit status is 1 if any frame differs.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import date, datetime, time as clock
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from app.services import excel
+
+RICH_TEXT = '<si><r><rPr><b/></rPr><t>Bold</t></r><r><t xml:space="preserve"> and plain</t></r></si>'
+PHONETIC = '<si><t>東京</t><rPh sb="0" eb="2"><t>トウキョウ</t></rPh><phoneticPr fontId="1"/></si>'
+
+
+def gaps(path: str):
+    """Blank rows between data rows, a blank column and a row with only its last cell."""
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["id", "name", None, "score"])
+    ws.append([1, "a", None, 0.5])
+    ws.append([])
+    ws.append([2, "b", None, 1.5])
+    ws.cell(row=8, column=4, value=9.0)
+    ws.cell(row=10, column=1, value=3)
+    wb.save(path)
+
+
+def rich_text(path: str):
+    """Shared strings with formatted runs and a phonetic guide. openpyxl writes strings inline, so by hand."""
+    main = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    rels = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    package = "http://schemas.openxmlformats.org/package/2006/relationships"
+    strings = ["<si><t>label</t></si>", "<si><t>city</t></si>", RICH_TEXT, PHONETIC,
+               "<si><t>plain</t></si>", "<si><t>Paris</t></si>"]
+    rows = "".join(
+        f'<row r="{r}"><c r="A{r}" t="s"><v>{a}</v></c><c r="B{r}" t="s"><v>{b}</v></c></row>'
+        for r, (a, b) in enumerate([(0, 1), (2, 3), (4, 5)], start=1)
+    )
+    parts = {
+        "[Content_Types].xml":
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '<Override PartName="/xl/sharedStrings.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+            '</Types>',
+        "_rels/.rels":
+            f'<Relationships xmlns="{package}"><Relationship Id="rId1" Target="xl/workbook.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            '</Relationships>',
+        "xl/workbook.xml":
+            f'<workbook xmlns="{main}" xmlns:r="{rels}"><sheets>'
+            '<sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        "xl/_rels/workbook.xml.rels":
+            f'<Relationships xmlns="{package}">'
+            f'<Relationship Id="rId1" Target="worksheets/sheet1.xml" Type="{rels}/worksheet"/>'
+            f'<Relationship Id="rId2" Target="sharedStrings.xml" Type="{rels}/sharedStrings"/>'
+            '</Relationships>',
+        "xl/worksheets/sheet1.xml": f'<worksheet xmlns="{main}"><sheetData>{rows}</sheetData></worksheet>',
+        "xl/sharedStrings.xml": f'<sst xmlns="{main}" count="{len(strings)}">{"".join(strings)}</sst>',
+    }
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, xml in parts.items():
+            archive.writestr(name, '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n' + xml)
+
+
+def dates(path: str):
+    """Built-in and custom date/time formats next to numbers that only look like dates."""
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["when", "day", "at", "share", "flag"])
+    rows = [
+        (datetime(2024, 1, 31, 12, 30), date(2023, 2, 1), clock(8, 15), 0.25, True),
+        (datetime(1999, 12, 31, 23, 59, 59), date(2000, 2, 29), clock(23, 0), 1.0, False),
+        (None, None, None, None, None),
+        (datetime(2024, 6, 1), date(2024, 6, 2), clock(0, 0, 1), 0.125, True),
+    ]
+    for row in rows:
+        ws.append(row)
+    for cell in ws["B"][1:]:
+        cell.number_format = "dd/mm/yyyy"
+    for cell in ws["D"][1:]:
+        cell.number_format = "0.0%"
+    wb.save(path)
+
+
+def large(path: str, rows: int):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "id": np.arange(rows),
+        "value": rng.normal(size=rows),
+        "category": rng.choice(["north", "south", "east", "west"], size=rows),
+        "when": pd.date_range("2024-01-01", periods=rows, freq="min"),
+    })
+    df.loc[df.sample(frac=0.05, random_state=0).index, "value"] = np.nan
+    df.to_excel(path, index=False)
+
+
+def differences(path: str) -> str:
+    """Why excel.read_sheet, excel.iter_sheet and pd.read_excel disagree on path, or None."""
+    expected = pd.read_excel(path, engine="openpyxl")
+    actual = excel.read_sheet(path)
+    for name in actual.columns:
+        # read_sheet keeps True/False with blanks as "boolean" where pandas makes them 1.0/0.0
+        if actual[name].dtype == "boolean" and name in expected.columns:
+            expected[name] = expected[name].astype("boolean")
+    # Streamed in blocks of two rows, as the streaming profiler reads it
+    chunks = list(excel.iter_sheet(path, chunk_rows=2))
+    streamed = pd.concat(chunks, ignore_index=True) if chunks else actual.iloc[:0]
+    try:
+        pd.testing.assert_frame_equal(actual.astype(object), expected.astype(object), check_dtype=False)
+        pd.testing.assert_frame_equal(streamed.astype(object), actual.astype(object), check_dtype=False)
+    except AssertionError as e:
+        return str(e)
+    return None
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time the streaming .xlsx reader against pandas.")
+    parser.add_argument("--rows", type=int, default=50_000, help="rows of the timed sheet")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench-excel-")
+    failures = []
+    try:
+        for case in (gaps, rich_text, dates):
+            path = os.path.join(scratch, f"{case.__name__}.xlsx")
+            case(path)
+            problem = differences(path)
+            print(f"  {case.__name__:<10} {'differs' if problem else 'same as pandas'}")
+            if problem:
+                failures.append(f"{case.__name__}: {problem}")
+
+        path = os.path.join(scratch, "large.xlsx")
+        large(path, args.rows)
+        problem = differences(path)
+        if problem:
+            failures.append(f"large: {problem}")
+        ours = _best_of(lambda: excel.read_sheet(path), args.repeat)
+        theirs = _best_of(lambda: pd.read_excel(path, engine="openpyxl"), args.repeat)
+        print(f"  {args.rows} rows   read_sheet {ours * 1000:9.1f} ms   "
+              f"pd.read_excel {theirs * 1000:9.1f} ms   speedup {theirs / ours:5.1f}x")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if failures:
+        print("Failures:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("Reader matches pandas.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark: recursive clean_for_json vs. the column-level encoders.
+
+Run from the project root:
+    python -m benchmarks.json_encoding
+"""
+import json
+import time
+import numpy as np
+import pandas as pd
+from app.utils_json import clean_for_json, frame_to_dict, frame_to_json, frame_to_records, dumps_json
+
+
+def _best_of(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def correlation_matrix(n: int = 1000) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(200, n))
+    data[rng.random(data.shape) < 0.01] = np.nan
+    return pd.DataFrame(data, columns=[f"c{i}" for i in range(n)]).corr()
+
+
+def row_preview(rows: int = 10_000) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "id": np.arange(rows),
+        "value": rng.normal(size=rows),
+        "category": rng.choice(["a", "b", "c", None], size=rows),
+        "when": pd.date_range("2024-01-01", periods=rows, freq="min"),
+        "flag": rng.random(rows) > 0.5,
+    })
+    df.loc[df.sample(frac=0.05, random_state=0).index, "value"] = np.nan
+    return df
+
+
+def run():
+    corr = correlation_matrix()
+    preview = row_preview()
+    cases = [
+        ("correlations 1000x1000",
+         lambda: json.dumps(clean_for_json(corr.to_dict())),
+         lambda: dumps_json(frame_to_dict(corr))),
+        ("correlations (C encoder)",
+         lambda: json.dumps(clean_for_json(corr.to_dict())),
+         lambda: frame_to_json(corr).encode("utf-8")),
+        ("preview 10k rows",
+         lambda: json.dumps(clean_for_json(preview.to_dict(orient="records"))),
+         lambda: dumps_json(frame_to_records(preview))),
+    ]
+    for name, old, new in cases:
+        old_time = _best_of(old)
+        new_time = _best_of(new)
+        print(f"{name:<26} clean_for_json {old_time * 1000:8.1f} ms   "
+              f"vectorized {new_time * 1000:8.1f} ms   speedup {old_time / new_time:5.1f}x")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,296 @@
+"""
+Benchmark of the load -> profile -> serialize pipeline and the API routes.
+
+Run from the project root:
+    python -m benchmarks.pipeline --rows 200000 --columns 30
+    python -m benchmarks.pipeline --baseline benchmarks/results/<earlier run>.json
+
+Each stage runs --repeat times on a synthetic dataset (see
+benchmarks.synthetic) and the best time is kept; one more run under
+tracemalloc records its peak Python-visible allocation. The API part
+uploads the same file to the FastAPI app in-process, in a scratch
+directory with its own database and storage, and times each route cold
+and warm. Results are written as JSON. Compared against a baseline run,
+stages slower by more than --tolerance are flagged and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from urllib.parse import quote
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows: peak memory of the whole run is not recorded
+    resource = None
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+from app.services.dataset import Dataset
+from app.services.profiler import Profiler
+from app.services import chart_data, csv_parallel
+from app.utils_json import clean_for_json, dumps_json
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+
+# A stage counts as a regression only if it is also slower by at least this much
+MIN_DELTA_SECONDS = 0.005
+MIN_DELTA_BYTES = 1024 * 1024
+
+
+class Context:
+    """State passed from stage to stage (the file, its bytes, the parsed frame, ...)."""
+    def __init__(self, path: str, scratch: str):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.scratch = scratch
+
+
+def _stage_read(ctx):
+    with open(ctx.path, "rb") as f:
+        ctx.content = f.read()
+
+def _stage_parse(ctx):
+    # Large CSVs are parsed from the path, range by range on every core, as the app does
+    source = ctx.path if csv_parallel.should_split(ctx.path) else ctx.content
+    ctx.df = Dataset(source, ctx.filename).get_dataframe()
+    ctx.profiler = Profiler(ctx.df)
+
+def _stage_describe(ctx):
+    ctx.profiler.get_description()
+
+def _stage_missing(ctx):
+    ctx.profiler.get_missing_values()
+
+def _stage_correlations(ctx):
+    # A fresh Profiler, so the heatmap column selection is not memoized across runs
+    Profiler(ctx.df).get_correlations_json()
+
+def _stage_chart_plan(ctx):
+    ctx.specs = Profiler(ctx.df).plan_visualizations()
+
+def _stage_chart_render(ctx):
+    for i, spec in enumerate(ctx.specs):
+        ctx.profiler.render_visualization(spec, os.path.join(ctx.scratch, f"chart-{i}.png"))
+
+def _stage_chart_data(ctx):
+    dumps_json({spec["name"]: chart_data.chart_data(ctx.df, spec) for spec in ctx.specs})
+
+def _stage_profile(ctx):
+    ctx.profile = ctx.profiler.get_profile()
+
+def _stage_clean_for_json(ctx):
+    json.dumps(clean_for_json(ctx.profile))
+
+def _stage_json_encode(ctx):
+    dumps_json(ctx.profile)
+
+def _stage_profile_json(ctx):
+    ctx.profiler.get_profile_json()
+
+
+# In order: later stages use what earlier ones left in the context
+STAGES = [
+    ("read", _stage_read),
+    ("parse", _stage_parse),
+    ("describe", _stage_describe),
+    ("missing_values", _stage_missing),
+    ("correlations", _stage_correlations),
+    ("chart_plan", _stage_chart_plan),
+    ("chart_render", _stage_chart_render),
+    ("chart_data", _stage_chart_data),
+    ("profile", _stage_profile),
+    ("clean_for_json", _stage_clean_for_json),
+    ("json_encode", _stage_json_encode),
+    ("profile_json", _stage_profile_json),
+]
+
+
+def run_stages(ctx: Context, repeat: int, memory: bool = True) -> dict:
+    results = {}
+    for name, stage in STAGES:
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            stage(ctx)
+            runs.append(time.perf_counter() - start)
+        peak = None
+        if memory:
+            tracemalloc.start()
+            stage(ctx)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        results[name] = {"seconds": min(runs), "mean": sum(runs) / len(runs), "runs": runs, "peak_bytes": peak}
+        print(f"  {name:<16} {min(runs) * 1000:10.1f} ms" + (f"  peak {peak / 2**20:8.1f} MB" if peak else ""))
+    return results
+
+
+def api_requests(session_id: str, first_column: str) -> list:
+    """(name, method, url) of the routes timed after the upload."""
+    base = f"/api/analysis/{session_id}"
+    return [
+        ("overview", "GET", f"{base}/overview"),
+        ("stats", "GET", f"{base}/stats"),
+        ("stats_sample", "GET", f"{base}/stats?sample=true"),
+        ("chart_data", "GET", f"{base}/chart-data"),
+        ("visualizations", "GET", f"{base}/visualizations"),
+        ("correlations", "GET", f"{base}/correlations"),
+        ("rows", "GET", f"{base}/rows?offset=1000&limit=100"),
+        ("column", "GET", f"{base}/columns/{quote(first_column, safe='')}"),
+        ("files_list", "GET", "/api/files/list"),
+    ]
+
+
+def run_api(path: str, workspace: str, repeat: int, first_column: str) -> dict:
+    """
+    Drives the app in-process from workspace, so the benchmark gets its own
+    app.db and storage/ and leaves the real ones alone.
+    """
+    cwd = os.getcwd()
+    os.chdir(workspace)
+    try:
+        # Imported here: app.main creates its directories, and on startup its tables, relative to the cwd
+        from fastapi.testclient import TestClient
+        from app.main import app
+
+        results = {}
+        with TestClient(app) as client:
+            start = time.perf_counter()
+            with open(path, "rb") as f:
+                response = client.post(
+                    "/api/upload", files={"file": (os.path.basename(path), f)}, data={"session_name": "benchmark"}
+                )
+            # TestClient returns once the background ingest tasks have run too
+            elapsed = time.perf_counter() - start
+            results["upload"] = {"status": response.status_code, "cold_seconds": elapsed, "seconds": elapsed, "runs": []}
+            print(f"  {'upload':<16} cold {elapsed * 1000:9.1f} ms  {response.status_code}")
+            response.raise_for_status()
+            session_id = response.json()["session_id"]
+
+            for name, method, url in api_requests(session_id, first_column):
+                runs = []
+                for _ in range(repeat + 1):
+                    start = time.perf_counter()
+                    response = client.request(method, url)
+                    runs.append(time.perf_counter() - start)
+                warm = runs[1:] or runs
+                results[name] = {"status": response.status_code, "cold_seconds": runs[0],
+                                 "seconds": min(warm), "runs": warm, "bytes": len(response.content)}
+                print(f"  {name:<16} cold {runs[0] * 1000:9.1f} ms  warm {min(warm) * 1000:9.1f} ms"
+                      f"  {response.status_code}  {len(response.content):>9,} B")
+        return results
+    finally:
+        os.chdir(cwd)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata() -> dict:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "csv_parse_workers": csv_parallel.CSV_PARSE_WORKERS,
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Lines describing each stage/route that got slower (or hungrier) than baseline by more than tolerance."""
+    regressions = []
+    if results["dataset"] != baseline.get("dataset"):
+        print("Warning: the baseline was run on a different dataset; timings are not comparable")
+    for section in ("stages", "api"):
+        for name, current in results.get(section, {}).items():
+            before = baseline.get(section, {}).get(name)
+            if not before:
+                continue
+            now, then = current["seconds"], before["seconds"]
+            change = now / then - 1 if then else 0.0
+            flagged = change > tolerance and now - then > MIN_DELTA_SECONDS
+            print(f"  {section}/{name:<16} {then * 1000:10.1f} -> {now * 1000:10.1f} ms  {change:+7.1%}"
+                  + ("  REGRESSION" if flagged else ""))
+            if flagged:
+                regressions.append(f"{section}/{name}: {then * 1000:.1f} -> {now * 1000:.1f} ms ({change:+.0%})")
+
+            peak_now, peak_then = current.get("peak_bytes"), before.get("peak_bytes")
+            if peak_now and peak_then and peak_now > peak_then * (1 + tolerance) and peak_now - peak_then > MIN_DELTA_BYTES:
+                regressions.append(f"{section}/{name}: peak memory {peak_then / 2**20:.1f} -> {peak_now / 2**20:.1f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the load -> profile -> serialize pipeline.")
+    synthetic.add_arguments(parser)
+    parser.add_argument("--format", choices=["csv", "tsv", "xlsx"], default="csv")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="results file (default: benchmarks/results/pipeline-<time>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging, 0.25 = 25%%")
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--skip-memory", action="store_true", help="skip the tracemalloc runs")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench-")
+    try:
+        dataset = {"rows": args.rows, "columns": args.columns, "mix": args.mix, "null_rate": args.null_rate,
+                   "cardinality": args.cardinality, "seed": args.seed, "format": args.format}
+        path = os.path.join(scratch, f"synthetic.{args.format}")
+        synthetic.write(synthetic.generate(args.rows, args.columns, args.mix, args.null_rate,
+                                           args.cardinality, args.seed), path)
+        print(f"Dataset: {args.rows:,} rows x {args.columns} columns, {os.path.getsize(path) / 2**20:.1f} MB {args.format}")
+
+        results = {"meta": metadata(), "dataset": dataset, "file_bytes": os.path.getsize(path)}
+        print("Stages:")
+        ctx = Context(path, scratch)
+        results["stages"] = run_stages(ctx, args.repeat, memory=not args.skip_memory)
+        if not args.skip_api:
+            print("API:")
+            workspace = os.path.join(scratch, "workspace")
+            os.makedirs(workspace)
+            results["api"] = run_api(path, workspace, args.repeat, str(ctx.df.columns[0]))
+        if resource is not None:
+            # ru_maxrss is in KB on Linux; workers count once they have exited
+            results["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            results["max_rss_children_bytes"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"pipeline-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.baseline}:")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
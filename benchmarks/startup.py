@@ -0,0 +1,147 @@
+"""
+Benchmark of the server's startup import cost, module by module.
+
+Run from the project root:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --baseline benchmarks/results/<earlier run>.json
+
+Each run imports the app (--target, default app.main) in a fresh
+interpreter under `python -X importtime` and the per-module self and
+cumulative times are kept as medians over --repeat runs. The report lists
+the slowest modules and which heavy dependencies were imported at all; the
+web process should load those on first use only. Results are written as
+JSON. Compared against a baseline run, a total import time slower by more
+than --tolerance, or a heavy module that is now imported at startup, is
+flagged and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+# Dependencies that should not be imported when the app starts
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "matplotlib", "seaborn", "openpyxl", "google.genai")
+# Differences below this are noise between interpreter starts
+MIN_DELTA_SECONDS = 0.05
+
+
+def import_times(target: str) -> dict:
+    """{module: (self_us, cumulative_us)} for one fresh import of target."""
+    # A scratch cwd, so importing the app does not touch the real app.db or storage/
+    with tempfile.TemporaryDirectory(prefix="bench-startup-") as scratch:
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_ROOT, os.getenv("PYTHONPATH")])))
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {target}"],
+                                 cwd=scratch, env=env, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {target} failed:\n{process.stderr[-2000:]}")
+    times = {}
+    for line in process.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def run(target: str, repeat: int) -> dict:
+    runs = [import_times(target) for _ in range(repeat)]
+    modules = {}
+    for name in set().union(*runs):
+        samples = [r[name] for r in runs if name in r]
+        modules[name] = {
+            "self_seconds": statistics.median(s for s, _ in samples) / 1e6,
+            "cumulative_seconds": statistics.median(c for _, c in samples) / 1e6,
+        }
+    return {
+        "target": target,
+        "total_seconds": modules[target]["cumulative_seconds"],
+        "modules": modules,
+        "heavy_modules": sorted(m for m in HEAVY_MODULES if m in modules),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata() -> dict:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def report(results: dict, top: int):
+    modules = results["modules"]
+    print(f"Importing {results['target']}: {results['total_seconds'] * 1000:.1f} ms, {len(modules)} modules")
+    print("Slowest modules (self time):")
+    for name in sorted(modules, key=lambda m: modules[m]["self_seconds"], reverse=True)[:top]:
+        print(f"  {name:<48} {modules[name]['self_seconds'] * 1000:8.1f} ms"
+              f"  cumulative {modules[name]['cumulative_seconds'] * 1000:8.1f} ms")
+    print("Heavy modules imported: " + (", ".join(results["heavy_modules"]) or "none"))
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Lines describing what got slower, or newly imported, compared with baseline."""
+    regressions = []
+    if results["target"] != baseline.get("target"):
+        print("Warning: the baseline imported a different target; timings are not comparable")
+    now, then = results["total_seconds"], baseline["total_seconds"]
+    change = now / then - 1 if then else 0.0
+    flagged = change > tolerance and now - then > MIN_DELTA_SECONDS
+    print(f"  total {then * 1000:10.1f} -> {now * 1000:10.1f} ms  {change:+7.1%}" + ("  REGRESSION" if flagged else ""))
+    if flagged:
+        regressions.append(f"total: {then * 1000:.1f} -> {now * 1000:.1f} ms ({change:+.0%})")
+    for name in sorted(set(results["heavy_modules"]) - set(baseline.get("heavy_modules", []))):
+        cumulative = results["modules"][name]["cumulative_seconds"]
+        regressions.append(f"{name} is now imported at startup ({cumulative * 1000:.1f} ms)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import cost of starting the app.")
+    parser.add_argument("--target", default="app.main", help="module to import")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20, help="slowest modules to list")
+    parser.add_argument("--out", help="results file (default: benchmarks/results/startup-<time>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    results = {"meta": metadata(), **run(args.target, args.repeat)}
+    report(results, args.top)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"startup-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.baseline}:")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Synthetic datasets for the benchmarks, reproducible from a seed.
+
+    python -m benchmarks.synthetic --rows 100000 --columns 40 --out /tmp/data.csv
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+# Default share of each kind of column
+DEFAULT_MIX = {"float": 0.4, "int": 0.2, "category": 0.2, "text": 0.1, "datetime": 0.05, "bool": 0.05}
+
+
+def parse_mix(text: str) -> dict:
+    """"float=0.5,category=0.5" -> {"float": 0.5, "category": 0.5}, normalised to sum to 1."""
+    mix = {}
+    for part in filter(None, text.split(",")):
+        kind, _, share = part.partition("=")
+        if kind not in DEFAULT_MIX:
+            raise ValueError(f"Unknown column kind {kind!r}; expected one of {', '.join(DEFAULT_MIX)}")
+        mix[kind] = float(share)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("Column mix must have a positive share")
+    return {kind: share / total for kind, share in mix.items()}
+
+
+def column_kinds(columns: int, mix: dict) -> list:
+    """Deterministic assignment of kinds to columns, as close to mix as the count allows."""
+    counts = {kind: int(share * columns) for kind, share in mix.items()}
+    # Hand out the rounding remainder to the largest fractional parts
+    remainder = sorted(mix, key=lambda kind: mix[kind] * columns - counts[kind], reverse=True)
+    for kind in remainder[:columns - sum(counts.values())]:
+        counts[kind] += 1
+    return [kind for kind in mix for _ in range(counts[kind])]
+
+
+def _column(kind: str, rows: int, cardinality: int, rng: np.random.Generator) -> pd.Series:
+    if kind == "float":
+        # Mix of scales and some skew, like real measurements
+        return pd.Series(rng.lognormal(mean=rng.uniform(0, 5), sigma=rng.uniform(0.2, 1.5), size=rows))
+    if kind == "int":
+        return pd.Series(rng.integers(0, rng.choice([10, 1000, 100_000]), size=rows))
+    if kind == "category":
+        labels = np.array([f"cat_{i}" for i in range(cardinality)])
+        weights = rng.zipf(1.5, size=cardinality).astype(float)
+        return pd.Series(rng.choice(labels, size=rows, p=weights / weights.sum()))
+    if kind == "text":
+        # Mostly unique strings (ids, free text)
+        return pd.Series([f"item-{v:x}" for v in rng.integers(0, 2**40, size=rows)])
+    if kind == "datetime":
+        start = np.datetime64("2020-01-01T00:00:00")
+        return pd.Series(start + rng.integers(0, 3 * 365 * 86400, size=rows).astype("timedelta64[s]"))
+    if kind == "bool":
+        return pd.Series(rng.random(rows) < rng.uniform(0.1, 0.9))
+    raise ValueError(f"Unknown column kind: {kind}")
+
+
+def generate(rows: int = 100_000, columns: int = 20, mix: dict = None, null_rate: float = 0.05,
+             cardinality: int = 50, seed: int = 0) -> pd.DataFrame:
+    """
+    A DataFrame of rows x columns with the given kind mix (see DEFAULT_MIX),
+    null_rate of each column missing at random, and categorical columns
+    drawing from cardinality distinct labels with a skewed frequency.
+    """
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i, kind in enumerate(column_kinds(columns, mix or DEFAULT_MIX)):
+        series = _column(kind, rows, cardinality, rng)
+        if null_rate > 0:
+            series = series.mask(rng.random(rows) < null_rate)
+        data[f"{kind}_{i}"] = series
+    return pd.DataFrame(data)
+
+
+def write(df: pd.DataFrame, path: str):
+    """Writes df in the format implied by path's extension (.csv, .tsv, .xlsx)."""
+    if path.endswith(".tsv"):
+        df.to_csv(path, sep="\t", index=False)
+    elif path.endswith(".xlsx"):
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--columns", type=int, default=20)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="column kinds and shares, e.g. float=0.6,category=0.3,text=0.1")
+    parser.add_argument("--null-rate", type=float, default=0.05)
+    parser.add_argument("--cardinality", type=int, default=50, help="distinct labels per categorical column")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--out", required=True, help="output file (.csv, .tsv or .xlsx)")
+    args = parser.parse_args()
+    df = generate(args.rows, args.columns, args.mix, args.null_rate, args.cardinality, args.seed)
+    write(df, args.out)
+    print(f"Wrote {len(df):,} rows x {df.shape[1]} columns to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
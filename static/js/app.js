@@ -39,11 +39,41 @@ async function loadDashboard(sessionId) {
     loadOverview(sessionId).catch(e => console.error("Overview error:", e));
     loadStats(sessionId).catch(e => console.error("Stats error:", e));
     loadVisualizations(sessionId).catch(e => console.error("Viz error:", e));
+    loadSheets(sessionId).catch(e => console.error("Sheets error:", e));
     
     // Save id
     window.currentSessionId = sessionId;
 }
 
+async function loadSheets(sessionId) {
+    // Workbooks with several sheets get a sheet picker; other files answer 400
+    const res = await fetch(`/api/files/${sessionId}/sheets`);
+    if (!res.ok) return;
+    const data = await res.json();
+    if (data.sheets.length < 2) return;
+
+    const select = document.getElementById('sheet-select');
+    select.innerHTML = data.sheets.map(s =>
+        `<option value="${s.name}" ${s.name === data.selected ? 'selected' : ''}>${s.name}</option>`
+    ).join('');
+    select.style.display = '';
+    select.onchange = async () => {
+        select.disabled = true;
+        const put = await fetch(`/api/files/${sessionId}/sheet`, {
+            method: 'PUT',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ sheet: select.value })
+        });
+        if (!put.ok) {
+            const err = await put.json().catch(() => ({}));
+            alert("Could not switch sheet: " + (err.detail || put.statusText));
+            select.disabled = false;
+            return;
+        }
+        window.location.reload();
+    };
+}
+
 async function loadOverview(sessionId) {
     try {
         console.log("Fetching overview for " + sessionId);
@@ -86,7 +116,18 @@ async function loadOverview(sessionId) {
 async function loadStats(sessionId) {
     try {
         console.log("Fetching stats for " + sessionId);
-        const res = await fetch(`${API_BASE}/${sessionId}/stats`);
+        let res = await fetch(`${API_BASE}/${sessionId}/stats`);
+        // 202 means the profile is still being computed in the background
+        if (res.status === 202) {
+            // Show estimates from a sample meanwhile; replaced once the exact profile is ready
+            document.getElementById('stats-container').innerHTML = 'Computing statistics...';
+            const preview = await fetch(`${API_BASE}/${sessionId}/stats?sample=true`);
+            if (preview.ok) renderStats(await preview.json());
+        }
+        while (res.status === 202) {
+            await waitForProfile(sessionId);
+            res = await fetch(`${API_BASE}/${sessionId}/stats`);
+        }
         console.log("Stats response status:", res.status);
         if (!res.ok) {
             let errorMsg = res.statusText;
@@ -100,31 +141,73 @@ async function loadStats(sessionId) {
         
         const data = await res.json();
         console.log("Stats data received");
-        window.statsData = data; 
-
-        // Missing Values
-        const missing = data.missing_values.count;
-        let missingHtml = '<ul>';
-        let hasMissing = false;
-        for (const [col, count] of Object.entries(missing)) {
-            if (count > 0) {
-                missingHtml += `<li><strong>${col}:</strong> ${count}</li>`;
-                hasMissing = true;
-            }
-        }
-        missingHtml += '</ul>';
-        document.getElementById('missing-container').innerHTML = hasMissing ? missingHtml : '<p>No missing values found!</p>';
-        
-        // Description Table
-        renderDescribeTable(data.description, 'stats-container');
+        renderStats(data);
     } catch (e) {
          document.getElementById('stats-container').innerHTML = `<p style="color:red">Error: ${e.message}</p>`;
          document.getElementById('missing-container').innerHTML = `<p style="color:red">Error loading missing info.</p>`;
     }
 }
 
+function renderStats(data) {
+    window.statsData = data; 
+
+    // Missing Values
+    const missing = data.missing_values.count;
+    let missingHtml = '<ul>';
+    let hasMissing = false;
+    for (const [col, count] of Object.entries(missing)) {
+        if (count > 0) {
+            missingHtml += `<li><strong>${col}:</strong> ${count}</li>`;
+            hasMissing = true;
+        }
+    }
+    missingHtml += '</ul>';
+    document.getElementById('missing-container').innerHTML = hasMissing ? missingHtml : '<p>No missing values found!</p>';
+    
+    // Description Table
+    renderDescribeTable(data.description, 'stats-container');
+
+    if (data.sample) {
+        const note = `<p><em>Estimated from a ${data.sample.method} sample of ${data.sample.size.toLocaleString()} `
+            + `of ${data.sample.population_rows.toLocaleString()} rows. Exact statistics are being computed...</em></p>`;
+        document.getElementById('stats-container').insertAdjacentHTML('afterbegin', note);
+        document.getElementById('missing-container').insertAdjacentHTML('afterbegin', note);
+    }
+}
+
+async function waitForProfile(sessionId) {
+    // Poll the profile job until it is no longer pending
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const res = await fetch(`${API_BASE}/${sessionId}/profile`);
+        if (!res.ok) return;
+        const data = await res.json();
+        if (data.status !== 'pending') return;
+    }
+}
+
 
 async function loadVisualizations(sessionId) {
+    // Chart data is a few KB per chart and drawn here; the server-rendered PNGs are the fallback
+    const res = await fetch(`${API_BASE}/${sessionId}/chart-data`);
+    if (!res.ok) {
+        console.error("Chart data load failed, falling back to images");
+        return loadChartImages(sessionId);
+    }
+    const data = await res.json();
+    const container = document.getElementById('viz-container');
+    container.innerHTML = '';
+    for (const [name, chart] of Object.entries(data)) {
+        let svg;
+        if (chart.type === 'hist') svg = drawHistogram(chart);
+        else if (chart.type === 'bar') svg = drawBarChart(chart);
+        else if (chart.type === 'heatmap') svg = drawHeatmap(chart);
+        else continue;
+        container.appendChild(vizCard(name, svg));
+    }
+}
+
+async function loadChartImages(sessionId) {
     const res = await fetch(`${API_BASE}/${sessionId}/visualizations`);
     if (!res.ok) {
         // Visualizations might fail if data is weird, still want to show other parts
@@ -134,46 +217,148 @@ async function loadVisualizations(sessionId) {
     }
     const data = await res.json();
     
-    // Viz data is name -> base64 string
-    // We want to link this back to column stats for AI.
-    // We assume the key "hist_ColumnName" or "bar_ColumnName" pattern
-    
+    // Viz data is name -> chart image URL
     const container = document.getElementById('viz-container');
     container.innerHTML = '';
-    
     for (const [name, src] of Object.entries(data)) {
-        const div = document.createElement('div');
-        div.className = 'card';
-        // Parse column name from key (e.g., hist_Age -> Age)
-        let cleanName = name;
-        let chartType = 'Chart';
-        let colName = '';
-
-        if(name.startsWith('hist_')) {
-            colName = name.replace('hist_', '');
-            cleanName = `Distribution of ${colName}`;
-            chartType = 'Histogram';
-        } else if (name.startsWith('bar_')) {
-            colName = name.replace('bar_', '');
-            cleanName = `Categories in ${colName}`;
-            chartType = 'Bar Chart';
-        } else if (name === 'correlation_heatmap') {
-            cleanName = 'Correlation Heatmap';
-            chartType = 'Heatmap';
-        }
+        container.appendChild(vizCard(name, `<img src="${src}" class="viz-img" alt="${name}">`));
+    }
+}
 
-        const aiId = `ai-viz-${name}`;
+function vizCard(name, body) {
+    // We want to link this back to column stats for AI.
+    // We assume the key "hist_ColumnName" or "bar_ColumnName" pattern
+    const div = document.createElement('div');
+    div.className = 'card';
+    // Parse column name from key (e.g., hist_Age -> Age)
+    let cleanName = name;
+    let chartType = 'Chart';
+    let colName = '';
 
-        div.innerHTML = `
-            <div class="card-title" style="font-size: 1rem; border: none; margin-bottom: 0.5rem; display:flex; justify-content:space-between;">
-                ${cleanName}
-                <button class="ai-btn" onclick="analyzeViz('${colName}', '${chartType}', '${aiId}')">✨</button>
-            </div>
-            <img src="${src}" class="viz-img" alt="${name}">
-            <div id="${aiId}" class="ai-summary-box"></div>
-        `;
-        container.appendChild(div);
+    if(name.startsWith('hist_')) {
+        colName = name.replace('hist_', '');
+        cleanName = `Distribution of ${colName}`;
+        chartType = 'Histogram';
+    } else if (name.startsWith('bar_')) {
+        colName = name.replace('bar_', '');
+        cleanName = `Categories in ${colName}`;
+        chartType = 'Bar Chart';
+    } else if (name === 'correlation_heatmap') {
+        cleanName = 'Correlation Heatmap';
+        chartType = 'Heatmap';
     }
+
+    const aiId = `ai-viz-${name}`;
+
+    div.innerHTML = `
+        <div class="card-title" style="font-size: 1rem; border: none; margin-bottom: 0.5rem; display:flex; justify-content:space-between;">
+            ${cleanName}
+            <button class="ai-btn" onclick="analyzeViz('${colName}', '${chartType}', '${aiId}')">✨</button>
+        </div>
+        ${body}
+        <div id="${aiId}" class="ai-summary-box"></div>
+    `;
+    return div;
+}
+
+// SVG charts drawn from /chart-data
+const CHART_W = 400, CHART_H = 260;
+
+function escapeHtml(text) {
+    return String(text).replace(/[&<>"']/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c]));
+}
+
+function formatTick(value) {
+    return Math.abs(value) >= 1e4 || (Math.abs(value) < 1e-2 && value !== 0)
+        ? value.toExponential(1) : +value.toFixed(2) + '';
+}
+
+function drawHistogram(chart) {
+    if (!chart.histogram) return '<p>No values to plot.</p>';
+    const { edges, counts } = chart.histogram;
+    const m = { left: 45, right: 10, top: 10, bottom: 50 };
+    const w = CHART_W - m.left - m.right, h = CHART_H - m.top - m.bottom;
+    const lo = edges[0], hi = edges[edges.length - 1];
+    const x = v => m.left + (hi > lo ? (v - lo) / (hi - lo) : 0.5) * w;
+
+    // The KDE is a density; scale it to counts per bin so it overlays the bars
+    const binWidth = (hi - lo) / counts.length || 1;
+    const curve = chart.kde ? chart.kde.x.map((v, i) => [v, chart.kde.density[i] * chart.count * binWidth])
+        .filter(([v]) => v >= lo && v <= hi) : [];
+    const yMax = Math.max(...counts, ...curve.map(p => p[1])) || 1;
+    const y = v => m.top + h - (v / yMax) * h;
+
+    let svg = `<svg viewBox="0 0 ${CHART_W} ${CHART_H}" width="100%" role="img">`;
+    counts.forEach((c, i) => {
+        const x0 = x(edges[i]), x1 = x(edges[i + 1]);
+        svg += `<rect x="${x0}" y="${y(c)}" width="${Math.max(x1 - x0 - 1, 0.5)}" height="${m.top + h - y(c)}" style="fill:var(--primary)" opacity="0.6">`
+            + `<title>${formatTick(edges[i])} – ${formatTick(edges[i + 1])}: ${c}</title></rect>`;
+    });
+    if (curve.length) {
+        svg += `<path d="${curve.map(([v, d], i) => `${i ? 'L' : 'M'}${x(v).toFixed(1)},${y(d).toFixed(1)}`).join('')}" fill="none" style="stroke:var(--primary-hover)" stroke-width="2"/>`;
+    }
+    // Box plot strip under the axis
+    const b = chart.box, by = m.top + h + 28;
+    svg += `<line x1="${x(b.whisker_low)}" x2="${x(b.whisker_high)}" y1="${by}" y2="${by}" stroke="#6b7280"/>`
+        + `<rect x="${x(b.q1)}" y="${by - 6}" width="${Math.max(x(b.q3) - x(b.q1), 1)}" height="12" fill="#fff" stroke="#6b7280">`
+        + `<title>Q1 ${formatTick(b.q1)}, median ${formatTick(b.median)}, Q3 ${formatTick(b.q3)}, ${b.outliers} outliers</title></rect>`
+        + `<line x1="${x(b.median)}" x2="${x(b.median)}" y1="${by - 6}" y2="${by + 6}" stroke="#1f2937" stroke-width="2"/>`;
+    // Axes
+    svg += `<line x1="${m.left}" x2="${m.left + w}" y1="${m.top + h}" y2="${m.top + h}" stroke="#9ca3af"/>`
+        + `<text x="${m.left}" y="${m.top + h + 14}" font-size="10" fill="#6b7280">${formatTick(lo)}</text>`
+        + `<text x="${m.left + w}" y="${m.top + h + 14}" font-size="10" fill="#6b7280" text-anchor="end">${formatTick(hi)}</text>`
+        + `<text x="${m.left - 4}" y="${m.top + 8}" font-size="10" fill="#6b7280" text-anchor="end">${yMax >= 10 ? Math.round(yMax) : formatTick(yMax)}</text>`
+        + `<text x="${m.left - 4}" y="${m.top + h}" font-size="10" fill="#6b7280" text-anchor="end">0</text>`;
+    return svg + '</svg>';
+}
+
+function drawBarChart(chart) {
+    const labels = chart.labels, counts = chart.counts;
+    if (!labels.length) return '<p>No values to plot.</p>';
+    const m = { left: 110, right: 45, top: 5, bottom: 5 };
+    const row = Math.min(24, (CHART_H - m.top - m.bottom) / labels.length);
+    const w = CHART_W - m.left - m.right, max = Math.max(...counts);
+    let svg = `<svg viewBox="0 0 ${CHART_W} ${m.top + row * labels.length + m.bottom}" width="100%" role="img">`;
+    labels.forEach((label, i) => {
+        const top = m.top + i * row, len = (counts[i] / max) * w;
+        const short = label.length > 16 ? label.slice(0, 15) + '…' : label;
+        svg += `<text x="${m.left - 6}" y="${top + row * 0.65}" font-size="11" text-anchor="end" fill="#1f2937">${escapeHtml(short)}</text>`
+            + `<rect x="${m.left}" y="${top + 2}" width="${Math.max(len, 1)}" height="${row - 4}" style="fill:var(--primary)" opacity="0.75">`
+            + `<title>${escapeHtml(label)}: ${counts[i]}</title></rect>`
+            + `<text x="${m.left + len + 4}" y="${top + row * 0.65}" font-size="10" fill="#6b7280">${counts[i].toLocaleString()}</text>`;
+    });
+    svg += '</svg>';
+    if (chart.other) svg += `<p style="color:var(--text-muted); font-size:0.8rem;">${chart.other.toLocaleString()} more in other categories</p>`;
+    return svg;
+}
+
+function correlationColor(r) {
+    // Diverging blue - grey - red, like the coolwarm colormap
+    if (r === null) return '#f3f4f6';
+    const [a, b] = r < 0 ? [[59, 76, 192], [221, 221, 221]] : [[221, 221, 221], [180, 4, 38]];
+    const t = r < 0 ? r + 1 : r;
+    return `rgb(${a.map((v, i) => Math.round(v + (b[i] - v) * t)).join(',')})`;
+}
+
+function drawHeatmap(chart) {
+    const n = chart.columns.length, label = 90;
+    const cell = (CHART_W - label) / n;
+    const annotate = n <= 12;
+    let svg = `<svg viewBox="0 0 ${CHART_W} ${CHART_W}" width="100%" role="img">`;
+    chart.columns.forEach((col, i) => {
+        const short = escapeHtml(col.length > 12 ? col.slice(0, 11) + '…' : col);
+        const mid = label + (i + 0.5) * cell;
+        svg += `<text x="${label - 4}" y="${mid + 3}" font-size="9" text-anchor="end" fill="#1f2937">${short}</text>`
+            + `<text x="${mid}" y="${label - 4}" font-size="9" fill="#1f2937" transform="rotate(-60 ${mid} ${label - 4})">${short}</text>`;
+        chart.matrix[i].forEach((r, j) => {
+            svg += `<rect x="${label + j * cell}" y="${label + i * cell}" width="${cell}" height="${cell}" fill="${correlationColor(r)}">`
+                + `<title>${escapeHtml(col)} ~ ${escapeHtml(chart.columns[j])}: ${r === null ? 'n/a' : r.toFixed(2)}</title></rect>`;
+            if (annotate && r !== null) {
+                svg += `<text x="${label + (j + 0.5) * cell}" y="${label + (i + 0.5) * cell + 3}" font-size="${Math.min(10, cell / 3)}" text-anchor="middle" fill="${Math.abs(r) > 0.6 ? '#fff' : '#1f2937'}">${r.toFixed(2)}</text>`;
+            }
+        });
+    });
+    return svg + '</svg>';
 }
 
 async function analyzeSection(type, containerId) {
@@ -249,8 +434,14 @@ async function analyzeViz(colName, chartType, containerId) {
 }
 
 async function callAI(payload, containerElement) {
+    // Let the AI know when the statistics it is given are sample estimates
+    if (window.statsData && window.statsData.sample) {
+        const { method, size, population_rows } = window.statsData.sample;
+        payload.sample = { method, size, population_rows };
+    }
     try {
-        const res = await fetch('/api/ai/summarize', {
+        // Streamed as server-sent events so the answer appears while it is written
+        const res = await fetch('/api/ai/summarize/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(payload)
@@ -258,15 +449,37 @@ async function callAI(payload, containerElement) {
         
         if (!res.ok) throw new Error((await res.json()).detail);
         
-        const data = await res.json();
-        containerElement.innerHTML = marked.parse(data.summary);
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let summary = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            // Events are separated by a blank line
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const raw of events) {
+                let event = 'message', data = '';
+                raw.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+                const parsed = data ? JSON.parse(data) : {};
+                if (event === 'error') throw new Error(parsed.detail);
+                if (event === 'message') {
+                    summary += parsed.text;
+                    containerElement.innerHTML = marked.parse(summary);
+                }
+            }
+        }
         
     } catch (e) {
         containerElement.innerHTML = `<span style="color:red">Error: ${e.message}</span>`;
     }
 }
 
-
 // Helpers
 function renderTable(dataArray, containerId) {
     if (!dataArray || dataArray.length === 0) {